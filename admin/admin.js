@@ -18,6 +18,14 @@ function checkAuth() {
 }
 
 function logout() {
+    const token = getToken();
+    if (token) {
+        fetch('/admin/api/logout', {
+            method: 'POST',
+            headers: { 'Authorization': `Bearer ${token}` },
+            keepalive: true
+        }).catch(() => {});
+    }
     sessionStorage.removeItem('adminToken');
     window.location.href = '/admin/login';
 }
@@ -279,8 +287,8 @@ async function processProduct(productId) {
             throw new Error('Failed to start processing');
         }
 
-        // Poll for status
-        pollProcessingStatus(productId);
+        // Follow status updates
+        followProcessingStatus(productId);
 
     } catch (error) {
         console.error('Processing error:', error);
@@ -363,18 +371,50 @@ function closeProcessingModal() {
     loadProducts(); // Refresh the product list
 }
 
-// Poll processing status
-async function pollProcessingStatus(productId) {
+// Follow processing status: pushed over a WebSocket on every change, falling
+// back to polling the REST endpoint if the socket closes before the job ends.
+// Resolves with the final (complete/error) status
+function watchProcessingStatus(productId, onStatus) {
+    const isFinished = (status) => status.stage === 'complete' || status.stage === 'error';
+
+    return new Promise((resolve) => {
+        let finished = false;
+        const handle = (status) => {
+            onStatus(status);
+            if (isFinished(status)) {
+                finished = true;
+                resolve(status);
+            }
+        };
+
+        const poll = async () => {
+            try {
+                const response = await apiCall(`/admin/api/products/${productId}/status`);
+                if (!response) return;
+                handle(await response.json());
+            } catch (error) {
+                console.error('Status poll error:', error);
+            }
+            if (!finished) setTimeout(poll, 2000);
+        };
+
+        const wsProtocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
+        const wsUrl = `${wsProtocol}//${window.location.host}/admin/api/products/${productId}/status/ws`;
+        const ws = new WebSocket(`${wsUrl}?token=${encodeURIComponent(getToken() || '')}`);
+        ws.onmessage = (event) => handle(JSON.parse(event.data));
+        ws.onclose = () => {
+            if (!finished) poll();
+        };
+    });
+}
+
+// Show processing status on the product card and in the processing modal
+function followProcessingStatus(productId) {
     const card = document.getElementById(`product-card-${productId}`);
     const statusSpan = card?.querySelector('.product-status');
     const processBtn = card?.querySelector('.process-btn');
 
-    try {
-        const response = await apiCall(`/admin/api/products/${productId}/status`);
-        if (!response) return;
-
-        const status = await response.json();
-
+    watchProcessingStatus(productId, (status) => {
         if (status.stage === 'complete') {
             if (statusSpan) {
                 statusSpan.textContent = 'Ready';
@@ -396,11 +436,13 @@ async function pollProcessingStatus(productId) {
             }
             showProcessingError(status.message || 'Processing failed');
         } else {
-            // Still processing, update progress and poll again
+            // Still processing, update progress
             const progress = status.progress || 0;
             let stageText = 'Processing...';
 
-            if (status.stage === 'analyzing') {
+            if (status.stage === 'queued') {
+                stageText = status.message || 'Waiting for a free processing slot...';
+            } else if (status.stage === 'analyzing') {
                 stageText = `Analyzing PDF pages... ${progress}%`;
             } else if (status.stage === 'generating') {
                 stageText = `Generating presentation... ${progress}%`;
@@ -413,11 +455,8 @@ async function pollProcessingStatus(productId) {
             if (statusSpan) {
                 statusSpan.textContent = `Processing... ${progress}%`;
             }
-            setTimeout(() => pollProcessingStatus(productId), 2000);
         }
-    } catch (error) {
-        console.error('Status poll error:', error);
-    }
+    });
 }
 
 function populateProductDropdowns() {
@@ -524,25 +563,19 @@ async function createProduct() {
                 throw new Error('Failed to upload PDF');
             }
 
-            // Poll for processing status
+            // Follow processing status
             statusText.textContent = 'Processing PDF...';
             progressFill.style.width = '50%';
 
-            let processing = true;
-            while (processing) {
-                await new Promise(resolve => setTimeout(resolve, 3000));
-                const statusResponse = await apiCall(`/admin/api/products/${productId}/status`);
-                const status = await statusResponse.json();
-
-                if (status.stage === 'complete') {
-                    processing = false;
-                    progressFill.style.width = '100%';
-                } else if (status.stage === 'error') {
-                    throw new Error(status.message || 'Processing failed');
-                } else {
+            const status = await watchProcessingStatus(productId, (status) => {
+                if (status.stage !== 'complete' && status.stage !== 'error') {
                     progressFill.style.width = `${50 + Math.min(status.progress || 0, 45)}%`;
                 }
+            });
+            if (status.stage === 'error') {
+                throw new Error(status.message || 'Processing failed');
             }
+            progressFill.style.width = '100%';
         }
 
         statusText.textContent = 'Product created successfully!';
@@ -964,9 +997,11 @@ async function uploadPDF(file) {
             const statusResponse = await apiCall('/admin/api/processing-status');
             const status = await statusResponse.json();
 
-            if (status.stage === 'analyzing') {
+            if (status.stage === 'analyzing' && status.total_pages) {
                 statusText.textContent = `Analyzing page ${status.current_page}/${status.total_pages}...`;
                 progressFill.style.width = `${40 + (status.current_page / status.total_pages) * 30}%`;
+            } else if (status.stage === 'queued') {
+                statusText.textContent = status.message;
             } else if (status.stage === 'generating') {
                 statusText.textContent = 'Generating presentation...';
                 progressFill.style.width = '80%';
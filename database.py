@@ -5,165 +5,318 @@ SQLite database for users, chat history, settings, and analytics
 
 import sqlite3
 import hashlib
+import hmac
 import secrets
 import json
-from datetime import datetime
+import atexit
+import queue
+import threading
+import time
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import Optional, List, Dict, Any
+from contextlib import contextmanager
+from typing import Optional, List, Dict, Any, Iterator
 
 DATABASE_PATH = Path("output/database.db")
 
+# Stored in PRAGMA user_version once init_database() has run; bump it whenever
+# tables, indexes or seed rows change so existing databases get migrated.
+SCHEMA_VERSION = 3
+
+# Applied to every new connection. page_size must come before journal_mode
+# so a freshly created database file is laid out with it (it is a no-op on
+# existing files and once WAL is active).
+CONNECTION_PRAGMAS = (
+    "PRAGMA page_size = 8192",
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA mmap_size = 268435456",
+    "PRAGMA cache_size = -20000",
+    "PRAGMA busy_timeout = 5000",
+)
+
+# Compiled statements kept per connection, keyed by SQL text, so repeated
+# calls skip the parse/prepare step.
+STATEMENT_CACHE_SIZE = 256
+
+# One connection per thread, reused across calls so SQLite keeps its page
+# cache warm instead of reopening the file for every query.
+_local = threading.local()
+_connections: List[sqlite3.Connection] = []
+_connections_lock = threading.Lock()
+
 def get_connection():
-    """Get database connection with row factory"""
-    DATABASE_PATH.parent.mkdir(parents=True, exist_ok=True)
-    conn = sqlite3.connect(str(DATABASE_PATH))
-    conn.row_factory = sqlite3.Row
+    """Get this thread's pooled database connection (row factory + tuned PRAGMAs)"""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(
+            str(DATABASE_PATH),
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE_SIZE,
+            isolation_level=None
+        )
+        conn.row_factory = sqlite3.Row
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        _local.conn = conn
+        with _connections_lock:
+            _connections.append(conn)
     return conn
 
+def close_connections():
+    """Close every pooled connection (registered with atexit)"""
+    with _connections_lock:
+        if _connections:
+            try:
+                _connections[0].execute("PRAGMA optimize")
+            except sqlite3.Error as e:
+                print(f"PRAGMA optimize failed: {e}")
+        while _connections:
+            _connections.pop().close()
+    _local.__dict__.pop("conn", None)
+
+atexit.register(close_connections)
+
+# Keeps planner statistics current as chat_history and analytics grow;
+# PRAGMA optimize only runs ANALYZE on tables that need it.
+OPTIMIZE_INTERVAL = 3600  # seconds
+
+def _optimizer():
+    """Background loop running PRAGMA optimize periodically"""
+    while True:
+        time.sleep(OPTIMIZE_INTERVAL)
+        try:
+            get_connection().execute("PRAGMA optimize")
+        except sqlite3.Error as e:
+            print(f"PRAGMA optimize failed: {e}")
+
+threading.Thread(target=_optimizer, name="db-optimizer", daemon=True).start()
+
+@contextmanager
+def transaction():
+    """Run a block in one explicit BEGIN/COMMIT on this thread's connection
+
+    Connections are in autocommit mode, so single statements commit on their
+    own; use this only to group several writes.
+    """
+    conn = get_connection()
+    conn.execute("BEGIN")
+    try:
+        yield conn
+        conn.execute("COMMIT")
+    except BaseException:
+        # Also after a failed COMMIT (e.g. SQLITE_BUSY), so the pooled
+        # connection never stays inside an open transaction
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+
+def _fetch_dicts(cursor) -> List[Dict]:
+    """Fetch remaining rows as dicts, resolving column names once per result
+
+    Plain tuples are fetched instead of sqlite3.Row objects, since every row
+    is turned into a dict anyway.
+    """
+    cursor.row_factory = None
+    columns = [col[0] for col in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+def _iter_dicts(cursor, batch_size: int = 100) -> Iterator[Dict]:
+    """Like _fetch_dicts, but yields rows in fetchmany batches"""
+    cursor.row_factory = None
+    columns = [col[0] for col in cursor.description]
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        for row in rows:
+            yield dict(zip(columns, row))
+
 def init_database():
     """Initialize database with all tables"""
+    # Runs once at import, before any connection is opened
+    DATABASE_PATH.parent.mkdir(parents=True, exist_ok=True)
     conn = get_connection()
-    cursor = conn.cursor()
 
-    # Admin users table
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS admins (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-
-    # Registered users (customers)
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            email TEXT UNIQUE NOT NULL,
-            phone TEXT,
-            registered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            last_active TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-
-    # Chat history
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS chat_history (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            role TEXT NOT NULL,
-            message TEXT NOT NULL,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
-        )
-    """)
-
-    # Global settings
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS settings (
-            key TEXT PRIMARY KEY,
-            value TEXT NOT NULL,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-
-    # Analytics events
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS analytics (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            event_type TEXT NOT NULL,
-            user_id INTEGER,
-            data TEXT,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-
-    # Image status (for soft delete)
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS image_status (
-            path TEXT PRIMARY KEY,
-            is_deleted INTEGER DEFAULT 0,
-            deleted_at TIMESTAMP
-        )
-    """)
-
-    # Products table
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS products (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            slug TEXT UNIQUE NOT NULL,
-            description TEXT,
-            status TEXT DEFAULT 'active',
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-
-    # Update chat_history to include product_id
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS chat_history_v2 (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            product_id INTEGER,
-            role TEXT NOT NULL,
-            message TEXT NOT NULL,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
-            FOREIGN KEY (product_id) REFERENCES products(id)
-        )
-    """)
-
-    # Create default admin if not exists
-    cursor.execute("SELECT COUNT(*) FROM admins")
-    if cursor.fetchone()[0] == 0:
-        password_hash = hash_password("admin123")
+    # Schema, indexes and seed rows are already in place
+    if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+        return
+
+    # Build everything in one transaction (one fsync instead of one per statement)
+    with transaction():
+        cursor = conn.cursor()
+
+        # Admin users table
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS admins (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT UNIQUE NOT NULL,
+                password_hash TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+
+        # Registered users (customers)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                email TEXT UNIQUE NOT NULL,
+                phone TEXT,
+                registered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                last_active TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+
+        # Chat history
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS chat_history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER,
+                role TEXT NOT NULL,
+                message TEXT NOT NULL,
+                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+            )
+        """)
+
+        # Global settings
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS settings (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+
+        # Analytics events
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS analytics (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                event_type TEXT NOT NULL,
+                user_id INTEGER,
+                data JSON,
+                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+
+        # Image status (for soft delete)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS image_status (
+                path TEXT PRIMARY KEY,
+                is_deleted INTEGER DEFAULT 0,
+                deleted_at TIMESTAMP
+            )
+        """)
+
+        # Products table
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS products (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                slug TEXT UNIQUE NOT NULL,
+                description TEXT,
+                status TEXT DEFAULT 'active',
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+
+        # Update chat_history to include product_id
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS chat_history_v2 (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER,
+                product_id INTEGER,
+                role TEXT NOT NULL,
+                message TEXT NOT NULL,
+                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+                FOREIGN KEY (product_id) REFERENCES products(id)
+            )
+        """)
+
+        # Indexes for the hot WHERE / ORDER BY columns
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_chat_user_ts ON chat_history(user_id, timestamp DESC)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_chat_ts ON chat_history(timestamp DESC)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_analytics_ts ON analytics(timestamp DESC)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_analytics_event ON analytics(event_type)")
         cursor.execute(
-            "INSERT INTO admins (username, password_hash) VALUES (?, ?)",
-            ("admin", password_hash)
+            """CREATE INDEX IF NOT EXISTS idx_analytics_product
+               ON analytics(json_extract(data, '$.product_id'))
+               WHERE event_type = 'chat_message'"""
         )
-
-    # Create default settings if not exists
-    default_settings = {
-        "tts_voice": "alloy",
-        "tts_enabled": "true",
-        "presentation_speed": "1",
-        "section_delay": "0.5"
-    }
-    for key, value in default_settings.items():
         cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_chat_v2_user_product_ts ON chat_history_v2(user_id, product_id, timestamp DESC)"
+        )
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_reg ON users(registered_at DESC)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_products_active ON products(name) WHERE status = 'active'")
+
+        # Create default admin if not exists
+        cursor.execute("SELECT COUNT(*) FROM admins")
+        if cursor.fetchone()[0] == 0:
+            password_hash = hash_password("admin123")
+            cursor.execute(
+                "INSERT INTO admins (username, password_hash) VALUES (?, ?)",
+                ("admin", password_hash)
+            )
+
+        # Create default settings if not exists
+        default_settings = {
+            "tts_voice": "asteria",
+            "tts_enabled": "true",
+            "presentation_speed": "1",
+            "section_delay": "0.5"
+        }
+        cursor.executemany(
             "INSERT OR IGNORE INTO settings (key, value) VALUES (?, ?)",
-            (key, value)
+            default_settings.items()
         )
 
-    # Create default "Mezzo Windows" product (ID 1) using existing output folder
-    cursor.execute("SELECT COUNT(*) FROM products WHERE id = 1")
-    if cursor.fetchone()[0] == 0:
-        cursor.execute(
-            """INSERT INTO products (id, name, slug, description, status)
-               VALUES (1, 'Mezzo Windows', 'mezzo-windows', 'Premium window solutions by Mezzo', 'active')"""
-        )
+        # Create default "Mezzo Windows" product (ID 1) using existing output folder
+        cursor.execute("SELECT COUNT(*) FROM products WHERE id = 1")
+        if cursor.fetchone()[0] == 0:
+            cursor.execute(
+                """INSERT INTO products (id, name, slug, description, status)
+                   VALUES (1, 'Mezzo Windows', 'mezzo-windows', 'Premium window solutions by Mezzo', 'active')"""
+            )
+
+        cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
 
-    conn.commit()
-    conn.close()
+    # Gather statistics for the indexes just created
+    conn.execute("PRAGMA optimize")
 
 # ============================================================================
 # Password Hashing
 # ============================================================================
+# scrypt cost parameters (~16 MB, tens of ms per hash; only run on login)
+SCRYPT_N = 2 ** 14
+SCRYPT_R = 8
+SCRYPT_P = 1
+
+def _scrypt_hex(password: str, salt: str) -> str:
+    return hashlib.scrypt(
+        password.encode(), salt=bytes.fromhex(salt),
+        n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P, dklen=32
+    ).hex()
+
 def hash_password(password: str) -> str:
-    """Hash password with salt"""
+    """Hash password with a random salt using scrypt"""
     salt = secrets.token_hex(16)
-    hash_obj = hashlib.sha256((password + salt).encode())
-    return f"{salt}:{hash_obj.hexdigest()}"
+    return f"scrypt${salt}${_scrypt_hex(password, salt)}"
 
 def verify_password(password: str, stored_hash: str) -> bool:
-    """Verify password against stored hash"""
+    """Verify password against stored hash (scrypt, or legacy salted SHA-256)"""
     try:
-        salt, hash_value = stored_hash.split(":")
-        hash_obj = hashlib.sha256((password + salt).encode())
-        return hash_obj.hexdigest() == hash_value
-    except:
+        if stored_hash.startswith("scrypt$"):
+            _, salt, hash_value = stored_hash.split("$", 2)
+            computed = _scrypt_hex(password, salt)
+        else:
+            salt, hash_value = stored_hash.split(":", 1)
+            computed = hashlib.sha256((password + salt).encode()).hexdigest()
+        return hmac.compare_digest(computed, hash_value)
+    except ValueError:
         return False
 
 # ============================================================================
@@ -175,9 +328,14 @@ def verify_admin(username: str, password: str) -> Optional[Dict]:
     cursor = conn.cursor()
     cursor.execute("SELECT * FROM admins WHERE username = ?", (username,))
     admin = cursor.fetchone()
-    conn.close()
 
     if admin and verify_password(password, admin["password_hash"]):
+        # Upgrade legacy SHA-256 hashes to scrypt on successful login
+        if not admin["password_hash"].startswith("scrypt$"):
+            cursor.execute(
+                "UPDATE admins SET password_hash = ? WHERE id = ?",
+                (hash_password(password), admin["id"])
+            )
         return {"id": admin["id"], "username": admin["username"]}
     return None
 
@@ -190,75 +348,104 @@ def create_admin_token(admin_id: int) -> str:
 def verify_admin_token(token: str) -> Optional[int]:
     """Verify admin token and return admin_id"""
     try:
-        admin_id, _ = token.split(":")
+        admin_id, _ = token.split(":", 1)
         return int(admin_id)
-    except:
+    except ValueError:
         return None
 
 # ============================================================================
 # User Functions
 # ============================================================================
 def create_user(name: str, email: str, phone: str) -> Optional[int]:
-    """Create a new user, return user ID"""
+    """Create a new user, return user ID (existing ID if the email is taken)"""
     conn = get_connection()
     cursor = conn.cursor()
-    try:
-        cursor.execute(
-            "INSERT INTO users (name, email, phone) VALUES (?, ?, ?)",
-            (name, email.lower(), phone)
-        )
-        conn.commit()
-        user_id = cursor.lastrowid
-
+    cursor.execute(
+        """INSERT INTO users (name, email, phone) VALUES (?, ?, ?)
+           ON CONFLICT(email) DO NOTHING
+           RETURNING id""",
+        (name, email.lower(), phone)
+    )
+    row = cursor.fetchone()
+    if row:
         # Log analytics event
-        log_analytics("user_registered", user_id)
+        log_analytics("user_registered", row["id"])
+        return row["id"]
 
-        return user_id
-    except sqlite3.IntegrityError:
-        # Email already exists, get existing user
-        cursor.execute("SELECT id FROM users WHERE email = ?", (email.lower(),))
-        row = cursor.fetchone()
-        return row["id"] if row else None
-    finally:
-        conn.close()
+    # Email already exists: reuse the ID and mark the returning visitor active
+    # through the activity batch, the only writer of last_active
+    cursor.execute("SELECT id FROM users WHERE email = ?", (email.lower(),))
+    row = cursor.fetchone()
+    if not row:
+        return None
+    update_user_activity(row["id"])
+    return row["id"]
 
 def get_user_by_email(email: str) -> Optional[Dict]:
     """Get user by email"""
+    flush_user_activity()
     conn = get_connection()
     cursor = conn.cursor()
     cursor.execute("SELECT * FROM users WHERE email = ?", (email.lower(),))
     user = cursor.fetchone()
-    conn.close()
     return dict(user) if user else None
 
 def get_user_by_id(user_id: int) -> Optional[Dict]:
     """Get user by ID"""
+    flush_user_activity()
     conn = get_connection()
     cursor = conn.cursor()
     cursor.execute("SELECT * FROM users WHERE id = ?", (user_id,))
     user = cursor.fetchone()
-    conn.close()
     return dict(user) if user else None
 
 def get_all_users() -> List[Dict]:
     """Get all users"""
+    flush_user_activity()
     conn = get_connection()
     cursor = conn.cursor()
     cursor.execute("SELECT * FROM users ORDER BY registered_at DESC")
-    users = [dict(row) for row in cursor.fetchall()]
-    conn.close()
+    users = _fetch_dicts(cursor)
     return users
 
+# last_active stamps are kept in memory and written in one batch every
+# USER_ACTIVITY_FLUSH_INTERVAL seconds instead of one UPDATE per request.
+USER_ACTIVITY_FLUSH_INTERVAL = 30
+
+_dirty_users: Dict[int, float] = {}
+_dirty_users_lock = threading.Lock()
+
 def update_user_activity(user_id: int):
-    """Update user's last active timestamp"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "UPDATE users SET last_active = CURRENT_TIMESTAMP WHERE id = ?",
-        (user_id,)
-    )
-    conn.commit()
-    conn.close()
+    """Mark user as active now; persisted by the next activity flush"""
+    with _dirty_users_lock:
+        _dirty_users[user_id] = time.time()
+
+def flush_user_activity():
+    """Write pending last_active timestamps in one transaction"""
+    with _dirty_users_lock:
+        if not _dirty_users:
+            return
+        pending = list(_dirty_users.items())
+        _dirty_users.clear()
+
+    rows = [
+        (datetime.fromtimestamp(ts, timezone.utc).strftime("%Y-%m-%d %H:%M:%S"), user_id)
+        for user_id, ts in pending
+    ]
+    with transaction() as conn:
+        conn.executemany("UPDATE users SET last_active = ? WHERE id = ?", rows)
+
+def _user_activity_writer():
+    """Background loop flushing last_active stamps periodically"""
+    while True:
+        time.sleep(USER_ACTIVITY_FLUSH_INTERVAL)
+        try:
+            flush_user_activity()
+        except sqlite3.Error as e:
+            print(f"User activity flush failed: {e}")
+
+threading.Thread(target=_user_activity_writer, name="user-activity-writer", daemon=True).start()
+atexit.register(flush_user_activity)
 
 def delete_user(user_id: int) -> bool:
     """Delete user and their chat history"""
@@ -266,26 +453,19 @@ def delete_user(user_id: int) -> bool:
     cursor = conn.cursor()
     cursor.execute("DELETE FROM users WHERE id = ?", (user_id,))
     affected = cursor.rowcount
-    conn.commit()
-    conn.close()
     return affected > 0
 
 # ============================================================================
 # Chat History Functions
 # ============================================================================
 def save_chat_message(user_id: int, role: str, message: str):
-    """Save a chat message"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT INTO chat_history (user_id, role, message) VALUES (?, ?, ?)",
-        (user_id, role, message)
-    )
-    conn.commit()
-    conn.close()
-
-    # Log analytics
-    log_analytics("chat_message", user_id, {"role": role})
+    """Save a chat message and its analytics event in one transaction"""
+    with transaction() as conn:
+        conn.execute(
+            "INSERT INTO chat_history (user_id, role, message) VALUES (?, ?, ?)",
+            (user_id, role, message)
+        )
+        log_analytics("chat_message", user_id, {"role": role}, cursor=conn)
 
 def get_user_chat_history(user_id: int, limit: int = 100) -> List[Dict]:
     """Get chat history for a user"""
@@ -298,12 +478,11 @@ def get_user_chat_history(user_id: int, limit: int = 100) -> List[Dict]:
            LIMIT ?""",
         (user_id, limit)
     )
-    messages = [dict(row) for row in cursor.fetchall()]
-    conn.close()
+    messages = _fetch_dicts(cursor)
     return list(reversed(messages))
 
-def get_all_chat_history(limit: int = 500) -> List[Dict]:
-    """Get all chat history with user info"""
+def get_all_chat_history(limit: int = 500) -> Iterator[Dict]:
+    """Stream all chat history with user info, newest first"""
     conn = get_connection()
     cursor = conn.cursor()
     cursor.execute(
@@ -314,30 +493,60 @@ def get_all_chat_history(limit: int = 500) -> List[Dict]:
            LIMIT ?""",
         (limit,)
     )
-    messages = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    return messages
+    yield from _iter_dicts(cursor)
 
 # ============================================================================
 # Settings Functions
 # ============================================================================
+# Settings and product lists are read on most page loads but only change through
+# the update/create/delete functions here, which invalidate them, so reads are
+# served from memory. Entries still expire after READ_CACHE_TTL seconds to bound
+# staleness if another process writes the database. Cached values are shared:
+# callers must not modify them.
+READ_CACHE_TTL = 60
+_read_cache: Dict[tuple, tuple] = {}
+# Bumped per kind on every invalidation; a load that started before one is
+# returned but not stored, so it can't put data older than the write back
+_read_generations: Dict[str, int] = {}
+_read_cache_lock = threading.Lock()
+
+def _cached_read(key: tuple, load):
+    """Return load() for key, reusing a result younger than READ_CACHE_TTL"""
+    now = time.monotonic()
+    with _read_cache_lock:
+        entry = _read_cache.get(key)
+        generation = _read_generations.get(key[0], 0)
+    if entry is not None and now - entry[0] < READ_CACHE_TTL:
+        return entry[1]
+    value = load()
+    with _read_cache_lock:
+        if _read_generations.get(key[0], 0) == generation:
+            _read_cache[key] = (now, value)
+    return value
+
+def _invalidate_reads(kind: str):
+    """Drop cached reads of one kind ("settings" or "products")"""
+    with _read_cache_lock:
+        _read_generations[kind] = _read_generations.get(kind, 0) + 1
+        for key in [key for key in _read_cache if key[0] == kind]:
+            del _read_cache[key]
+
 def get_setting(key: str) -> Optional[str]:
     """Get a setting value"""
     conn = get_connection()
     cursor = conn.cursor()
     cursor.execute("SELECT value FROM settings WHERE key = ?", (key,))
     row = cursor.fetchone()
-    conn.close()
     return row["value"] if row else None
 
 def get_all_settings() -> Dict[str, str]:
-    """Get all settings"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT key, value FROM settings")
-    settings = {row["key"]: row["value"] for row in cursor.fetchall()}
-    conn.close()
-    return settings
+    """Get all settings (cached, see READ_CACHE_TTL)"""
+    def load():
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT key, value FROM settings")
+        return {row["key"]: row["value"] for row in cursor.fetchall()}
+    return _cached_read(("settings",), load)
 
 def update_setting(key: str, value: str):
     """Update a setting"""
@@ -351,36 +560,43 @@ def update_setting(key: str, value: str):
            updated_at = CURRENT_TIMESTAMP""",
         (key, value)
     )
-    conn.commit()
-    conn.close()
+    _invalidate_reads("settings")
 
 def update_settings(settings: Dict[str, str]):
-    """Update multiple settings"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    for key, value in settings.items():
-        cursor.execute(
+    """Update multiple settings in a single transaction"""
+    with transaction() as conn:
+        conn.executemany(
             """INSERT INTO settings (key, value, updated_at)
                VALUES (?, ?, CURRENT_TIMESTAMP)
                ON CONFLICT(key) DO UPDATE SET
                value = excluded.value,
                updated_at = CURRENT_TIMESTAMP""",
-            (key, str(value))
+            [(key, str(value)) for key, value in settings.items()]
         )
-    conn.commit()
-    conn.close()
+    _invalidate_reads("settings")
 
 # ============================================================================
 # Image Status Functions
 # ============================================================================
+# Soft-deleted paths only change through delete_image / restore_image in this
+# process, so they are loaded once and kept in memory for the read path.
+_deleted_paths: Optional[set] = None
+_deleted_paths_lock = threading.Lock()
+
+def _get_deleted_paths() -> set:
+    """Load the set of soft deleted image paths on first use"""
+    global _deleted_paths
+    if _deleted_paths is None:
+        with _deleted_paths_lock:
+            if _deleted_paths is None:
+                conn = get_connection()
+                cursor = conn.execute("SELECT path FROM image_status WHERE is_deleted = 1")
+                _deleted_paths = {row[0] for row in cursor}
+    return _deleted_paths
+
 def is_image_deleted(path: str) -> bool:
     """Check if an image is soft deleted"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT is_deleted FROM image_status WHERE path = ?", (path,))
-    row = cursor.fetchone()
-    conn.close()
-    return row["is_deleted"] == 1 if row else False
+    return path in _get_deleted_paths()
 
 def delete_image(path: str):
     """Soft delete an image"""
@@ -394,8 +610,7 @@ def delete_image(path: str):
            deleted_at = CURRENT_TIMESTAMP""",
         (path,)
     )
-    conn.commit()
-    conn.close()
+    _get_deleted_paths().add(path)
 
 def restore_image(path: str):
     """Restore a soft deleted image"""
@@ -405,65 +620,122 @@ def restore_image(path: str):
         "UPDATE image_status SET is_deleted = 0, deleted_at = NULL WHERE path = ?",
         (path,)
     )
-    conn.commit()
-    conn.close()
+    _get_deleted_paths().discard(path)
 
 def get_all_image_statuses() -> Dict[str, bool]:
-    """Get deletion status for all images"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT path, is_deleted FROM image_status")
-    statuses = {row["path"]: row["is_deleted"] == 1 for row in cursor.fetchall()}
-    conn.close()
-    return statuses
+    """Get deletion status for all images (only deleted paths are listed)"""
+    return dict.fromkeys(_get_deleted_paths(), True)
 
 # ============================================================================
 # Analytics Functions
 # ============================================================================
-def log_analytics(event_type: str, user_id: int = None, data: Dict = None):
-    """Log an analytics event"""
+# Analytics rows are buffered in memory and written in batches by a background
+# thread, so callers on the request path never wait on an INSERT + commit.
+ANALYTICS_BATCH_SIZE = 500
+ANALYTICS_FLUSH_INTERVAL = 0.2  # seconds to coalesce events before writing
+
+_analytics_queue: "queue.Queue[tuple]" = queue.Queue()
+_analytics_pending = threading.Event()
+_analytics_lock = threading.Lock()
+_ANALYTICS_INSERT = "INSERT INTO analytics (event_type, user_id, data) VALUES (?, ?, json(?))"
+
+def log_analytics(event_type: str, user_id: int = None, data: Dict = None, cursor=None):
+    """Log an analytics event
+
+    With a cursor the row is inserted inside the caller's open transaction;
+    otherwise it is queued for the background writer.
+    """
+    row = (event_type, user_id, json.dumps(data) if data else None)
+    if cursor is not None:
+        cursor.execute(_ANALYTICS_INSERT, row)
+        return
+    _analytics_queue.put(row)
+    _analytics_pending.set()
+
+def _is_busy(error: sqlite3.Error) -> bool:
+    """Whether an error means the database was busy/locked (worth retrying later)"""
+    return getattr(error, "sqlite_errorname", "") in ("SQLITE_BUSY", "SQLITE_LOCKED") or "locked" in str(error)
+
+def _insert_analytics(rows: List[tuple]) -> List[tuple]:
+    """Insert rows in one transaction; return the rows to retry later
+
+    If the batch fails for a reason other than a busy database, a row must be
+    bad (e.g. invalid JSON), so the rows are inserted one by one and only the
+    ones that fail on their own are dropped.
+    """
+    try:
+        with transaction() as conn:
+            conn.executemany(_ANALYTICS_INSERT, rows)
+        return []
+    except sqlite3.Error as e:
+        if _is_busy(e):
+            return rows
     conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT INTO analytics (event_type, user_id, data) VALUES (?, ?, ?)",
-        (event_type, user_id, json.dumps(data) if data else None)
-    )
-    conn.commit()
-    conn.close()
+    for i, row in enumerate(rows):
+        try:
+            conn.execute(_ANALYTICS_INSERT, row)
+        except sqlite3.Error as e:
+            if _is_busy(e):
+                return rows[i:]
+            print(f"Dropping analytics event {row[0]!r}: {e}")
+    return []
+
+def flush_analytics():
+    """Write every queued analytics event, one transaction per batch
+
+    Never raises: rows the database is too busy to take go back on the queue
+    for the writer's next pass, so callers on the read path aren't affected.
+    """
+    with _analytics_lock:
+        while True:
+            rows = []
+            try:
+                while len(rows) < ANALYTICS_BATCH_SIZE:
+                    rows.append(_analytics_queue.get_nowait())
+            except queue.Empty:
+                pass
+            if not rows:
+                return
+            retry = _insert_analytics(rows)
+            if retry:
+                print(f"Analytics flush deferred: database busy ({len(retry)} events requeued)")
+                for row in retry:
+                    _analytics_queue.put(row)
+                _analytics_pending.set()
+                return
+
+def _analytics_writer():
+    """Background loop: wait for events, let a batch accumulate, flush it"""
+    while True:
+        _analytics_pending.wait()
+        time.sleep(ANALYTICS_FLUSH_INTERVAL)
+        _analytics_pending.clear()
+        flush_analytics()
+
+threading.Thread(target=_analytics_writer, name="analytics-writer", daemon=True).start()
+atexit.register(flush_analytics)
 
 def get_analytics_summary() -> Dict:
     """Get analytics summary for dashboard"""
+    flush_analytics()
     conn = get_connection()
     cursor = conn.cursor()
 
-    # Total users
-    cursor.execute("SELECT COUNT(*) as count FROM users")
-    total_users = cursor.fetchone()["count"]
-
-    # Total chat messages
-    cursor.execute("SELECT COUNT(*) as count FROM chat_history")
-    total_chats = cursor.fetchone()["count"]
-
-    # Users today
+    # Scalar counters in a single statement
     cursor.execute(
-        """SELECT COUNT(*) as count FROM users
-           WHERE DATE(registered_at) = DATE('now')"""
+        """SELECT
+             (SELECT COUNT(*) FROM users) as total_users,
+             (SELECT COUNT(*) FROM chat_history) as total_chats,
+             (SELECT COUNT(*) FROM users
+               WHERE registered_at >= DATE('now')
+                 AND registered_at < DATE('now', '+1 day')) as users_today,
+             (SELECT COUNT(*) FROM chat_history
+               WHERE timestamp >= DATE('now')
+                 AND timestamp < DATE('now', '+1 day')) as chats_today,
+             (SELECT COUNT(*) FROM analytics
+               WHERE event_type = 'presentation_start') as presentation_starts"""
     )
-    users_today = cursor.fetchone()["count"]
-
-    # Chats today
-    cursor.execute(
-        """SELECT COUNT(*) as count FROM chat_history
-           WHERE DATE(timestamp) = DATE('now')"""
-    )
-    chats_today = cursor.fetchone()["count"]
-
-    # Presentation starts
-    cursor.execute(
-        """SELECT COUNT(*) as count FROM analytics
-           WHERE event_type = 'presentation_start'"""
-    )
-    presentation_starts = cursor.fetchone()["count"]
+    counts = cursor.fetchone()
 
     # Recent activity (last 7 days)
     cursor.execute(
@@ -473,7 +745,7 @@ def get_analytics_summary() -> Dict:
            GROUP BY DATE(timestamp)
            ORDER BY date"""
     )
-    daily_activity = [dict(row) for row in cursor.fetchall()]
+    daily_activity = _fetch_dicts(cursor)
 
     # User growth (last 7 days)
     cursor.execute(
@@ -483,34 +755,46 @@ def get_analytics_summary() -> Dict:
            GROUP BY DATE(registered_at)
            ORDER BY date"""
     )
-    user_growth = [dict(row) for row in cursor.fetchall()]
+    user_growth = _fetch_dicts(cursor)
 
-    conn.close()
+    # Chat messages per product; the WHERE clause matches idx_analytics_product's,
+    # so with statistics (PRAGMA optimize) the planner reads that partial index in
+    # GROUP BY order. Not forced with INDEXED BY: a database without the index
+    # must still answer
+    cursor.execute(
+        """SELECT json_extract(data, '$.product_id') as product_id, COUNT(*) as count
+           FROM analytics
+           WHERE event_type = 'chat_message'
+             AND json_extract(data, '$.product_id') IS NOT NULL
+           GROUP BY json_extract(data, '$.product_id')"""
+    )
+    chats_by_product = _fetch_dicts(cursor)
 
     return {
-        "total_users": total_users,
-        "total_chats": total_chats,
-        "users_today": users_today,
-        "chats_today": chats_today,
-        "presentation_starts": presentation_starts,
+        "total_users": counts["total_users"],
+        "total_chats": counts["total_chats"],
+        "users_today": counts["users_today"],
+        "chats_today": counts["chats_today"],
+        "presentation_starts": counts["presentation_starts"],
         "daily_activity": daily_activity,
-        "user_growth": user_growth
+        "user_growth": user_growth,
+        "chats_by_product": chats_by_product
     }
 
 def get_recent_activity(limit: int = 20) -> List[Dict]:
     """Get recent analytics events"""
+    flush_analytics()
     conn = get_connection()
     cursor = conn.cursor()
     cursor.execute(
-        """SELECT a.*, u.name as user_name
+        """SELECT a.*, json_extract(a.data, '$.product_id') as product_id, u.name as user_name
            FROM analytics a
            LEFT JOIN users u ON a.user_id = u.id
            ORDER BY a.timestamp DESC
            LIMIT ?""",
         (limit,)
     )
-    events = [dict(row) for row in cursor.fetchall()]
-    conn.close()
+    events = _fetch_dicts(cursor)
     return events
 
 # ============================================================================
@@ -526,14 +810,12 @@ def create_product(name: str, slug: str, description: str = "") -> Optional[int]
                VALUES (?, ?, ?)""",
             (name, slug, description)
         )
-        conn.commit()
         product_id = cursor.lastrowid
+        _invalidate_reads("products")
         return product_id
     except sqlite3.IntegrityError:
         # Slug already exists
         return None
-    finally:
-        conn.close()
 
 def get_product_by_id(product_id: int) -> Optional[Dict]:
     """Get product by ID"""
@@ -541,7 +823,6 @@ def get_product_by_id(product_id: int) -> Optional[Dict]:
     cursor = conn.cursor()
     cursor.execute("SELECT * FROM products WHERE id = ?", (product_id,))
     product = cursor.fetchone()
-    conn.close()
     return dict(product) if product else None
 
 def get_product_by_slug(slug: str) -> Optional[Dict]:
@@ -550,52 +831,38 @@ def get_product_by_slug(slug: str) -> Optional[Dict]:
     cursor = conn.cursor()
     cursor.execute("SELECT * FROM products WHERE slug = ?", (slug,))
     product = cursor.fetchone()
-    conn.close()
     return dict(product) if product else None
 
 def get_all_products(include_inactive: bool = False) -> List[Dict]:
-    """Get all products"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    if include_inactive:
-        cursor.execute("SELECT * FROM products ORDER BY name")
-    else:
-        cursor.execute("SELECT * FROM products WHERE status = 'active' ORDER BY name")
-    products = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    return products
+    """Get all products (cached, see READ_CACHE_TTL)"""
+    def load():
+        conn = get_connection()
+        cursor = conn.cursor()
+        if include_inactive:
+            cursor.execute("SELECT * FROM products ORDER BY name")
+        else:
+            cursor.execute("SELECT * FROM products WHERE status = 'active' ORDER BY name")
+        return _fetch_dicts(cursor)
+    return _cached_read(("products", include_inactive), load)
 
 def update_product(product_id: int, name: str = None, description: str = None, status: str = None) -> bool:
-    """Update product details"""
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    updates = []
-    values = []
-
-    if name is not None:
-        updates.append("name = ?")
-        values.append(name)
-    if description is not None:
-        updates.append("description = ?")
-        values.append(description)
-    if status is not None:
-        updates.append("status = ?")
-        values.append(status)
-
-    if not updates:
+    """Update product details (None leaves a field unchanged)"""
+    if name is None and description is None and status is None:
         return False
 
-    updates.append("updated_at = CURRENT_TIMESTAMP")
-    values.append(product_id)
-
+    conn = get_connection()
+    cursor = conn.cursor()
     cursor.execute(
-        f"UPDATE products SET {', '.join(updates)} WHERE id = ?",
-        values
+        """UPDATE products SET
+           name = COALESCE(?, name),
+           description = COALESCE(?, description),
+           status = COALESCE(?, status),
+           updated_at = CURRENT_TIMESTAMP
+           WHERE id = ?""",
+        (name, description, status, product_id)
     )
-    conn.commit()
     affected = cursor.rowcount
-    conn.close()
+    _invalidate_reads("products")
     return affected > 0
 
 def delete_product(product_id: int) -> bool:
@@ -604,8 +871,7 @@ def delete_product(product_id: int) -> bool:
     cursor = conn.cursor()
     cursor.execute("DELETE FROM products WHERE id = ?", (product_id,))
     affected = cursor.rowcount
-    conn.commit()
-    conn.close()
+    _invalidate_reads("products")
     return affected > 0
 
 def get_product_folder(product_id: int) -> Path:
@@ -631,15 +897,12 @@ def ensure_product_folder(product_id: int) -> Path:
 # ============================================================================
 def save_chat_message_v2(user_id: int, product_id: int, role: str, message: str):
     """Save a chat message with product context"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT INTO chat_history_v2 (user_id, product_id, role, message) VALUES (?, ?, ?, ?)",
-        (user_id, product_id, role, message)
-    )
-    conn.commit()
-    conn.close()
-    log_analytics("chat_message", user_id, {"role": role, "product_id": product_id})
+    with transaction() as conn:
+        conn.execute(
+            "INSERT INTO chat_history_v2 (user_id, product_id, role, message) VALUES (?, ?, ?, ?)",
+            (user_id, product_id, role, message)
+        )
+        log_analytics("chat_message", user_id, {"role": role, "product_id": product_id}, cursor=conn)
 
 def get_user_chat_history_v2(user_id: int, product_id: int = None, limit: int = 100) -> List[Dict]:
     """Get chat history for a user, optionally filtered by product"""
@@ -665,8 +928,7 @@ def get_user_chat_history_v2(user_id: int, product_id: int = None, limit: int =
                LIMIT ?""",
             (user_id, limit)
         )
-    messages = [dict(row) for row in cursor.fetchall()]
-    conn.close()
+    messages = _fetch_dicts(cursor)
     return list(reversed(messages))
 
 # Initialize database on import
@@ -35,7 +35,7 @@ const AppState = {
     availableProducts: [],
     // TTS Pre-generation
     sectionData: [],           // All section content for pre-generation
-    ttsCache: new Map(),       // Cache: sectionIndex -> { audio: base64, generating: boolean }
+    ttsCache: new Map(),       // Cache: sectionIndex -> { audio: Blob (mp3), generating: boolean }
     pregenAhead: 0,            // Disabled - generate one-by-one (voice/speed can change anytime)
     // Chat TTS (separate from presentation)
     chatTtsEnabled: true,      // Mute/unmute chat voice
@@ -674,14 +674,18 @@ function togglePlayPause() {
     }
 }
 
+const wsTextDecoder = new TextDecoder();
+
 async function startPresentation() {
     if (AppState.ws) {
         AppState.ws.close();
     }
 
     const wsProtocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
-    const wsUrl = `${wsProtocol}//${window.location.host}/ws/presentation`;
+    // Binary frames carry the JSON as raw UTF-8 (no text frame validation/conversion)
+    const wsUrl = `${wsProtocol}//${window.location.host}/ws/presentation?frames=binary`;
     AppState.ws = new WebSocket(wsUrl);
+    AppState.ws.binaryType = 'arraybuffer';
 
     AppState.ws.onopen = () => {
         AppState.isPlaying = true;
@@ -694,8 +698,8 @@ async function startPresentation() {
     };
 
     AppState.ws.onmessage = (event) => {
-        const data = JSON.parse(event.data);
-        handleWebSocketMessage(data);
+        const text = typeof event.data === 'string' ? event.data : wsTextDecoder.decode(event.data);
+        handleWebSocketMessage(JSON.parse(text));
     };
 
     AppState.ws.onclose = () => {
@@ -970,10 +974,10 @@ function preGenerateTTS(sectionIndex) {
             voice: AppState.ttsVoice
         })
     })
-    .then(response => response.json())
-    .then(data => {
-        if (data.audio) {
-            AppState.ttsCache.set(sectionIndex, { audio: data.audio, generating: false });
+    .then(response => response.ok ? response.blob() : null)
+    .then(audio => {
+        if (audio && audio.size) {
+            AppState.ttsCache.set(sectionIndex, { audio, generating: false });
             console.log(`[TTS] Section ${sectionIndex} cached ✓`);
         } else {
             AppState.ttsCache.delete(sectionIndex);
@@ -1037,10 +1041,10 @@ async function fetchTTS(content, sectionIndex) {
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({ text: content, voice: AppState.ttsVoice })
         });
-        const data = await response.json();
-        if (data.audio) {
-            AppState.ttsCache.set(sectionIndex, { audio: data.audio, generating: false });
-            return data.audio;
+        const audio = response.ok ? await response.blob() : null;
+        if (audio && audio.size) {
+            AppState.ttsCache.set(sectionIndex, { audio, generating: false });
+            return audio;
         }
     } catch (error) {
         console.error('[TTS] Fetch failed:', error);
@@ -1111,8 +1115,8 @@ async function fetchTTSDirect(content) {
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({ text: content, voice: AppState.ttsVoice })
         });
-        const data = await response.json();
-        return data.audio || null;
+        const audio = response.ok ? await response.blob() : null;
+        return audio && audio.size ? audio : null;
     } catch (error) {
         console.error('[TTS] Direct fetch failed:', error);
         return null;
@@ -1147,7 +1151,7 @@ function preloadImagesForSections(startSection, endSection) {
     console.log(`[Images] Preloading sections ${startSection}-${endSection - 1}`);
 }
 
-function playAudioWithTextSync(base64Audio) {
+function playAudioWithTextSync(audioBlob) {
     // Don't play if presentation is paused OR chat is active OR chat audio is playing
     if (AppState.isPaused || AppState.isChatActive || AppState.isChatAudioPlaying) {
         console.log('[Presentation] BLOCKED - paused:', AppState.isPaused,
@@ -1156,7 +1160,6 @@ function playAudioWithTextSync(base64Audio) {
         return;
     }
 
-    const audioBlob = base64ToBlob(base64Audio, 'audio/mp3');
     const audioUrl = URL.createObjectURL(audioBlob);
 
     elements.audioPlayer.src = audioUrl;
@@ -1638,16 +1641,6 @@ function stopAudio() {
     console.log('[Audio] Presentation audio stopped and cleared');
 }
 
-function base64ToBlob(base64, mimeType) {
-    const byteCharacters = atob(base64);
-    const byteNumbers = new Array(byteCharacters.length);
-    for (let i = 0; i < byteCharacters.length; i++) {
-        byteNumbers[i] = byteCharacters.charCodeAt(i);
-    }
-    const byteArray = new Uint8Array(byteNumbers);
-    return new Blob([byteArray], { type: mimeType });
-}
-
 function delay(ms) {
     return new Promise(resolve => setTimeout(resolve, ms));
 }
@@ -1916,10 +1909,9 @@ async function speakChatResponse(text, messageElement = null) {
             body: JSON.stringify({ text, voice: AppState.ttsVoice })
         });
 
-        const data = await response.json();
+        const audioBlob = response.ok ? await response.blob() : null;
 
-        if (data.audio) {
-            const audioBlob = base64ToBlob(data.audio, 'audio/mp3');
+        if (audioBlob && audioBlob.size) {
             const audioUrl = URL.createObjectURL(audioBlob);
 
             // Use separate chat audio player
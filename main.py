@@ -18,8 +18,11 @@ from pdf_analyzer import PDFAnalyzer
 from presentation_generator import PresentationGenerator
 
 
-def run_pipeline(pdf_path: str, output_dir: str = "output"):
-    """Run complete pipeline"""
+def run_pipeline(pdf_path: str, output_dir: str = "output", progress=None):
+    """Run complete pipeline
+
+    progress, if given, is called as progress(stage, percent, message) as each step starts
+    """
 
     print("=" * 60)
     print("PDF TO PRESENTATION PIPELINE")
@@ -30,6 +33,8 @@ def run_pipeline(pdf_path: str, output_dir: str = "output"):
     os.makedirs(output_dir, exist_ok=True)
 
     # Step 1: Analyze PDF with Qwen VL
+    if progress:
+        progress("analyzing", 0, "Analyzing PDF pages...")
     print("\n" + "=" * 60)
     print("STEP 1: PDF Analysis (Qwen VL + OpenCV)")
     print("=" * 60)
@@ -40,6 +45,8 @@ def run_pipeline(pdf_path: str, output_dir: str = "output"):
     analysis_path = os.path.join(output_dir, "analysis_results.json")
 
     # Step 2: Generate Presentation
+    if progress:
+        progress("generating", 50, "Generating presentation...")
     print("\n" + "=" * 60)
     print("STEP 2: Presentation Generation (Groq LLama)")
     print("=" * 60)
@@ -9,22 +9,186 @@ Approach:
 
 import fitz  # PyMuPDF
 import cv2
+import httpx
 import numpy as np
 import base64
+import hashlib
 import json
 import os
-import io
-from PIL import Image
-from openai import OpenAI
+import tempfile
+import threading
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from openai import OpenAI, BadRequestError, DefaultHttpxClient
 from typing import List, Dict, Optional
 from dotenv import load_dotenv
 
+try:
+    from numba import njit  # optional: JIT for block clustering
+except ImportError:
+    njit = None
+
+try:
+    import fcntl
+except ImportError:  # Windows: concurrent cache saves are not serialized
+    fcntl = None
+
 load_dotenv(override=True)
 
 # Image optimization settings
 MAX_IMAGE_WIDTH = 1400  # Max width in pixels
 WEBP_QUALITY = 90       # WebP quality (0-100)
 
+# Pages are analyzed (VLM, block detection) at a low resolution; only the
+# extracted regions are re-rendered at high resolution
+ANALYSIS_DPI = 100
+EXTRACT_DPI = 300  # upper bound; regions render no wider than MAX_IMAGE_WIDTH
+REFERENCE_DPI = 150  # pixel thresholds and the saved actual_bbox use this scale
+DETECTION_MAX_DIM = 600  # OpenCV block detection runs on a page downscaled to this
+
+# CUDA edge detection is used when OpenCV is built with CUDA and a GPU is present.
+# Checked lazily: initializing CUDA before the process pool forks breaks workers.
+_cuda_enabled: Optional[bool] = None
+_cuda_filters: Dict[int, tuple] = {}
+
+# Pages are processed in parallel; rendering/OpenCV are CPU bound, VLM calls I/O bound
+MAX_WORKERS = min(os.cpu_count() or 1, 4)
+
+# PyMuPDF is not thread-safe, so rendering is serialized when pages run on threads
+_fitz_lock = threading.Lock()
+
+# Pages sent to the VLM in one request (and concurrent requests in flight)
+VLM_BATCH_SIZE = 10
+VLM_CONCURRENCY = 4
+VLM_MAX_TOKENS_PER_PAGE = 900  # answers are schema-constrained JSON
+
+# One pooled HTTP client per analyzer keeps connections to OpenRouter alive
+# across pages instead of paying a TCP/TLS handshake per request
+VLM_HTTP_LIMITS = httpx.Limits(max_keepalive_connections=20, max_connections=40)
+VLM_HTTP_TIMEOUT = httpx.Timeout(300.0, connect=10.0)  # batched answers take a while
+VLM_HEADERS = {
+    "HTTP-Referer": "https://pdf-analyzer.local",
+    "X-Title": "PDF Analyzer"
+}
+
+# Page images go to the VLM as WebP, encoded once per page, no larger than the
+# model's own input size (it downsamples anything bigger)
+VLM_IMAGE_QUALITY = 85
+VLM_MAX_IMAGE_SIDE = 1568
+
+# VLM answers are cached on disk by page look (pHash) + page text, so repeated
+# or re-uploaded pages don't cost another request
+VLM_CACHE_PATH = os.path.join("output", ".vlm_cache", "vlm_cache.json")
+VLM_CACHE_MAX_ENTRIES = 5000  # page texts kept; the oldest are dropped beyond this
+PHASH_MAX_DISTANCE = 4  # bits out of 64
+
+# Byte-identical pages (boilerplate, repeated disclaimers) are recognised by a
+# hash of the rendered pixels and reuse the first copy's blocks and results
+EXACT_CACHE_SIZE = 64  # prepared pages remembered per analyzer
+
+PAGE_INSTRUCTIONS = """Instructions:
+1. Summarize the main content of this page
+2. List key points or important information
+3. For images on this page, identify them smartly:
+   - If there's a CLUSTER or GRID of related small images (like color swatches, product variations, multiple diagrams),
+     treat the ENTIRE cluster as ONE image and provide coordinates covering the whole group
+   - For standalone large images (photos, diagrams, charts), identify them individually
+   - SKIP logos, icons, small decorative elements
+   - Provide bounding box as percentages (0-100) of page: [x1, y1, x2, y2]
+
+IMPORTANT:
+- Prefer LARGER bounding boxes that capture complete visual elements
+- If you see a row/grid of related images, give ONE bounding box covering ALL of them
+- Example: A row of 5 color swatches = ONE image entry with coordinates covering all 5"""
+
+PAGE_PROMPT = """Analyze this document page carefully and extract information in JSON format.
+
+""" + PAGE_INSTRUCTIONS + """
+
+Respond ONLY with valid JSON:
+{
+    "page_summary": "Brief summary of the page content",
+    "key_points": ["point 1", "point 2"],
+    "relevant_images": [
+        {
+            "description": "What the image/cluster shows",
+            "relevance": "Why this is important",
+            "coordinates_pct": [x1, y1, x2, y2],
+            "is_cluster": true/false
+        }
+    ]
+}
+
+If no relevant images, return empty array for relevant_images."""
+
+BATCH_PROMPT = """You are given {count} document pages as images, in order. Analyze EACH page
+separately and extract information in JSON format.
+
+""" + PAGE_INSTRUCTIONS + """
+
+Respond ONLY with valid JSON, one entry per page, page_index counting from 0:
+{{
+    "pages": [
+        {{
+            "page_index": 0,
+            "page_summary": "Brief summary of the page content",
+            "key_points": ["point 1", "point 2"],
+            "relevant_images": [
+                {{
+                    "description": "What the image/cluster shows",
+                    "relevance": "Why this is important",
+                    "coordinates_pct": [x1, y1, x2, y2],
+                    "is_cluster": true/false
+                }}
+            ]
+        }}
+    ]
+}}
+
+If a page has no relevant images, return empty array for its relevant_images."""
+
+# Structured-output schemas (same shape as the prompts above), so the model
+# returns plain JSON instead of free text that has to be un-fenced
+PAGE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "page_summary": {"type": "string"},
+        "key_points": {"type": "array", "items": {"type": "string"}},
+        "relevant_images": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "description": {"type": "string"},
+                    "relevance": {"type": "string"},
+                    "coordinates_pct": {"type": "array", "items": {"type": "number"}},
+                    "is_cluster": {"type": "boolean"}
+                },
+                "required": ["description", "relevance", "coordinates_pct", "is_cluster"],
+                "additionalProperties": False
+            }
+        }
+    },
+    "required": ["page_summary", "key_points", "relevant_images"],
+    "additionalProperties": False
+}
+
+BATCH_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "pages": {
+            "type": "array",
+            "items": {
+                **PAGE_SCHEMA,
+                "properties": {"page_index": {"type": "integer"}, **PAGE_SCHEMA["properties"]},
+                "required": ["page_index"] + PAGE_SCHEMA["required"]
+            }
+        }
+    },
+    "required": ["pages"],
+    "additionalProperties": False
+}
+
 
 def optimize_image(cv2_image, max_width=MAX_IMAGE_WIDTH, quality=WEBP_QUALITY):
     """
@@ -33,90 +197,360 @@ def optimize_image(cv2_image, max_width=MAX_IMAGE_WIDTH, quality=WEBP_QUALITY):
     - Convert to WebP format with quality setting
     Returns: (optimized_bytes, extension)
     """
-    # Convert BGR (OpenCV) to RGB (PIL)
-    rgb_image = cv2.cvtColor(cv2_image, cv2.COLOR_BGR2RGB)
-    pil_image = Image.fromarray(rgb_image)
-
     # Resize if too large
-    width, height = pil_image.size
+    height, width = cv2_image.shape[:2]
     if width > max_width:
         ratio = max_width / width
         new_height = int(height * ratio)
-        pil_image = pil_image.resize((max_width, new_height), Image.LANCZOS)
+        cv2_image = cv2.resize(cv2_image, (max_width, new_height), interpolation=cv2.INTER_AREA)
         print(f"    Resized: {width}x{height} -> {max_width}x{new_height}")
 
-    # Save as WebP
-    buffer = io.BytesIO()
-    pil_image.save(buffer, format='WEBP', quality=quality, method=6)
+    # Encode straight from BGR with libwebp's default effort
+    _, buffer = cv2.imencode('.webp', cv2_image, [cv2.IMWRITE_WEBP_QUALITY, quality])
+
+    return buffer.tobytes(), '.webp'
+
+
+def cuda_enabled() -> bool:
+    """Whether this process can run OpenCV CUDA filters"""
+    global _cuda_enabled
+    if _cuda_enabled is None:
+        try:
+            _cuda_enabled = cv2.cuda.getCudaEnabledDeviceCount() > 0
+        except (AttributeError, cv2.error):
+            _cuda_enabled = False
+    return _cuda_enabled
 
-    return buffer.getvalue(), '.webp'
+
+def to_gray(img: np.ndarray) -> np.ndarray:
+    """Grayscale view of a BGR or already-gray image"""
+    return img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
+
+def edge_mask(gray: np.ndarray, ksize: int) -> np.ndarray:
+    """Blur -> Canny -> dilate a grayscale image into a binary mask of connected edges"""
+    # Apply Gaussian blur
+    blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+
+    # Edge detection
+    edges = cv2.Canny(blurred, 30, 150)
+
+    # Dilate to connect nearby edges
+    kernel = np.ones((ksize, ksize), np.uint8)
+    return cv2.dilate(edges, kernel, iterations=3)
+
+
+def edge_mask_cuda(gray: np.ndarray, ksize: int) -> np.ndarray:
+    """edge_mask on the GPU; filters are built once per kernel size"""
+    if ksize not in _cuda_filters:
+        kernel = np.ones((ksize, ksize), np.uint8)
+        _cuda_filters[ksize] = (
+            cv2.cuda.createGaussianFilter(cv2.CV_8UC1, cv2.CV_8UC1, (5, 5), 0),
+            cv2.cuda.createCannyEdgeDetector(30, 150),
+            cv2.cuda.createMorphologyFilter(cv2.MORPH_DILATE, cv2.CV_8UC1, kernel, iterations=3)
+        )
+    gaussian, canny, dilate = _cuda_filters[ksize]
+
+    gpu_gray = cv2.cuda_GpuMat()
+    gpu_gray.upload(gray)
+    edges = canny.detect(gaussian.apply(gpu_gray))
+    return dilate.apply(edges).download()
+
+
+def cluster_labels_dense(x1, y1, x2, y2, threshold: float) -> np.ndarray:
+    """Cluster label (smallest member index) per bbox, via an N x N gap matrix"""
+    # Pairwise gap between bboxes (0 where they overlap on an axis)
+    h_gap = np.maximum(np.maximum(x1[None, :] - x2[:, None], x1[:, None] - x2[None, :]), 0)
+    v_gap = np.maximum(np.maximum(y1[None, :] - y2[:, None], y1[:, None] - y2[None, :]), 0)
+    nearby = (h_gap ** 2 + v_gap ** 2) < threshold ** 2
+
+    # Connected components: propagate the smallest index through neighbours
+    n = len(x1)
+    labels = np.arange(n)
+    while True:
+        new_labels = np.where(nearby, labels[None, :], n).min(axis=1)
+        if np.array_equal(new_labels, labels):
+            return labels
+        labels = new_labels
+
+
+def cluster_labels_sweep(x1, y1, x2, y2, threshold):
+    """Same labels as cluster_labels_dense, by union-find over bboxes sorted by x1
+
+    The scan for each bbox stops once the horizontal gap alone reaches the
+    threshold, so no N x N matrix is built. Written for numba.
+    """
+    n = x1.shape[0]
+    parent = np.arange(n)
+    order = np.argsort(x1)
+    limit = threshold * threshold
+
+    for a in range(n):
+        i = order[a]
+        for b in range(a + 1, n):
+            j = order[b]
+            # x1[j] >= x1[i], so this is the only possible horizontal gap
+            h_gap = x1[j] - x2[i]
+            if h_gap >= threshold:
+                break
+            h_gap = max(h_gap, 0)
+            v_gap = max(max(y1[j] - y2[i], y1[i] - y2[j]), 0)
+            if h_gap * h_gap + v_gap * v_gap < limit:
+                root_i = i
+                while parent[root_i] != root_i:
+                    root_i = parent[root_i]
+                root_j = j
+                while parent[root_j] != root_j:
+                    root_j = parent[root_j]
+                # Smallest index becomes the root
+                if root_i < root_j:
+                    parent[root_j] = root_i
+                elif root_j < root_i:
+                    parent[root_i] = root_j
+
+    labels = np.empty(n, np.int64)
+    for i in range(n):
+        root = i
+        while parent[root] != root:
+            root = parent[root]
+        labels[i] = root
+    return labels
+
+
+# With numba the sweep is compiled (and cached on disk); without it the NumPy version is faster
+cluster_labels = njit(cache=True)(cluster_labels_sweep) if njit else cluster_labels_dense
+
+
+def pixmap_to_bgr(pix) -> np.ndarray:
+    """Convert a PyMuPDF pixmap to an OpenCV BGR array without a PNG round-trip
+
+    Reads the pixmap buffer in place (samples_mv); cvtColor writes the only copy.
+    """
+    samples = np.frombuffer(pix.samples_mv, np.uint8).reshape(pix.height, pix.width, pix.n)
+    if pix.n == 4:
+        return cv2.cvtColor(samples, cv2.COLOR_RGBA2BGR)
+    if pix.n == 1:
+        return cv2.cvtColor(samples, cv2.COLOR_GRAY2BGR)
+    return cv2.cvtColor(samples, cv2.COLOR_RGB2BGR)
+
+
+def encode_vlm_image(img: np.ndarray) -> bytes:
+    """Encode a page image for the VLM"""
+    height, width = img.shape[:2]
+    scale = VLM_MAX_IMAGE_SIDE / max(height, width)
+    if scale < 1:
+        img = cv2.resize(img, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+
+    _, buffer = cv2.imencode(".webp", img, [cv2.IMWRITE_WEBP_QUALITY, VLM_IMAGE_QUALITY])
+    return buffer.tobytes()
+
+
+def page_phash(img: np.ndarray) -> int:
+    """64-bit DCT perceptual hash of a page image (BGR or gray)"""
+    small = cv2.resize(to_gray(img), (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:8, :8].flatten()
+    bits = low > np.median(low[1:])
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+class VLMCache:
+    """Disk-backed cache of VLM page analyses
+
+    A hit needs identical page text and a pHash within PHASH_MAX_DISTANCE, so
+    pages that only differ in wording (e.g. another SKU) are still analyzed.
+    """
+
+    def __init__(self, path: str = VLM_CACHE_PATH):
+        self.path = path
+        self.entries: Dict[str, List[Dict]] = self.load(path)
+        self.added: Dict[str, List[Dict]] = {}  # analyses not saved yet
+
+    @staticmethod
+    def load(path: str) -> Dict[str, List[Dict]]:
+        """Read a cache file ({} if missing or unreadable)"""
+        if not os.path.exists(path):
+            return {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Ignoring unreadable VLM cache {path}: {e}")
+            return {}
+
+    @staticmethod
+    def key(page_image: np.ndarray, page_text: str) -> tuple:
+        """Cache key for a page: (text hash, pHash)"""
+        text_hash = hashlib.sha1(page_text.strip().encode("utf-8")).hexdigest()
+        return text_hash, page_phash(page_image)
+
+    def get(self, key: tuple) -> Optional[Dict]:
+        """Return a cached analysis for a matching page, if any"""
+        text_hash, phash = key
+        for entry in self.entries.get(text_hash, []):
+            if bin(entry["phash"] ^ phash).count("1") <= PHASH_MAX_DISTANCE:
+                return json.loads(json.dumps(entry["result"]))  # callers may mutate
+        return None
+
+    def put(self, key: tuple, result: Dict):
+        """Store a successful analysis"""
+        if not result.get("page_summary") or result["page_summary"].startswith(("Error:", "Failed to parse")):
+            return
+        text_hash, phash = key
+        entry = {"phash": phash, "result": result}
+        self.entries.setdefault(text_hash, []).append(entry)
+        self.added.setdefault(text_hash, []).append(entry)
+
+    def save(self):
+        """Merge the analyses added since the last save into the cache file
+
+        Products are processed in parallel worker processes: the merge runs under
+        an exclusive lock on <path>.lock and writes its own temp file, so no save
+        loses another's entries. A failed save is only logged, so it never fails
+        the PDF it was saving for.
+        """
+        if not self.added:
+            return
+        cache_dir = os.path.dirname(self.path)
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            with open(self.path + ".lock", "a") as lock:
+                if fcntl:
+                    fcntl.flock(lock, fcntl.LOCK_EX)
+                entries = self.load(self.path)
+                for text_hash, added in self.added.items():
+                    saved = entries.pop(text_hash, [])  # re-added page texts count as newest
+                    phashes = {entry["phash"] for entry in saved}
+                    entries[text_hash] = saved + [entry for entry in added if entry["phash"] not in phashes]
+                # Page texts are oldest first; keep the newest VLM_CACHE_MAX_ENTRIES
+                for text_hash in list(islice(entries, max(0, len(entries) - VLM_CACHE_MAX_ENTRIES))):
+                    del entries[text_hash]
+                fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+                try:
+                    with os.fdopen(fd, "w", encoding="utf-8") as f:
+                        json.dump(entries, f, ensure_ascii=False)
+                    os.replace(tmp_path, self.path)
+                except BaseException:
+                    os.remove(tmp_path)
+                    raise
+        except (OSError, TypeError, ValueError) as e:
+            print(f"Could not save VLM cache {self.path}: {e}")
+            return
+        self.entries = entries
+        self.added = {}
 
 
 class PDFAnalyzer:
     def __init__(self, api_key: Optional[str] = None):
         """Initialize PDF Analyzer with OpenRouter client"""
         api_key = api_key or os.getenv("OPENROUTER_API_KEY")
+        self.api_key = api_key
 
         self.client = OpenAI(
             base_url="https://openrouter.ai/api/v1",
-            api_key=api_key
+            api_key=api_key,
+            default_headers=VLM_HEADERS,
+            http_client=DefaultHttpxClient(limits=VLM_HTTP_LIMITS, timeout=VLM_HTTP_TIMEOUT)
         )
         self.vlm_model = "anthropic/claude-opus-4.5"  # Qwen VL on OpenRouter
+        self.structured_outputs = True  # cleared if the model rejects response_format
+        self._exact_pages = {}  # page digest -> prepared page, oldest first
+        self._documents = {}    # pdf path -> open fitz.Document, reused across pages
+
+    def open_document(self, pdf_path: str) -> fitz.Document:
+        """Open a PDF once per analyzer (so once per worker process); call under _fitz_lock"""
+        doc = self._documents.get(pdf_path)
+        if doc is None:
+            doc = self._documents[pdf_path] = fitz.open(pdf_path)
+        return doc
+
+    def close_documents(self):
+        """Close every PDF held open by open_document"""
+        with _fitz_lock:
+            for doc in self._documents.values():
+                doc.close()
+            self._documents.clear()
 
     def pdf_page_to_image(self, pdf_path: str, page_num: int, dpi: int = 150) -> tuple:
-        """Convert a PDF page to image bytes"""
-        doc = fitz.open(pdf_path)
-        page = doc[page_num]
+        """Convert a PDF page to a BGR image"""
+        with _fitz_lock:
+            page = self.open_document(pdf_path)[page_num]
 
-        mat = fitz.Matrix(dpi / 72, dpi / 72)
-        pix = page.get_pixmap(matrix=mat)
+            mat = fitz.Matrix(dpi / 72, dpi / 72)
+            pix = page.get_pixmap(matrix=mat)
 
-        img_bytes = pix.tobytes("png")
-        doc.close()
+            img = pixmap_to_bgr(pix)
 
-        return img_bytes, pix.width, pix.height
+        return img, pix.width, pix.height
 
-    def image_to_base64(self, img_bytes: bytes) -> str:
-        """Convert image bytes to base64 string"""
-        return base64.b64encode(img_bytes).decode('utf-8')
+    def load_page(self, pdf_path: str, page_num: int, dpi: int = ANALYSIS_DPI) -> Dict:
+        """Render a page and read its text and embedded image boxes in one open
 
-    def analyze_page_with_vlm(self, page_image_bytes: bytes) -> Dict:
-        """Send page image to VLM for analysis"""
+        Image boxes come from the PDF itself (in pixels at the render dpi), so
+        born-digital pages need no OpenCV detection.
+        """
+        with _fitz_lock:
+            page = self.open_document(pdf_path)[page_num]
 
-        base64_image = self.image_to_base64(page_image_bytes)
+            mat = fitz.Matrix(dpi / 72, dpi / 72)
+            pix = page.get_pixmap(matrix=mat)
 
-        prompt = """Analyze this document page carefully and extract information in JSON format.
+            image_boxes = []
+            for info in page.get_image_info():
+                rect = fitz.Rect(info["bbox"]) & page.rect
+                if not rect.is_empty:
+                    image_boxes.append(rect * mat)
 
-Instructions:
-1. Summarize the main content of this page
-2. List key points or important information
-3. For images on this page, identify them smartly:
-   - If there's a CLUSTER or GRID of related small images (like color swatches, product variations, multiple diagrams),
-     treat the ENTIRE cluster as ONE image and provide coordinates covering the whole group
-   - For standalone large images (photos, diagrams, charts), identify them individually
-   - SKIP logos, icons, small decorative elements
-   - Provide bounding box as percentages (0-100) of page: [x1, y1, x2, y2]
+            loaded = {
+                "image": pixmap_to_bgr(pix),
+                "width": pix.width,
+                "height": pix.height,
+                "text": page.get_text(),
+                "image_boxes": [[int(r.x0), int(r.y0), int(r.x1), int(r.y1)] for r in image_boxes]
+            }
 
-IMPORTANT:
-- Prefer LARGER bounding boxes that capture complete visual elements
-- If you see a row/grid of related images, give ONE bounding box covering ALL of them
-- Example: A row of 5 color swatches = ONE image entry with coordinates covering all 5
+        return loaded
 
-Respond ONLY with valid JSON:
-{
-    "page_summary": "Brief summary of the page content",
-    "key_points": ["point 1", "point 2"],
-    "relevant_images": [
-        {
-            "description": "What the image/cluster shows",
-            "relevance": "Why this is important",
-            "coordinates_pct": [x1, y1, x2, y2],
-            "is_cluster": true/false
-        }
-    ]
-}
+    def render_page_regions(self, pdf_path: str, page_num: int, bboxes: List[List[int]],
+                            padding: int = 5) -> List[np.ndarray]:
+        """Render bboxes (pixels at ANALYSIS_DPI) of a page straight from the PDF
 
-If no relevant images, return empty array for relevant_images."""
+        Each region gets the highest dpi up to EXTRACT_DPI that keeps it within
+        MAX_IMAGE_WIDTH, so small images come out crisp and large ones are not
+        rendered bigger than optimize_image keeps.
+        """
+        scale = 72 / ANALYSIS_DPI
+
+        with _fitz_lock:
+            page = self.open_document(pdf_path)[page_num]
+
+            crops = []
+            for x1, y1, x2, y2 in bboxes:
+                clip = fitz.Rect(
+                    (x1 - padding) * scale, (y1 - padding) * scale,
+                    (x2 + padding) * scale, (y2 + padding) * scale
+                ) & page.rect
+                zoom = min(EXTRACT_DPI / 72, MAX_IMAGE_WIDTH / max(clip.width, 1))
+                crops.append(pixmap_to_bgr(page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), clip=clip)))
+
+        return crops
+
+    def image_to_base64(self, img_bytes: bytes) -> str:
+        """Convert image bytes to base64 string"""
+        return base64.b64encode(img_bytes).decode('utf-8')
+
+    def _vlm_completion(self, content: List[Dict], max_tokens: int,
+                        schema: Optional[Dict] = None, schema_name: str = "page_analysis") -> str:
+        """Send one user message to the VLM and return the response text
+
+        With a schema the answer is requested as structured output; models that
+        don't support it get the plain request (the prompt still asks for JSON).
+        """
+        kwargs = {}
+        if schema is not None and self.structured_outputs:
+            kwargs["response_format"] = {
+                "type": "json_schema",
+                "json_schema": {"name": schema_name, "strict": True, "schema": schema}
+            }
 
         try:
             completion = self.client.chat.completions.create(
@@ -124,38 +558,64 @@ If no relevant images, return empty array for relevant_images."""
                 messages=[
                     {
                         "role": "user",
-                        "content": [
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/png;base64,{base64_image}"
-                                }
-                            },
-                            {
-                                "type": "text",
-                                "text": prompt
-                            }
-                        ]
+                        "content": content
                     }
                 ],
-                extra_headers={
-                    "HTTP-Referer": "https://pdf-analyzer.local",
-                    "X-Title": "PDF Analyzer"
-                },
                 temperature=0.3,
-                max_tokens=1412
+                max_tokens=max_tokens,
+                **kwargs
             )
+        except BadRequestError as e:
+            if not kwargs:
+                raise
+            print(f"Structured output not supported ({e}), falling back to plain JSON prompts")
+            self.structured_outputs = False
+            return self._vlm_completion(content, max_tokens)
+
+        return completion.choices[0].message.content
+
+    def _image_content(self, page_image_bytes: bytes) -> Dict:
+        """Build an image_url content part for a page image"""
+        base64_image = self.image_to_base64(page_image_bytes)
+        return {
+            "type": "image_url",
+            "image_url": {
+                "url": f"data:image/webp;base64,{base64_image}"
+            }
+        }
 
-            response_text = completion.choices[0].message.content
+    @staticmethod
+    def _parse_json_response(response_text: str):
+        """Parse JSON from a model response, stripping markdown fences
 
-            # Parse JSON from response
-            if "```json" in response_text:
-                response_text = response_text.split("```json")[1].split("```")[0]
-            elif "```" in response_text:
-                response_text = response_text.split("```")[1].split("```")[0]
+        Structured outputs are plain JSON; the fence handling is for models
+        without response_format support.
+        """
+        if "```json" in response_text:
+            response_text = response_text.split("```json")[1].split("```")[0]
+        elif "```" in response_text:
+            response_text = response_text.split("```")[1].split("```")[0]
 
-            result = json.loads(response_text.strip())
-            return result
+        return json.loads(response_text.strip())
+
+    def analyze_page_with_vlm(self, page_image_bytes: bytes) -> Dict:
+        """Send page image to VLM for analysis"""
+
+        response_text = ""
+
+        try:
+            response_text = self._vlm_completion(
+                [
+                    self._image_content(page_image_bytes),
+                    {
+                        "type": "text",
+                        "text": PAGE_PROMPT
+                    }
+                ],
+                VLM_MAX_TOKENS_PER_PAGE,
+                PAGE_SCHEMA
+            )
+            return self._parse_json_response(response_text)
 
         except json.JSONDecodeError as e:
             print(f"Failed to parse VLM response as JSON: {e}")
@@ -173,51 +633,97 @@ If no relevant images, return empty array for relevant_images."""
                 "relevant_images": []
             }
 
-    def detect_image_blocks(self, page_image_bytes: bytes) -> tuple:
-        """Use OpenCV to detect all potential image blocks on the page"""
+    def analyze_pages_with_vlm(self, page_images: List[bytes]) -> List[Dict]:
+        """Analyze several pages in one VLM request
+
+        Falls back to one request per page if the batched answer cannot be
+        parsed or does not cover every page.
+        """
+        if len(page_images) == 1:
+            return [self.analyze_page_with_vlm(page_images[0])]
+
+        content = [self._image_content(img) for img in page_images]
+        content.append({
+            "type": "text",
+            "text": BATCH_PROMPT.format(count=len(page_images))
+        })
+
+        try:
+            response_text = self._vlm_completion(
+                content, VLM_MAX_TOKENS_PER_PAGE * len(page_images), BATCH_SCHEMA, "pages_analysis"
+            )
+            pages = self._parse_json_response(response_text)["pages"]
+            by_index = {page["page_index"]: page for page in pages}
+            results = [by_index[i] for i in range(len(page_images))]
+            for page in results:
+                page.pop("page_index", None)
+            return results
+        except Exception as e:
+            print(f"Batched VLM analysis failed ({e}), falling back to one request per page")
+            return [self.analyze_page_with_vlm(img) for img in page_images]
 
-        nparr = np.frombuffer(page_image_bytes, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    def detect_image_blocks(self, img: np.ndarray) -> tuple:
+        """Use OpenCV to detect all potential image blocks on the page (BGR or gray)"""
 
         if img is None:
             return [], 0, 0
 
+        # Everything below works on one channel, so drop colour before any other pass
+        img = to_gray(img)
         img_height, img_width = img.shape[:2]
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-
-        # Apply Gaussian blur
-        blurred = cv2.GaussianBlur(gray, (5, 5), 0)
 
-        # Edge detection
-        edges = cv2.Canny(blurred, 30, 150)
-
-        # Dilate to connect nearby edges
-        kernel = np.ones((7, 7), np.uint8)
-        dilated = cv2.dilate(edges, kernel, iterations=3)
+        # Detect on a downscaled page; boxes only need percentage-level accuracy
+        scale = min(1.0, DETECTION_MAX_DIM / max(img_height, img_width))
+        if scale < 1.0:
+            img = cv2.resize(
+                img, (int(img_width * scale), int(img_height * scale)), interpolation=cv2.INTER_AREA
+            )
 
-        # Find contours
-        contours, _ = cv2.findContours(dilated, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        # Connected edges (dilation kernel sized for the detection scale)
+        ksize = max(3, round(7 * scale) | 1)
+        dilated = None
+        if cuda_enabled():
+            try:
+                dilated = edge_mask_cuda(img, ksize)
+            except cv2.error as e:
+                print(f"CUDA edge detection failed, using CPU: {e}")
+        if dilated is None:
+            dilated = edge_mask(img, ksize)
+
+        # Bounding box of every connected blob (label 0 is the background)
+        _, _, stats, _ = cv2.connectedComponentsWithStats(dilated, connectivity=8)
+        x = stats[1:, cv2.CC_STAT_LEFT]
+        y = stats[1:, cv2.CC_STAT_TOP]
+        w = stats[1:, cv2.CC_STAT_WIDTH]
+        h = stats[1:, cv2.CC_STAT_HEIGHT]
+        boxes = (np.stack([x, y, x + w, y + h], axis=1) / scale).astype(np.int64)
+
+        return self.boxes_to_blocks(boxes, img_width, img_height), img_width, img_height
+
+    def boxes_to_blocks(self, boxes, img_width: int, img_height: int) -> List[Dict]:
+        """Turn pixel bboxes into image blocks, skipping small and extreme-aspect ones"""
+        boxes = np.unique(np.asarray(boxes, dtype=np.int64).reshape(-1, 4), axis=0)
+        w = boxes[:, 2] - boxes[:, 0]
+        h = boxes[:, 3] - boxes[:, 1]
+        area = w * h
 
-        blocks = []
         min_area = (img_width * img_height) * 0.005
+        min_side = 50 * ANALYSIS_DPI / REFERENCE_DPI
+        keep = (area > min_area) & (w > min_side) & (h > min_side)
+        keep &= np.maximum(w, h) < 10 * np.minimum(w, h)  # aspect ratio < 10
 
-        for contour in contours:
-            x, y, w, h = cv2.boundingRect(contour)
-            area = w * h
-
-            if area > min_area and w > 50 and h > 50:
-                aspect_ratio = max(w, h) / min(w, h)
-                if aspect_ratio < 10:
-                    blocks.append({
-                        "bbox": [x, y, x + w, y + h],
-                        "center": [x + w / 2, y + h / 2],
-                        "area": area,
-                        "width": w,
-                        "height": h
-                    })
-
-        blocks.sort(key=lambda b: b["area"], reverse=True)
-        return blocks, img_width, img_height
+        blocks = []
+        for i in np.flatnonzero(keep)[np.argsort(-area[keep], kind="stable")]:
+            x1, y1, x2, y2 = boxes[i].tolist()
+            blocks.append({
+                "bbox": [x1, y1, x2, y2],
+                "center": [(x1 + x2) / 2, (y1 + y2) / 2],
+                "area": int(area[i]),
+                "width": int(w[i]),
+                "height": int(h[i])
+            })
+
+        return blocks
 
     def merge_nearby_blocks(self, blocks: List[Dict], img_width: int, img_height: int,
                             distance_threshold_pct: float = 5.0) -> List[Dict]:
@@ -229,174 +735,148 @@ If no relevant images, return empty array for relevant_images."""
         # Distance threshold in pixels
         dist_threshold = max(img_width, img_height) * distance_threshold_pct / 100
 
-        # Track which blocks have been merged
-        merged = [False] * len(blocks)
-        result = []
-
-        for i, block_a in enumerate(blocks):
-            if merged[i]:
-                continue
+        bboxes = np.asarray([b["bbox"] for b in blocks], dtype=np.int64)
+        x1, y1, x2, y2 = (np.ascontiguousarray(col) for col in bboxes.T)
+        labels = cluster_labels(x1, y1, x2, y2, float(dist_threshold))
 
-            # Start a cluster with this block
-            cluster_bboxes = [block_a["bbox"]]
-            merged[i] = True
+        result = []
 
-            # Find all nearby blocks
-            for j, block_b in enumerate(blocks):
-                if i == j or merged[j]:
-                    continue
+        # Components in order of their first (largest) block
+        for label in dict.fromkeys(labels.tolist()):
+            members = np.flatnonzero(labels == label)
 
-                # Check if blocks are close (within threshold)
-                if self._blocks_are_nearby(block_a, block_b, dist_threshold):
-                    cluster_bboxes.append(block_b["bbox"])
-                    merged[j] = True
+            if len(members) == 1:
+                block = blocks[members[0]]
+                block["is_cluster"] = False
+                result.append(block)
+                continue
 
             # If multiple blocks merged, create combined bbox
-            if len(cluster_bboxes) > 1:
-                combined = self._merge_bboxes(cluster_bboxes)
-                result.append({
-                    "bbox": combined,
-                    "center": [(combined[0] + combined[2]) / 2, (combined[1] + combined[3]) / 2],
-                    "area": (combined[2] - combined[0]) * (combined[3] - combined[1]),
-                    "width": combined[2] - combined[0],
-                    "height": combined[3] - combined[1],
-                    "is_cluster": True,
-                    "cluster_count": len(cluster_bboxes)
-                })
-            else:
-                block_a["is_cluster"] = False
-                result.append(block_a)
+            combined = [
+                int(x1[members].min()), int(y1[members].min()),
+                int(x2[members].max()), int(y2[members].max())
+            ]
+            result.append({
+                "bbox": combined,
+                "center": [(combined[0] + combined[2]) / 2, (combined[1] + combined[3]) / 2],
+                "area": (combined[2] - combined[0]) * (combined[3] - combined[1]),
+                "width": combined[2] - combined[0],
+                "height": combined[3] - combined[1],
+                "is_cluster": True,
+                "cluster_count": len(members)
+            })
 
         return result
 
-    def _blocks_are_nearby(self, block_a: Dict, block_b: Dict, threshold: float) -> bool:
-        """Check if two blocks are within threshold distance"""
-        a = block_a["bbox"]
-        b = block_b["bbox"]
-
-        # Calculate min distance between bboxes
-        # Horizontal distance
-        if a[2] < b[0]:  # a is left of b
-            h_dist = b[0] - a[2]
-        elif b[2] < a[0]:  # b is left of a
-            h_dist = a[0] - b[2]
-        else:  # overlapping horizontally
-            h_dist = 0
-
-        # Vertical distance
-        if a[3] < b[1]:  # a is above b
-            v_dist = b[1] - a[3]
-        elif b[3] < a[1]:  # b is above a
-            v_dist = a[1] - b[3]
-        else:  # overlapping vertically
-            v_dist = 0
-
-        distance = np.sqrt(h_dist**2 + v_dist**2)
-        return distance < threshold
-
-    def _merge_bboxes(self, bboxes: List[List[int]]) -> List[int]:
-        """Merge multiple bboxes into one encompassing bbox"""
-        x1 = min(b[0] for b in bboxes)
-        y1 = min(b[1] for b in bboxes)
-        x2 = max(b[2] for b in bboxes)
-        y2 = max(b[3] for b in bboxes)
-        return [x1, y1, x2, y2]
-
     def find_nearest_block(
         self,
         vlm_coords_pct: List[float],
         blocks: List[Dict],
         img_width: int,
         img_height: int,
-        max_distance_pct: float = 20.0
+        max_distance_pct: float = 20.0,
+        block_arrays: Optional[tuple] = None
     ) -> Optional[Dict]:
-        """Find the detected block closest to VLM's approximate coordinates"""
+        """Find the detected block closest to VLM's approximate coordinates
+
+        block_arrays is block_arrays(blocks), to reuse across calls for one page.
+        """
 
         if not blocks or not vlm_coords_pct:
             return None
 
+        centers, areas = block_arrays or self.block_arrays(blocks)
+
         # Convert percentage to pixels
         x1 = vlm_coords_pct[0] * img_width / 100
         y1 = vlm_coords_pct[1] * img_height / 100
         x2 = vlm_coords_pct[2] * img_width / 100
         y2 = vlm_coords_pct[3] * img_height / 100
 
-        vlm_center = [(x1 + x2) / 2, (y1 + y2) / 2]
+        vlm_center = ((x1 + x2) / 2, (y1 + y2) / 2)
         vlm_area = (x2 - x1) * (y2 - y1)
 
-        page_diagonal = np.sqrt(img_width**2 + img_height**2)
-        max_distance = max_distance_pct * page_diagonal / 100
-
-        best_block = None
-        min_score = float('inf')
+        max_distance = max_distance_pct * np.hypot(img_width, img_height) / 100
 
-        for block in blocks:
-            dist = np.sqrt(
-                (block["center"][0] - vlm_center[0])**2 +
-                (block["center"][1] - vlm_center[1])**2
-            )
+        dist = np.hypot(centers[:, 0] - vlm_center[0], centers[:, 1] - vlm_center[1])
+        if vlm_area > 0:
+            area_ratio = np.minimum(areas, vlm_area) / np.maximum(areas, vlm_area)
+        else:
+            area_ratio = np.zeros_like(areas)
+        score = np.where(dist > max_distance, np.inf, dist * (2 - area_ratio))
 
-            if dist > max_distance:
-                continue
+        best = int(np.argmin(score))
+        return blocks[best] if np.isfinite(score[best]) else None
 
-            area_ratio = min(block["area"], vlm_area) / max(block["area"], vlm_area) if vlm_area > 0 else 0
-            score = dist * (2 - area_ratio)
+    @staticmethod
+    def block_arrays(blocks: List[Dict]) -> tuple:
+        """Block centers (N, 2) and areas (N,) as arrays"""
+        centers = np.asarray([b["center"] for b in blocks], dtype=np.float64).reshape(-1, 2)
+        areas = np.asarray([b["area"] for b in blocks], dtype=np.float64)
+        return centers, areas
 
-            if score < min_score:
-                min_score = score
-                best_block = block
+    def prepare_page(self, pdf_path: str, page_num: int) -> Dict:
+        """Render a page and find its image blocks (no VLM call)"""
 
-        return best_block
+        print(f"Processing page {page_num + 1}...")
 
-    def extract_image_region(
-        self,
-        page_image_bytes: bytes,
-        bbox: List[int],
-        padding: int = 5
-    ) -> np.ndarray:
-        """Extract and crop the image region"""
+        # Convert page to image
+        loaded = self.load_page(pdf_path, page_num)
+        page_image, img_width, img_height = loaded["image"], loaded["width"], loaded["height"]
+        print(f"  - Page {page_num + 1} converted: {img_width}x{img_height}")
 
-        nparr = np.frombuffer(page_image_bytes, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        digest = hashlib.blake2b(page_image.data, digest_size=16)
+        digest.update(loaded["text"].encode("utf-8"))
+        digest = digest.hexdigest()
 
-        h, w = img.shape[:2]
-        x1, y1, x2, y2 = bbox
+        known = self._exact_pages.get(digest)
+        if known is not None:
+            print(f"  - Page {page_num + 1} identical to an earlier page, skipping detection")
+            return dict(known, page_num=page_num)
 
-        x1 = max(0, int(x1) - padding)
-        y1 = max(0, int(y1) - padding)
-        x2 = min(w, int(x2) + padding)
-        y2 = min(h, int(y2) + padding)
+        # One grayscale conversion serves both detection and the pHash
+        page_gray = to_gray(page_image)
 
-        cropped = img[y1:y2, x1:x2]
-        return cropped
+        # Embedded images give exact boxes; OpenCV detection only for scanned pages
+        blocks = self.boxes_to_blocks(loaded["image_boxes"], img_width, img_height)
+        if not loaded["image_boxes"]:
+            blocks, _, _ = self.detect_image_blocks(page_gray)
 
-    def process_page(self, pdf_path: str, page_num: int) -> Dict:
-        """Process a single PDF page"""
+        # Merge nearby blocks into clusters
+        merged_blocks = self.merge_nearby_blocks(blocks, img_width, img_height)
+        cluster_count = sum(1 for b in merged_blocks if b.get("is_cluster", False))
+        print(f"  - Page {page_num + 1}: {len(blocks)} blocks, {len(merged_blocks)} after merging ({cluster_count} clusters)")
 
-        print(f"Processing page {page_num + 1}...")
+        prepared = {
+            "page_num": page_num,
+            "pdf_path": pdf_path,
+            "vlm_image": encode_vlm_image(page_image),
+            "width": img_width,
+            "height": img_height,
+            "blocks": merged_blocks,
+            "cache_key": VLMCache.key(page_gray, loaded["text"]),
+            "digest": digest
+        }
 
-        # Convert page to image
-        page_image, img_width, img_height = self.pdf_page_to_image(pdf_path, page_num)
-        print(f"  - Page converted: {img_width}x{img_height}")
+        self._exact_pages[digest] = prepared
+        if len(self._exact_pages) > EXACT_CACHE_SIZE:
+            self._exact_pages.pop(next(iter(self._exact_pages)), None)
 
-        # Analyze with VLM
-        print(f"  - Analyzing with VLM...")
-        vlm_result = self.analyze_page_with_vlm(page_image)
-        print(f"  - Found {len(vlm_result.get('relevant_images', []))} relevant images/clusters")
+        return prepared
 
-        # Detect blocks with OpenCV
-        print(f"  - Detecting image blocks...")
-        blocks, _, _ = self.detect_image_blocks(page_image)
-        print(f"  - Detected {len(blocks)} potential blocks")
+    def extract_page(self, prepared: Dict, vlm_result: Dict) -> Dict:
+        """Match VLM image coordinates to detected blocks and extract them"""
 
-        # Merge nearby blocks into clusters
-        print(f"  - Merging nearby blocks into clusters...")
-        merged_blocks = self.merge_nearby_blocks(blocks, img_width, img_height)
-        cluster_count = sum(1 for b in merged_blocks if b.get("is_cluster", False))
-        print(f"  - After merging: {len(merged_blocks)} blocks ({cluster_count} clusters)")
+        page_num = prepared["page_num"]
+        img_width = prepared["width"]
+        img_height = prepared["height"]
+        merged_blocks = prepared["blocks"]
+        block_arrays = self.block_arrays(merged_blocks)
+        print(f"  - Page {page_num + 1}: found {len(vlm_result.get('relevant_images', []))} relevant images/clusters")
 
-        # Match and extract images
+        # Match images to regions
         extracted_images = []
+        regions = []
         used_blocks = set()  # Track used blocks to avoid duplicates
 
         for idx, img_info in enumerate(vlm_result.get("relevant_images", [])):
@@ -407,7 +887,9 @@ If no relevant images, return empty array for relevant_images."""
                 continue
 
             # First try to find match in merged blocks
-            matched_block = self.find_nearest_block(coords, merged_blocks, img_width, img_height)
+            matched_block = self.find_nearest_block(
+                coords, merged_blocks, img_width, img_height, block_arrays=block_arrays
+            )
 
             if matched_block:
                 block_key = tuple(matched_block["bbox"])
@@ -418,13 +900,11 @@ If no relevant images, return empty array for relevant_images."""
                     continue
 
                 used_blocks.add(block_key)
-                cropped = self.extract_image_region(page_image, matched_block["bbox"])
-
                 is_cluster = matched_block.get("is_cluster", False)
                 cluster_info = f" (cluster of {matched_block.get('cluster_count', 1)})" if is_cluster else ""
 
+                regions.append(matched_block["bbox"])
                 extracted_images.append({
-                    "image": cropped,
                     "description": img_info.get("description", ""),
                     "relevance": img_info.get("relevance", ""),
                     "vlm_coords_pct": coords,
@@ -444,9 +924,8 @@ If no relevant images, return empty array for relevant_images."""
                 min_area = img_width * img_height * 0.01  # At least 1% of page
 
                 if area > min_area:
-                    cropped = self.extract_image_region(page_image, [x1, y1, x2, y2])
+                    regions.append([x1, y1, x2, y2])
                     extracted_images.append({
-                        "image": cropped,
                         "description": img_info.get("description", ""),
                         "relevance": img_info.get("relevance", ""),
                         "vlm_coords_pct": coords,
@@ -457,60 +936,241 @@ If no relevant images, return empty array for relevant_images."""
                 else:
                     print(f"  - No matching block for image {idx + 1}")
 
+        # Re-render only the matched regions, at high resolution
+        crops = self.render_page_regions(prepared["pdf_path"], page_num, regions) if regions else []
+        bbox_scale = REFERENCE_DPI / ANALYSIS_DPI
+        for img_data, cropped in zip(extracted_images, crops):
+            img_data["image"] = cropped
+            img_data["actual_bbox"] = [int(v * bbox_scale) for v in img_data["actual_bbox"]]
+
         return {
             "page_num": page_num,
             "page_summary": vlm_result.get("page_summary", ""),
             "key_points": vlm_result.get("key_points", []),
-            "images": extracted_images,
-            "page_image": page_image
+            "images": extracted_images
         }
 
-    def process_pdf(self, pdf_path: str, output_dir: str = "output") -> List[Dict]:
-        """Process entire PDF"""
+    def process_page(self, pdf_path: str, page_num: int) -> Dict:
+        """Process a single PDF page"""
+        prepared = self.prepare_page(pdf_path, page_num)
+        vlm_result = self.analyze_page_with_vlm(prepared["vlm_image"])
+        return self.extract_page(prepared, vlm_result)
+
+    def extract_page_for_output(self, prepared: Dict, vlm_result: Dict) -> Dict:
+        """Extract a page's images and encode them, so the result is small and picklable"""
+        result = self.extract_page(prepared, vlm_result)
+
+        for img_data in result["images"]:
+            # Optimize image (resize + WebP compression)
+            img_data["image_bytes"], img_data["ext"] = optimize_image(img_data["image"])
+            del img_data["image"]
+
+        return result
+
+    def process_pdf(self, pdf_path: str, output_dir: str = "output",
+                    max_workers: int = MAX_WORKERS, use_threads: bool = False) -> List[Dict]:
+        """Process entire PDF, pages in parallel
+
+        Pages run in a process pool by default; use_threads=True keeps them in
+        this process, which is enough when the VLM round-trips dominate.
+        Full results go to analysis_results.json; the return value is a
+        summary per page (page_num, page_summary, num_images).
+        """
 
         os.makedirs(output_dir, exist_ok=True)
         images_dir = os.path.join(output_dir, "images")
         os.makedirs(images_dir, exist_ok=True)
 
-        doc = fitz.open(pdf_path)
-        total_pages = len(doc)
-        doc.close()
+        json_path = os.path.join(output_dir, "analysis_results.json")
+        tmp_path = json_path + ".tmp"
+
+        try:
+            with _fitz_lock:
+                total_pages = len(self.open_document(pdf_path))
+
+            print(f"Processing PDF: {pdf_path}")
+            print(f"Total pages: {total_pages}")
+            print("-" * 50)
+
+            if use_threads:
+                executor = ThreadPoolExecutor(max_workers=max_workers)
+                prepare, extract = self.prepare_page, self.extract_page_for_output
+            else:
+                executor = ProcessPoolExecutor(
+                    max_workers=max_workers,
+                    initializer=_init_worker,
+                    initargs=(self.api_key,)
+                )
+                prepare, extract = _prepare_page_worker, _extract_page_worker
+
+            cache = VLMCache()
+            vlm_results = {}  # cache key -> VLM analysis
+            waiting = {}      # cache key -> pages waiting for that analysis
+            batch = []        # cache misses for the next VLM request
+            vlm_requests = 0
+
+            # Results are streamed to the JSON file as pages finish, so memory stays
+            # flat however long the PDF is; only a short summary per page is kept
+            summaries = []
+            finished = {}  # done pages waiting for an earlier page
+            next_page = 0
+
+            extracted = {}   # page digest -> finished result of its first page
+            duplicates = {}  # page digest -> identical pages waiting for the first one
+
+            with open(tmp_path, "w", encoding="utf-8") as out:
+                out.write("[")
+
+                # Renders, VLM requests and extractions overlap: a VLM batch is sent as soon
+                # as enough pages are rendered, and a page is extracted as soon as its
+                # analysis is back. CPU stages run on `executor`, VLM requests on threads.
+                with executor, ThreadPoolExecutor(max_workers=VLM_CONCURRENCY) as vlm_pool:
+                    pending = {
+                        executor.submit(prepare, pdf_path, page_num): ("render", None)
+                        for page_num in range(total_pages)
+                    }
+
+                    def finish(result):
+                        nonlocal next_page
+
+                        # Write finished pages to the JSON array in page order
+                        finished[result["page_num"]] = result
+                        while next_page in finished:
+                            page = finished.pop(next_page)
+                            out.write(",\n" if next_page else "\n")
+                            out.write(json.dumps(page, indent=2, ensure_ascii=False))
+                            summaries.append({
+                                "page_num": next_page,
+                                "page_summary": page["page_summary"],
+                                "num_images": len(page["images"])
+                            })
+                            next_page += 1
+
+                    def finish_duplicate(result, page_num):
+                        # Same page content, so the same images (already saved) apply
+                        print(f"Page {page_num + 1} done (identical to page {result['page_num'] + 1})")
+                        finish(dict(result, page_num=page_num, images=[dict(img) for img in result["images"]]))
+
+                    def send_batch():
+                        nonlocal vlm_requests
+                        print(f"Analyzing {len(batch)} page(s) with VLM...")
+                        future = vlm_pool.submit(self.analyze_pages_with_vlm, [p["vlm_image"] for p in batch])
+                        pending[future] = ("vlm", list(batch))
+                        batch.clear()
+                        vlm_requests += 1
+
+                    while pending:
+                        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+
+                        for future in done:
+                            stage, pages = pending.pop(future)
+
+                            if stage == "render":
+                                page = future.result()
+                                digest = page["digest"]
+                                if digest in extracted:
+                                    finish_duplicate(extracted[digest], page["page_num"])
+                                    continue
+                                if digest in duplicates:
+                                    duplicates[digest].append(page["page_num"])
+                                    continue
+                                duplicates[digest] = []
+
+                                key = page["cache_key"]
+                                if key not in vlm_results:
+                                    hit = cache.get(key)
+                                    if hit is not None:
+                                        vlm_results[key] = hit
+
+                                if key in vlm_results:
+                                    pending[executor.submit(extract, page, vlm_results[key])] = ("extract", digest)
+                                elif key in waiting:
+                                    # Same page already queued for the VLM
+                                    waiting[key].append(page)
+                                else:
+                                    waiting[key] = [page]
+                                    batch.append(page)
+                                    if len(batch) == VLM_BATCH_SIZE:
+                                        send_batch()
+
+                            elif stage == "vlm":
+                                for page, result in zip(pages, future.result()):
+                                    key = page["cache_key"]
+                                    cache.put(key, result)
+                                    vlm_results[key] = result
+                                    for waiting_page in waiting.pop(key):
+                                        pending[executor.submit(extract, waiting_page, result)] = (
+                                            "extract", waiting_page["digest"]
+                                        )
+
+                            else:
+                                digest = pages
+                                result = future.result()
+                                page_num = result["page_num"]
+
+                                # Save extracted images
+                                for idx, img_data in enumerate(result["images"]):
+                                    img_filename = f"page_{page_num + 1}_img_{idx + 1}{img_data.pop('ext')}"
+                                    img_path = os.path.join(images_dir, img_filename)
+
+                                    with open(img_path, 'wb') as f:
+                                        f.write(img_data.pop("image_bytes"))
+
+                                    img_data["saved_path"] = img_path
+
+                                print(f"Page {page_num + 1} done")
+                                finish(result)
+
+                                extracted[digest] = result
+                                for duplicate_num in duplicates.pop(digest):
+                                    finish_duplicate(result, duplicate_num)
+
+                        # No more renders can fill a partial batch
+                        if batch and all(stage != "render" for stage, _ in pending.values()):
+                            send_batch()
+
+                out.write("\n]\n")
+
+            os.replace(tmp_path, json_path)
+        except BaseException:
+            # A failed run leaves no partial analysis_results.json.tmp behind
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        finally:
+            self.close_documents()
+
+        if vlm_requests:
+            cache.save()
 
-        print(f"Processing PDF: {pdf_path}")
-        print(f"Total pages: {total_pages}")
         print("-" * 50)
+        print(f"VLM requests: {vlm_requests}")
+        print(f"\nResults saved to: {json_path}")
+        print(f"Images saved to: {images_dir}")
 
-        all_results = []
+        return summaries
 
-        for page_num in range(total_pages):
-            result = self.process_page(pdf_path, page_num)
 
-            # Save extracted images (optimized)
-            for idx, img_data in enumerate(result["images"]):
-                # Optimize image (resize + WebP compression)
-                optimized_bytes, ext = optimize_image(img_data["image"])
-                img_filename = f"page_{page_num + 1}_img_{idx + 1}{ext}"
-                img_path = os.path.join(images_dir, img_filename)
+# ============================================================================
+# Process pool workers
+# ============================================================================
+_worker_analyzer: Optional[PDFAnalyzer] = None
 
-                with open(img_path, 'wb') as f:
-                    f.write(optimized_bytes)
 
-                img_data["saved_path"] = img_path
-                del img_data["image"]
+def _init_worker(api_key: Optional[str]):
+    """Create one analyzer (and API client) per worker process"""
+    global _worker_analyzer
+    _worker_analyzer = PDFAnalyzer(api_key)
 
-            del result["page_image"]
-            all_results.append(result)
-            print("-" * 50)
 
-        # Save JSON
-        json_path = os.path.join(output_dir, "analysis_results.json")
-        with open(json_path, "w", encoding="utf-8") as f:
-            json.dump(all_results, f, indent=2, ensure_ascii=False)
+def _prepare_page_worker(pdf_path: str, page_num: int) -> Dict:
+    """Render and detect blocks for a page in a worker process"""
+    return _worker_analyzer.prepare_page(pdf_path, page_num)
 
-        print(f"\nResults saved to: {json_path}")
-        print(f"Images saved to: {images_dir}")
 
-        return all_results
+def _extract_page_worker(prepared: Dict, vlm_result: Dict) -> Dict:
+    """Extract and encode a page's images in a worker process"""
+    return _worker_analyzer.extract_page_for_output(prepared, vlm_result)
 
 
 def main():
@@ -539,8 +1199,8 @@ def main():
     for result in results:
         print(f"\nPage {result['page_num'] + 1}:")
         print(f"  Summary: {result['page_summary'][:100]}...")
-        print(f"  Images: {len(result['images'])}")
-        total_images += len(result["images"])
+        print(f"  Images: {result['num_images']}")
+        total_images += result["num_images"]
 
     print(f"\nTotal images extracted: {total_images}")
 
@@ -8,128 +8,66 @@ Multi-stage approach:
 4. Robust image matching (page-wise priority + description matching)
 """
 
-import json
+import asyncio
+import functools
+import hashlib
+import importlib.util
 import os
 import re
-from typing import Dict, List, Optional, Tuple
-from groq import Groq
+import tempfile
+from dataclasses import dataclass
+from itertools import islice
+from operator import attrgetter
+from typing import Dict, List, Optional, Tuple, Union
+import httpx
+import numpy as np
+import orjson
+from groq import Groq, AsyncGroq, DefaultHttpxClient, DefaultAsyncHttpxClient
 from dotenv import load_dotenv
 
-load_dotenv()
-
+try:
+    import fcntl
+except ImportError:  # Windows: concurrent cache saves are not serialized
+    fcntl = None
 
-class PresentationGenerator:
-    def __init__(self, groq_api_key: Optional[str] = None):
-        """Initialize with Groq client"""
-        api_key = groq_api_key or os.getenv("GROQ_API_KEY")
-        self.client = Groq(api_key=api_key)
-        self.llm_model = "openai/gpt-oss-120b"
+try:
+    from numba import njit  # optional: JIT for keyword hash filtering
+except ImportError:
+    njit = None
 
-    def load_analysis_json(self, json_path: str) -> List[Dict]:
-        """Load analysis JSON"""
-        with open(json_path, "r", encoding="utf-8") as f:
-            return json.load(f)
-
-    def filter_small_images(self, analysis_data: List[Dict], min_area: int = 15000) -> List[Dict]:
-        """Filter out small images (icons, logos)"""
-        filtered_data = []
-        removed = 0
-
-        for page in analysis_data:
-            filtered_page = page.copy()
-            filtered_images = []
-
-            for img in page.get('images', []):
-                bbox = img.get('actual_bbox', [0, 0, 0, 0])
-                if len(bbox) == 4:
-                    width = bbox[2] - bbox[0]
-                    height = bbox[3] - bbox[1]
-                    area = width * height
-
-                    if area >= min_area:
-                        filtered_images.append(img)
-                    else:
-                        removed += 1
-                else:
-                    filtered_images.append(img)
-
-            filtered_page['images'] = filtered_images
-            filtered_data.append(filtered_page)
-
-        if removed > 0:
-            print(f"  Filtered {removed} small images")
+try:
+    import json_repair  # optional: salvages near-valid JSON from the LLM
+except ImportError:
+    json_repair = None
 
-        return filtered_data
-
-    def _call_llm(self, system_prompt: str, user_prompt: str, temperature: float = 0.3, max_tokens: int = 4096) -> str:
-        """Generic LLM call wrapper"""
-        try:
-            completion = self.client.chat.completions.create(
-                model=self.llm_model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=temperature,
-                max_completion_tokens=max_tokens
-            )
-            return completion.choices[0].message.content
-        except Exception as e:
-            print(f"LLM Error: {e}")
-            return None
-
-    def _parse_json_response(self, response: str) -> Optional[Dict]:
-        """Parse JSON from LLM response"""
-        if not response:
-            return None
-
-        # Try to extract JSON from markdown code blocks
-        if "```json" in response:
-            response = response.split("```json")[1].split("```")[0]
-        elif "```" in response:
-            response = response.split("```")[1].split("```")[0]
-
-        try:
-            return json.loads(response.strip())
-        except json.JSONDecodeError as e:
-            print(f"JSON Parse Error: {e}")
-            return None
-
-    # =========================================================================
-    # STAGE 1: Analyze Document Themes
-    # =========================================================================
-    def analyze_document_themes(self, analysis_data: List[Dict]) -> Dict:
-        """
-        First LLM call - Analyze all pages and identify main themes/topics.
-        Returns theme clusters with associated page numbers.
-        """
-        print("  Stage 1: Analyzing document themes...")
-
-        # Prepare condensed page summaries
-        page_summaries = []
-        for page in analysis_data:
-            page_num = page['page_num'] + 1
-            summary = page['page_summary']
-            key_points = "; ".join(page['key_points'][:5])  # First 5 key points
-            image_count = len(page.get('images', []))
-
-            page_summaries.append(
-                f"PAGE {page_num}: {summary}\n  Key points: {key_points}\n  Images: {image_count}"
-            )
+load_dotenv()
 
-        pages_text = "\n\n".join(page_summaries)
+# Section content calls are independent, so they run concurrently (bounded for rate limits)
+SECTION_CONCURRENCY = 8
 
-        system_prompt = "You are a document analyst. Analyze content and identify themes. Output valid JSON only."
+# One pooled connection set per client so concurrent section calls reuse TLS
+# sessions; HTTP/2 multiplexing is used when the optional h2 package is installed
+GROQ_HTTP_LIMITS = httpx.Limits(max_keepalive_connections=32, max_connections=32)
+GROQ_HTTP2 = importlib.util.find_spec("h2") is not None
 
-        user_prompt = f"""Analyze this document and identify the main themes/topics.
+# Completion budgets per stage (gpt-oss counts its reasoning tokens here too,
+# so these leave headroom over the JSON answers themselves)
+THEMES_MAX_TOKENS = 2048
+STRUCTURE_MAX_TOKENS = 2560
+PLAN_MAX_TOKENS = 4096  # themes + structure in one call
+SECTION_MAX_TOKENS = 1536
 
-DOCUMENT PAGES:
-{pages_text}
+# LLM responses are cached on disk by exact prompt, so re-running on the same
+# analysis does not pay for the same completions again
+LLM_CACHE_PATH = os.path.join("output", ".llm_cache", "llm_cache.json")
+LLM_CACHE_MAX_ENTRIES = 5000  # oldest completions are dropped beyond this
 
-Task:
-Identify distinct themes based on content. Be DETAILED - identify MANY themes.
+# Themes and sections are also kept per analysis fingerprint (page summaries,
+# first key points, image counts), so re-runs skip planning entirely
+PLAN_CACHE_DIR = os.path.join("output", ".llm_cache", "plans")
 
-CRITICAL PRODUCT SEPARATION RULES:
+# Planning rules, shared by the separate theme/structure prompts and the combined one
+THEME_RULES = """CRITICAL PRODUCT SEPARATION RULES:
 1. DETECT PRODUCT PAGES: If a page showcases a specific PRODUCT, PRODUCT TYPE, or PRODUCT VARIANT:
    - Look for product names, model numbers, product-specific features
    - Each distinct product MUST become its own separate theme
@@ -175,82 +113,9 @@ CRITICAL RULES FOR NON-PRODUCT (GENERIC) THEMES:
 7. TARGET THEME COUNT:
    - For documents with 10+ pages: identify 8-15 themes minimum
    - Product themes: one per product
-   - Non-product themes: 5-8 themes covering different topics
-
-Output JSON:
-{{
-  "document_title": "Main document title/subject",
-  "document_type": "brochure/catalog/manual/etc",
-  "themes": [
-    {{
-      "theme_id": 1,
-      "theme_name": "Specific topic name (not generic like 'Overview')",
-      "theme_description": "What this theme covers",
-      "page_numbers": [1, 2],
-      "content_type": "product/introduction/features/technology/energy/design/warranty/sustainability/contact",
-      "is_product_theme": false,
-      "priority": "high/medium/low"
-    }}
-  ]
-}}
-
-IMPORTANT:
-- Product themes: strict isolation (one product per theme)
-- Non-product themes: break into MANY specific themes (features, technology, warranty, etc. are SEPARATE)
-- Aim for 8-15 total themes for comprehensive coverage
-- Return ONLY valid JSON"""
-
-        response = self._call_llm(system_prompt, user_prompt, temperature=0.2)
-        result = self._parse_json_response(response)
-
-        # Ensure is_product_theme flag exists for all themes
-        if result and 'themes' in result:
-            for theme in result['themes']:
-                if 'is_product_theme' not in theme:
-                    # Fallback: single-page themes with content_type 'product' are likely products
-                    theme['is_product_theme'] = (
-                        theme.get('content_type') == 'product' or
-                        (len(theme.get('page_numbers', [])) == 1 and
-                         theme.get('content_type') not in ['overview', 'introduction', 'conclusion', 'contact', 'warranty'])
-                    )
-
-        return result
-
-    # =========================================================================
-    # STAGE 2: Create Presentation Structure
-    # =========================================================================
-    def create_presentation_structure(self, themes: Dict, analysis_data: List[Dict]) -> List[Dict]:
-        """
-        Second LLM call - Create dynamic presentation structure based on themes.
-        Returns list of section definitions.
-        """
-        print("  Stage 2: Creating presentation structure...")
-
-        # Build page content reference
-        page_content = {}
-        for page in analysis_data:
-            page_num = page['page_num'] + 1
-            page_content[page_num] = {
-                'summary': page['page_summary'],
-                'key_points': page['key_points'],
-                'image_count': len(page.get('images', []))
-            }
-
-        system_prompt = "You are a presentation architect. Design clear, logical presentation structures. Output valid JSON only."
+   - Non-product themes: 5-8 themes covering different topics"""
 
-        user_prompt = f"""Based on the document themes, create a presentation structure.
-
-DOCUMENT INFO:
-Title: {themes.get('document_title', 'Unknown')}
-Type: {themes.get('document_type', 'Unknown')}
-
-IDENTIFIED THEMES:
-{json.dumps(themes.get('themes', []), indent=2)}
-
-PAGE CONTENT REFERENCE:
-{json.dumps(page_content, indent=2)}
-
-CRITICAL RULES FOR PRODUCT SECTIONS:
+SECTION_RULES = """CRITICAL RULES FOR PRODUCT SECTIONS:
 
 1. ONE PRODUCT = ONE SECTION (OR MORE):
    - Each product theme MUST become its own dedicated section
@@ -292,7 +157,56 @@ CRITICAL RULES FOR NON-PRODUCT (GENERIC) SECTIONS:
 6. TARGET SECTION COUNT:
    - For documents with 10+ pages: aim for 8-15 sections
    - Generic content should have at least 4-6 sections
-   - Product content: 1 section per product
+   - Product content: 1 section per product"""
+
+
+# User prompt templates, filled with str.format_map (literal JSON braces are doubled)
+_THEMES_PROMPT_TMPL = """Analyze this document and identify the main themes/topics.
+
+DOCUMENT PAGES:
+{pages_text}
+
+Task:
+Identify distinct themes based on content. Be DETAILED - identify MANY themes.
+
+{theme_rules}
+
+Output JSON:
+{{
+  "document_title": "Main document title/subject",
+  "document_type": "brochure/catalog/manual/etc",
+  "themes": [
+    {{
+      "theme_id": 1,
+      "theme_name": "Specific topic name (not generic like 'Overview')",
+      "theme_description": "What this theme covers",
+      "page_numbers": [1, 2],
+      "content_type": "product/introduction/features/technology/energy/design/warranty/sustainability/contact",
+      "is_product_theme": false,
+      "priority": "high/medium/low"
+    }}
+  ]
+}}
+
+IMPORTANT:
+- Product themes: strict isolation (one product per theme)
+- Non-product themes: break into MANY specific themes (features, technology, warranty, etc. are SEPARATE)
+- Aim for 8-15 total themes for comprehensive coverage
+- Return ONLY valid JSON"""
+
+_STRUCTURE_PROMPT_TMPL = """Based on the document themes, create a presentation structure.
+
+DOCUMENT INFO:
+Title: {document_title}
+Type: {document_type}
+
+IDENTIFIED THEMES:
+{themes_json}
+
+PAGE CONTENT REFERENCE:
+{page_content_json}
+
+{section_rules}
 
 Output JSON:
 {{
@@ -320,120 +234,76 @@ IMPORTANT:
 
 Return ONLY valid JSON."""
 
-        response = self._call_llm(system_prompt, user_prompt, temperature=0.2)
-        result = self._parse_json_response(response)
-
-        if result:
-            sections = result.get('sections', [])
-            # Ensure is_product_section flag exists (default to False for generic PDFs)
-            for section in sections:
-                if 'is_product_section' not in section:
-                    # Fallback: check if section_type is 'product' or has single source page
-                    section['is_product_section'] = (
-                        section.get('section_type') == 'product' or
-                        (len(section.get('source_pages', [])) == 1 and
-                         section.get('section_type') not in ['intro', 'overview', 'conclusion', 'contact'])
-                    )
-            return sections
-        return []
-
-    # =========================================================================
-    # STAGE 3: Build Page-Image Index
-    # =========================================================================
-    def build_page_image_index(self, analysis_data: List[Dict]) -> Dict:
-        """
-        Build comprehensive index of images organized by page.
-        Returns: {page_num: [image_info, ...]}
-        """
-        page_image_index = {}
-
-        for page in analysis_data:
-            page_num = page['page_num'] + 1
-            images = []
-
-            for img in page.get('images', []):
-                images.append({
-                    'path': img['saved_path'],
-                    'description': img['description'],
-                    'relevance': img.get('relevance', ''),
-                    'keywords': self._extract_keywords(img['description'] + ' ' + img.get('relevance', ''))
-                })
-
-            page_image_index[page_num] = images
-
-        return page_image_index
+_PLAN_PROMPT_TMPL = """Analyze this document, identify its main themes/topics, then create a presentation structure from those themes.
 
-    def _extract_keywords(self, text: str) -> List[str]:
-        """Extract meaningful keywords from text"""
-        # Convert to lowercase and extract words
-        text = text.lower()
-        words = re.findall(r'\b[a-z]{3,}\b', text)
+DOCUMENT PAGES:
+{pages_text}
 
-        # Filter common words
-        stopwords = {'the', 'and', 'for', 'with', 'this', 'that', 'from', 'are', 'was', 'were',
-                     'been', 'being', 'have', 'has', 'had', 'does', 'did', 'will', 'would',
-                     'could', 'should', 'may', 'might', 'must', 'shall', 'can', 'need', 'into',
-                     'through', 'during', 'before', 'after', 'above', 'below', 'between',
-                     'under', 'again', 'further', 'then', 'once', 'here', 'there', 'when',
-                     'where', 'why', 'how', 'all', 'each', 'few', 'more', 'most', 'other',
-                     'some', 'such', 'only', 'own', 'same', 'than', 'too', 'very', 'just',
-                     'also', 'now', 'image', 'shows', 'showing', 'shown', 'display', 'displays',
-                     'featuring', 'features', 'includes', 'including', 'appears', 'visible'}
+STEP 1 - THEMES:
+Identify distinct themes based on content. Be DETAILED - identify MANY themes.
 
-        keywords = [w for w in words if w not in stopwords]
-        return list(set(keywords))
+{theme_rules}
 
-    # =========================================================================
-    # STAGE 4: Generate Section Content
-    # ========================================================================
-    def generate_section_content(self, section: Dict, analysis_data: List[Dict],
-                                  page_image_index: Dict) -> Dict:
-        """
-        Per-section LLM call - Generate content for a single section.
-        Uses only relevant pages for focused generation.
-        """
-        source_pages = section.get('source_pages', [])
+STEP 2 - PRESENTATION STRUCTURE:
+Turn the themes into presentation sections.
 
-        # Gather content from source pages only
-        page_contents = []
-        available_images = []
+{section_rules}
 
-        for page in analysis_data:
-            page_num = page['page_num'] + 1
-            if page_num in source_pages:
-                page_contents.append({
-                    'page': page_num,
-                    'summary': page['page_summary'],
-                    'key_points': page['key_points']
-                })
+Output JSON:
+{{
+  "document_title": "Main document title/subject",
+  "document_type": "brochure/catalog/manual/etc",
+  "themes": [
+    {{
+      "theme_id": 1,
+      "theme_name": "Specific topic name (not generic like 'Overview')",
+      "theme_description": "What this theme covers",
+      "page_numbers": [1, 2],
+      "content_type": "product/introduction/features/technology/energy/design/warranty/sustainability/contact",
+      "is_product_theme": false,
+      "priority": "high/medium/low"
+    }}
+  ],
+  "presentation_title": "Title for the presentation",
+  "sections": [
+    {{
+      "section_id": 1,
+      "section_type": "intro/overview/feature/product/technical/lifestyle/warranty/sustainability/conclusion",
+      "title": "Section title (use product name for product sections)",
+      "purpose": "What this section should communicate",
+      "source_pages": [1, 2],
+      "is_product_section": false,
+      "content_focus": ["ONE main topic - not multiple combined"],
+      "image_priority": "lifestyle/technical/product/diagram",
+      "target_image_count": 2
+    }}
+  ]
+}}
 
-                # Add images from this page
-                for img in page_image_index.get(page_num, []):
-                    available_images.append({
-                        'page': page_num,
-                        'path': img['path'],
-                        'description': img['description'],
-                        'relevance': img['relevance']
-                    })
+IMPORTANT:
+- Product themes and sections: strict isolation (one product per theme, only that product's pages)
+- Non-product themes: break into MANY specific themes (features, technology, warranty, etc. are SEPARATE)
+- Non-product sections: break into MULTIPLE detailed sections, not one mega-section
+- Aim for 8-15 themes and 8-15 sections for comprehensive coverage
 
-        system_prompt = "You are a content writer creating customer-friendly presentation content. Output valid JSON only."
+Return ONLY valid JSON."""
 
-        is_product_section = section.get('is_product_section', False)
+PRODUCT_SECTION_RULE = "PRODUCT SECTION RULE: This is a product-specific section. Content and images must be ONLY about this specific product. Do not reference other products."
 
-        user_prompt = f"""Write content for this presentation section.
+_SECTION_PROMPT_TMPL = """Write content for this presentation section.
 
 SECTION INFO:
-Title: {section.get('title', 'Untitled')}
-Type: {section.get('section_type', 'general')}
-Purpose: {section.get('purpose', '')}
-Content Focus: {section.get('content_focus', [])}
+Title: {title}
+Type: {section_type}
+Purpose: {purpose}
+Content Focus: {content_focus}
 Is Product Section: {is_product_section}
 
 SOURCE PAGE CONTENT:
-{json.dumps(page_contents, indent=2)}
+{page_contents_json}
 
 AVAILABLE IMAGES (from source pages ONLY):
-{json.dumps(available_images, indent=2)}
+{available_images_json}
 
 Write the section content and select images.
 
@@ -442,9 +312,9 @@ CRITICAL IMAGE SELECTION RULES:
 2. These images are ALREADY filtered to source pages - do NOT imagine other images
 3. Use the EXACT path as shown in the available images
 4. For product sections: images MUST be from that product's page only
-5. Select up to {section.get('target_image_count', 2)} images maximum
+5. Select up to {target_image_count} images maximum
 
-{"PRODUCT SECTION RULE: This is a product-specific section. Content and images must be ONLY about this specific product. Do not reference other products." if is_product_section else ""}
+{product_rule}
 
 Output JSON:
 {{
@@ -466,12 +336,654 @@ VALIDATION:
 
 Return ONLY valid JSON."""
 
-        response = self._call_llm(system_prompt, user_prompt, temperature=0.3)
+
+# Keyword extraction for image matching
+_WORD_RE = re.compile(r'\b[a-z]{3,}\b')
+_STOPWORDS = frozenset({
+    'the', 'and', 'for', 'with', 'this', 'that', 'from', 'are', 'was', 'were',
+    'been', 'being', 'have', 'has', 'had', 'does', 'did', 'will', 'would',
+    'could', 'should', 'may', 'might', 'must', 'shall', 'can', 'need', 'into',
+    'through', 'during', 'before', 'after', 'above', 'below', 'between',
+    'under', 'again', 'further', 'then', 'once', 'here', 'there', 'when',
+    'where', 'why', 'how', 'all', 'each', 'few', 'more', 'most', 'other',
+    'some', 'such', 'only', 'own', 'same', 'than', 'too', 'very', 'just',
+    'also', 'now', 'image', 'shows', 'showing', 'shown', 'display', 'displays',
+    'featuring', 'features', 'includes', 'including', 'appears', 'visible'
+})
+
+
+def _fnv1a_32(word: str) -> int:
+    """32-bit FNV-1a hash of a word"""
+    h = 0x811C9DC5
+    for byte in word.encode("utf-8"):
+        h = ((h ^ byte) * 0x01000193) & 0xFFFFFFFF
+    return h
+
+
+# Sorted stopword hashes, for filtering hashed words
+_STOP_HASHES = np.unique(np.fromiter((_fnv1a_32(w) for w in _STOPWORDS), dtype=np.uint32))
+
+
+def dedup_filter_numpy(hashes: np.ndarray, stop: np.ndarray) -> np.ndarray:
+    """Sorted unique hashes that are not in stop (sorted)"""
+    return np.setdiff1d(hashes, stop)
+
+
+def dedup_filter_sweep(hashes, stop):
+    """dedup_filter_numpy as one merge pass over sorted hashes; written for numba"""
+    hashes = np.sort(hashes)
+    out = np.empty_like(hashes)
+    n = 0
+    j = 0
+    for i in range(hashes.size):
+        h = hashes[i]
+        if i > 0 and h == hashes[i - 1]:
+            continue
+        while j < stop.size and stop[j] < h:
+            j += 1
+        if j < stop.size and stop[j] == h:
+            continue
+        out[n] = h
+        n += 1
+    return out[:n]
+
+
+dedup_filter = njit(cache=True)(dedup_filter_sweep) if njit else dedup_filter_numpy
+
+
+def overlap_counts_numpy(content: np.ndarray, flat: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """Hashes shared with content for each segment flat[offsets[k]:offsets[k + 1]]"""
+    owner = np.repeat(np.arange(offsets.size - 1), np.diff(offsets))
+    hits = np.isin(flat, content)
+    return np.bincount(owner, weights=hits, minlength=offsets.size - 1).astype(np.int64)
+
+
+def overlap_counts_sweep(content, flat, offsets):
+    """overlap_counts_numpy as a merge of sorted unique arrays; written for numba"""
+    n = offsets.size - 1
+    out = np.zeros(n, np.int64)
+    for k in range(n):
+        i = 0
+        j = offsets[k]
+        end = offsets[k + 1]
+        count = 0
+        while i < content.size and j < end:
+            if content[i] < flat[j]:
+                i += 1
+            elif content[i] > flat[j]:
+                j += 1
+            else:
+                count += 1
+                i += 1
+                j += 1
+        out[k] = count
+    return out
+
+
+overlap_counts = njit(cache=True)(overlap_counts_sweep) if njit else overlap_counts_numpy
+
+
+@functools.lru_cache(maxsize=4096)
+def _keyword_hashes_cached(text: str) -> np.ndarray:
+    """Keywords of text as sorted unique uint32 hashes (read-only, cached)"""
+    words = _WORD_RE.findall(text.lower())
+    hashes = dedup_filter(np.fromiter(map(_fnv1a_32, words), dtype=np.uint32, count=len(words)), _STOP_HASHES)
+    hashes.setflags(write=False)
+    return hashes
+
+
+def prompt_json(obj) -> str:
+    """Compact JSON for embedding in a prompt (fewer tokens than indented)"""
+    return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+
+
+@dataclass(slots=True)
+class ScoredImage:
+    """A candidate image for a section, scored by keyword overlap"""
+    path: str
+    page: int
+    score: int
+    description: str
+
+
+class JSONStreamBuffer:
+    """Collects streamed response text and notices when the first JSON object closes
+
+    Lets a streamed call stop reading as soon as the JSON answer is complete,
+    instead of waiting for any prose the model adds after it.
+    """
+
+    def __init__(self):
+        self.parts: List[str] = []
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.complete = False
+
+    def feed(self, text: str) -> bool:
+        """Add a chunk; returns True once the top-level object has closed"""
+        for i, ch in enumerate(text):
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == '\\':
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"' and self.depth:
+                self.in_string = True
+            elif ch == '{':
+                self.depth += 1
+            elif ch == '}' and self.depth:
+                self.depth -= 1
+                if not self.depth:
+                    self.complete = True
+                    self.parts.append(text[:i + 1])
+                    return True
+        self.parts.append(text)
+        return False
+
+    def text(self) -> str:
+        return "".join(self.parts)
+
+
+class LLMCache:
+    """Disk-backed cache of LLM completions keyed by prompt, model and temperature"""
+
+    def __init__(self, path: str = LLM_CACHE_PATH):
+        self.path = path
+        self.entries: Dict[str, str] = self.load(path)
+        self.added: Dict[str, str] = {}  # completions not saved yet
+
+    @staticmethod
+    def load(path: str) -> Dict[str, str]:
+        """Read a cache file ({} if missing or unreadable)"""
+        if not os.path.exists(path):
+            return {}
+        try:
+            with open(path, "rb") as f:
+                return orjson.loads(f.read())
+        except (OSError, orjson.JSONDecodeError) as e:
+            print(f"Ignoring unreadable LLM cache {path}: {e}")
+            return {}
+
+    @staticmethod
+    def key(system_prompt: str, user_prompt: str, model: str, temperature: float) -> str:
+        """Cache key for one completion request"""
+        raw = f"{system_prompt}\x00{user_prompt}\x00{model}|{temperature}"
+        return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached completion text, if any"""
+        return self.entries.get(key)
+
+    def put(self, key: str, response: Optional[str]):
+        """Store a completion (failed calls are not cached)"""
+        if response:
+            self.entries[key] = response
+            self.added[key] = response
+
+    def save(self):
+        """Merge the completions added since the last save into the cache file
+
+        Several generators (one per processing worker) may save at once: the
+        merge runs under an exclusive lock on <path>.lock and writes its own
+        temp file, so no save loses another's entries. A failed save is only
+        logged, the cache being an optimization.
+        """
+        if not self.added:
+            return
+        cache_dir = os.path.dirname(self.path)
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            with open(self.path + ".lock", "a") as lock:
+                if fcntl:
+                    fcntl.flock(lock, fcntl.LOCK_EX)
+                entries = self.load(self.path)
+                for key, response in self.added.items():
+                    entries.pop(key, None)  # re-added entries count as newest
+                    entries[key] = response
+                # Entries are oldest first; keep the newest LLM_CACHE_MAX_ENTRIES
+                for key in list(islice(entries, max(0, len(entries) - LLM_CACHE_MAX_ENTRIES))):
+                    del entries[key]
+                fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+                try:
+                    with os.fdopen(fd, "wb") as f:
+                        f.write(orjson.dumps(entries))
+                    os.replace(tmp_path, self.path)
+                except BaseException:
+                    os.remove(tmp_path)
+                    raise
+        except (OSError, TypeError) as e:
+            print(f"Could not save LLM cache {self.path}: {e}")
+            return
+        self.entries = entries
+        self.added = {}
+
+
+class PresentationGenerator:
+    def __init__(self, groq_api_key: Optional[str] = None, use_cache: bool = True):
+        """Initialize with Groq client"""
+        api_key = groq_api_key or os.getenv("GROQ_API_KEY")
+        self.api_key = api_key
+        self.client = Groq(
+            api_key=api_key,
+            http_client=DefaultHttpxClient(limits=GROQ_HTTP_LIMITS, http2=GROQ_HTTP2)
+        )
+        self.aclient = None  # AsyncGroq, open while sections are generated
+        self.llm_model = "openai/gpt-oss-120b"
+        self.cache = LLMCache() if use_cache else None
+
+    def load_analysis_json(self, json_path: str) -> List[Dict]:
+        """Load analysis JSON"""
+        with open(json_path, "rb") as f:
+            return orjson.loads(f.read())
+
+    def filter_small_images(self, analysis_data: List[Dict], min_area: int = 15000,
+                            in_place: bool = False) -> List[Dict]:
+        """Filter out small images (icons, logos)
+
+        Pages that lose no images are returned as-is; with in_place=True the
+        others are updated in place too instead of being copied.
+        """
+        images = [img for page in analysis_data for img in page.get('images', [])]
+
+        # Areas of all images at once; images without a 4-value bbox are always kept
+        bbox_list = [img.get('actual_bbox', [0, 0, 0, 0]) for img in images]
+        has_bbox = np.array([len(bbox) == 4 for bbox in bbox_list], dtype=bool)
+        bboxes = np.array(
+            [bbox if len(bbox) == 4 else (0, 0, 0, 0) for bbox in bbox_list], dtype=np.float64
+        ).reshape(-1, 4)
+        areas = (bboxes[:, 2] - bboxes[:, 0]) * (bboxes[:, 3] - bboxes[:, 1])
+        keep = (areas >= min_area) | ~has_bbox
+        removed = int((~keep).sum())
+
+        filtered_data = []
+        start = 0
+        for page in analysis_data:
+            page_images = page.get('images', [])
+            page_keep = keep[start:start + len(page_images)]
+            start += len(page_images)
+
+            if page_keep.all():
+                filtered_data.append(page)
+                continue
+
+            filtered_images = [img for img, k in zip(page_images, page_keep) if k]
+            if in_place:
+                page['images'] = filtered_images
+                filtered_data.append(page)
+            else:
+                filtered_data.append({**page, 'images': filtered_images})
+
+        if removed > 0:
+            print(f"  Filtered {removed} small images")
+
+        return filtered_data
+
+    def _call_llm(self, system_prompt: str, user_prompt: str, temperature: float = 0.3, max_tokens: int = 4096) -> str:
+        """Generic LLM call wrapper
+
+        The response is streamed and reading stops once the JSON answer closes.
+        """
+        key = LLMCache.key(system_prompt, user_prompt, self.llm_model, temperature)
+        cached = self.cache.get(key) if self.cache else None
+        if cached is not None and self._is_complete_json(cached):
+            return cached
+
+        try:
+            stream = self.client.chat.completions.create(
+                model=self.llm_model,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt}
+                ],
+                temperature=temperature,
+                max_completion_tokens=max_tokens,
+                stream=True
+            )
+            buffer = JSONStreamBuffer()
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if buffer.feed(chunk.choices[0].delta.content):
+                        break
+            stream.close()
+            response = buffer.text()
+        except Exception as e:
+            print(f"LLM Error: {e}")
+            return None
+
+        if self.cache and self._is_complete_json(response):
+            self.cache.put(key, response)
+        return response
+
+    async def _acall_llm(self, system_prompt: str, user_prompt: str, temperature: float = 0.3, max_tokens: int = 4096) -> str:
+        """Async LLM call wrapper (same as _call_llm, on self.aclient)"""
+        key = LLMCache.key(system_prompt, user_prompt, self.llm_model, temperature)
+        cached = self.cache.get(key) if self.cache else None
+        if cached is not None and self._is_complete_json(cached):
+            return cached
+
+        try:
+            stream = await self.aclient.chat.completions.create(
+                model=self.llm_model,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt}
+                ],
+                temperature=temperature,
+                max_completion_tokens=max_tokens,
+                stream=True
+            )
+            buffer = JSONStreamBuffer()
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if buffer.feed(chunk.choices[0].delta.content):
+                        break
+            await stream.close()
+            response = buffer.text()
+        except Exception as e:
+            print(f"LLM Error: {e}")
+            return None
+
+        if self.cache and self._is_complete_json(response):
+            self.cache.put(key, response)
+        return response
+
+    @staticmethod
+    def _json_candidate(response: str) -> Tuple[int, str]:
+        """Start offset and text of the outermost {...} in a response (the whole text if none)"""
+        start = response.find('{')
+        end = response.rfind('}')
+        return start, response[start:end + 1] if 0 <= start < end else response
+
+    def _is_complete_json(self, response: Optional[str]) -> bool:
+        """Whether a response holds a JSON object that parses without repair
+
+        Only these are cached: a cut-off or prose-only answer would otherwise be
+        replayed on every later run.
+        """
+        if not response:
+            return False
+        try:
+            return isinstance(orjson.loads(self._json_candidate(response)[1]), dict)
+        except orjson.JSONDecodeError:
+            return False
+
+    def _parse_json_response(self, response: str) -> Optional[Dict]:
+        """Parse JSON from LLM response
+
+        The outermost {...} is parsed, which covers bare JSON, markdown code
+        blocks and prose around the object alike.
+        """
+        if not response:
+            return None
+
+        start, candidate = self._json_candidate(response)
+
+        try:
+            return orjson.loads(candidate)
+        except orjson.JSONDecodeError as e:
+            if json_repair is not None:
+                # Unterminated strings, trailing commas, a cut-off answer...
+                repaired = json_repair.loads(response[max(start, 0):])
+                if isinstance(repaired, dict) and repaired:
+                    print(f"JSON Parse Error: {e} (repaired)")
+                    return repaired
+            print(f"JSON Parse Error: {e}")
+            return None
+
+    # =========================================================================
+    # STAGE 1: Analyze Document Themes
+    # =========================================================================
+    def _pages_text(self, analysis_data: List[Dict]) -> str:
+        """Condensed page summaries for the planning prompts"""
+        page_summaries = []
+        for page in analysis_data:
+            page_num = page['page_num'] + 1
+            summary = page['page_summary']
+            key_points = "; ".join(page['key_points'][:5])  # First 5 key points
+            image_count = len(page.get('images', []))
+
+            page_summaries.append(
+                f"PAGE {page_num}: {summary}\n  Key points: {key_points}\n  Images: {image_count}"
+            )
+
+        return "\n\n".join(page_summaries)
+
+    def analyze_document_themes(self, analysis_data: List[Dict]) -> Dict:
+        """
+        First LLM call - Analyze all pages and identify main themes/topics.
+        Returns theme clusters with associated page numbers.
+        """
+        print("  Stage 1: Analyzing document themes...")
+
+        pages_text = self._pages_text(analysis_data)
+
+        system_prompt = "You are a document analyst. Analyze content and identify themes. Output valid JSON only."
+
+        user_prompt = _THEMES_PROMPT_TMPL.format_map({
+            'pages_text': pages_text,
+            'theme_rules': THEME_RULES
+        })
+
+        response = self._call_llm(system_prompt, user_prompt, temperature=0.2, max_tokens=THEMES_MAX_TOKENS)
+        result = self._parse_json_response(response)
+
+        if result and 'themes' in result:
+            self._ensure_theme_flags(result['themes'])
+
+        return result
+
+    def _ensure_theme_flags(self, themes: List[Dict]):
+        """Ensure is_product_theme flag exists for all themes"""
+        for theme in themes:
+            if 'is_product_theme' not in theme:
+                # Fallback: single-page themes with content_type 'product' are likely products
+                theme['is_product_theme'] = (
+                    theme.get('content_type') == 'product' or
+                    (len(theme.get('page_numbers', [])) == 1 and
+                     theme.get('content_type') not in ['overview', 'introduction', 'conclusion', 'contact', 'warranty'])
+                )
+
+    # =========================================================================
+    # STAGE 2: Create Presentation Structure
+    # =========================================================================
+    def create_presentation_structure(self, themes: Dict, analysis_data: List[Dict]) -> List[Dict]:
+        """
+        Second LLM call - Create dynamic presentation structure based on themes.
+        Returns list of section definitions.
+        """
+        print("  Stage 2: Creating presentation structure...")
+
+        # Build page content reference
+        page_content = {}
+        for page in analysis_data:
+            page_num = page['page_num'] + 1
+            # Key points and image counts were already condensed into the themes
+            page_content[page_num] = {'summary': page['page_summary']}
+
+        system_prompt = "You are a presentation architect. Design clear, logical presentation structures. Output valid JSON only."
+
+        user_prompt = _STRUCTURE_PROMPT_TMPL.format_map({
+            'document_title': themes.get('document_title', 'Unknown'),
+            'document_type': themes.get('document_type', 'Unknown'),
+            'themes_json': prompt_json(themes.get('themes', [])),
+            'page_content_json': prompt_json(page_content),
+            'section_rules': SECTION_RULES
+        })
+
+        response = self._call_llm(system_prompt, user_prompt, temperature=0.2, max_tokens=STRUCTURE_MAX_TOKENS)
+        result = self._parse_json_response(response)
+
+        if result:
+            sections = result.get('sections', [])
+            self._ensure_section_flags(sections)
+            return sections
+        return []
+
+    def _ensure_section_flags(self, sections: List[Dict]):
+        """Ensure is_product_section flag exists (default to False for generic PDFs)"""
+        for section in sections:
+            if 'is_product_section' not in section:
+                # Fallback: check if section_type is 'product' or has single source page
+                section['is_product_section'] = (
+                    section.get('section_type') == 'product' or
+                    (len(section.get('source_pages', [])) == 1 and
+                     section.get('section_type') not in ['intro', 'overview', 'conclusion', 'contact'])
+                )
+
+    # =========================================================================
+    # STAGE 1+2: Themes and Structure in One Call
+    # =========================================================================
+    def analyze_and_structure(self, analysis_data: List[Dict]) -> Tuple[Optional[Dict], List[Dict]]:
+        """
+        Single LLM call doing Stage 1 and Stage 2 together.
+        Returns (themes result, sections); sections is empty if the call failed.
+        """
+        print("  Stage 1+2: Analyzing themes and creating presentation structure...")
+
+        pages_text = self._pages_text(analysis_data)
+
+        system_prompt = "You are a document analyst and presentation architect. Identify themes and design clear, logical presentation structures. Output valid JSON only."
+
+        user_prompt = _PLAN_PROMPT_TMPL.format_map({
+            'pages_text': pages_text,
+            'theme_rules': THEME_RULES,
+            'section_rules': SECTION_RULES
+        })
+
+        response = self._call_llm(system_prompt, user_prompt, temperature=0.2, max_tokens=PLAN_MAX_TOKENS)
+        result = self._parse_json_response(response)
+
+        if not result or not result.get('sections'):
+            return result, []
+
+        self._ensure_theme_flags(result.get('themes', []))
+        sections = result.pop('sections')
+        self._ensure_section_flags(sections)
+        return result, sections
+
+    # =========================================================================
+    # STAGE 3: Build Page-Image Index
+    # =========================================================================
+    def build_page_lookup(self, analysis_data: List[Dict]) -> Dict:
+        """Index pages by 1-based page number: {page_num: page}"""
+        return {page['page_num'] + 1: page for page in analysis_data}
+
+    def build_page_image_index(self, analysis_data: List[Dict]) -> Dict:
+        """
+        Build comprehensive index of images organized by page.
+        Returns: {page_num: [image_info, ...]}
+        """
+        return {
+            page['page_num'] + 1: [
+                {
+                    'path': img['saved_path'],
+                    'description': img['description'],
+                    'relevance': img.get('relevance', ''),
+                    'keyword_hashes': _keyword_hashes_cached(img['description'] + ' ' + img.get('relevance', ''))
+                }
+                for img in page.get('images', [])
+            ]
+            for page in analysis_data
+        }
+
+    # =========================================================================
+    # STAGE 4: Generate Section Content
+    # ========================================================================
+    def generate_section_content(self, section: Dict, analysis_data: List[Dict],
+                                  page_image_index: Dict) -> Dict:
+        """
+        Per-section LLM call - Generate content for a single section.
+        Uses only relevant pages for focused generation.
+        """
+        page_by_num = self.build_page_lookup(analysis_data)
+        system_prompt, user_prompt = self._section_prompts(section, page_by_num, page_image_index)
+        response = self._call_llm(system_prompt, user_prompt, temperature=0.3, max_tokens=SECTION_MAX_TOKENS)
+        return self._section_result(section, response)
+
+    async def _agenerate_section_content(self, section: Dict, page_by_num: Dict,
+                                         page_image_index: Dict) -> Dict:
+        """Async generate_section_content (pages looked up in page_by_num)"""
+        system_prompt, user_prompt = self._section_prompts(section, page_by_num, page_image_index)
+        response = await self._acall_llm(system_prompt, user_prompt, temperature=0.3, max_tokens=SECTION_MAX_TOKENS)
+        return self._section_result(section, response)
+
+    async def _generate_all(self, sections: List[Dict], page_by_num: Dict,
+                            page_image_index: Dict) -> List[Optional[Dict]]:
+        """Generate content for all sections concurrently, results in section order"""
+        semaphore = asyncio.Semaphore(SECTION_CONCURRENCY)
+
+        async def generate(i, section):
+            async with semaphore:
+                print(f"  Section {i+1}/{len(sections)}: {section.get('title', 'Untitled')}")
+                return await self._agenerate_section_content(section, page_by_num, page_image_index)
+
+        self.aclient = AsyncGroq(
+            api_key=self.api_key,
+            http_client=DefaultAsyncHttpxClient(limits=GROQ_HTTP_LIMITS, http2=GROQ_HTTP2)
+        )
+        try:
+            return await asyncio.gather(*[generate(i, section) for i, section in enumerate(sections)])
+        finally:
+            await self.aclient.close()
+            self.aclient = None
+
+    def _section_prompts(self, section: Dict, page_by_num: Dict,
+                         page_image_index: Dict) -> Tuple[str, str]:
+        """Build the (system, user) prompts for a section's content call"""
+        source_pages = section.get('source_pages', [])
+
+        # Gather content from source pages only
+        page_contents = []
+        available_images = []
+
+        for page_num in dict.fromkeys(source_pages):
+            page = page_by_num.get(page_num)
+            if page is None:
+                continue
+
+            page_contents.append({
+                'page': page_num,
+                'summary': page['page_summary'],
+                'key_points': page['key_points']
+            })
+
+            # Add images from this page
+            for img in page_image_index.get(page_num, []):
+                available_images.append({
+                    'page': page_num,
+                    'path': img['path'],
+                    'description': img['description'],
+                    'relevance': img['relevance']
+                })
+
+        system_prompt = "You are a content writer creating customer-friendly presentation content. Output valid JSON only."
+
+        is_product_section = section.get('is_product_section', False)
+
+        user_prompt = _SECTION_PROMPT_TMPL.format_map({
+            'title': section.get('title', 'Untitled'),
+            'section_type': section.get('section_type', 'general'),
+            'purpose': section.get('purpose', ''),
+            'content_focus': section.get('content_focus', []),
+            'is_product_section': is_product_section,
+            'page_contents_json': prompt_json(page_contents),
+            'available_images_json': prompt_json(available_images),
+            'target_image_count': section.get('target_image_count', 2),
+            'product_rule': PRODUCT_SECTION_RULE if is_product_section else ''
+        })
+
+        return system_prompt, user_prompt
+
+    def _section_result(self, section: Dict, response: Optional[str]) -> Optional[Dict]:
+        """Parse a section's LLM response and attach source pages and image paths"""
         result = self._parse_json_response(response)
 
         if result:
             # Add source pages to result
-            result['source_pages'] = source_pages
+            result['source_pages'] = section.get('source_pages', [])
             # Preserve product section flag for downstream processing
             result['is_product_section'] = section.get('is_product_section', False)
             # Extract just the image paths
@@ -502,10 +1014,12 @@ Return ONLY valid JSON."""
         # If we lost images, try to find replacements from source pages
         if len(valid_images) < len(original_images):
             needed = len(original_images) - len(valid_images)
+            valid_set = set(valid_images)
             for page_num in source_pages:
                 for img in page_image_index.get(page_num, []):
-                    if img['path'] not in valid_images:
+                    if img['path'] not in valid_set:
                         valid_images.append(img['path'])
+                        valid_set.add(img['path'])
                         needed -= 1
                         if needed <= 0:
                             break
@@ -525,7 +1039,7 @@ Return ONLY valid JSON."""
         STRICT: For product sections, only use images from source pages.
         """
         content = section.get('content', '') + ' ' + section.get('title', '')
-        content_keywords = set(self._extract_keywords(content))
+        content_hashes = _keyword_hashes_cached(content)
 
         source_pages = section.get('source_pages', [])
         target_count = max(2, len(section.get('images', [])))
@@ -538,25 +1052,24 @@ Return ONLY valid JSON."""
                 valid_source_paths.add(img['path'])
 
         # Score all available images from source pages ONLY
-        scored_images = []
-        for page_num in source_pages:
-            for img in page_image_index.get(page_num, []):
-                img_keywords = set(img['keywords'])
-                overlap = len(content_keywords & img_keywords)
+        candidates = [
+            (page_num, img) for page_num in source_pages for img in page_image_index.get(page_num, [])
+        ]
+        offsets = np.zeros(len(candidates) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([img['keyword_hashes'].size for _, img in candidates])
+        flat = np.concatenate([img['keyword_hashes'] for _, img in candidates] or [np.empty(0, np.uint32)])
+        overlaps = overlap_counts(content_hashes, flat, offsets)
 
-                # Higher bonus for product sections to prefer primary page
-                page_bonus = 3 if page_num == source_pages[0] else 1
+        scored_images = []
+        for (page_num, img), overlap in zip(candidates, overlaps.tolist()):
+            # Higher bonus for product sections to prefer primary page
+            page_bonus = 3 if page_num == source_pages[0] else 1
 
-                score = overlap * page_bonus + 1  # +1 base score so all source images are considered
-                scored_images.append({
-                    'path': img['path'],
-                    'page': page_num,
-                    'score': score,
-                    'description': img['description'][:100]
-                })
+            score = overlap * page_bonus + 1  # +1 base score so all source images are considered
+            scored_images.append(ScoredImage(img['path'], page_num, score, img['description'][:100]))
 
         # Sort by score and take top matches
-        scored_images.sort(key=lambda x: x['score'], reverse=True)
+        scored_images.sort(key=attrgetter('score'), reverse=True)
 
         # STRICT VALIDATION: Remove any images not from source pages
         current_images = section.get('images', [])
@@ -569,26 +1082,28 @@ Return ONLY valid JSON."""
 
         best_images = []
         for img in scored_images[:target_count]:
-            best_images.append(img['path'])
+            best_images.append(img.path)
 
         # For product sections: be very strict, only use validated images + algorithmic from source
         if is_product_section:
             final_images = validated_images.copy()
+            final_set = set(final_images)
             # Fill with best scoring images from source pages
             for img_path in best_images:
-                if img_path not in final_images and len(final_images) < target_count:
+                if img_path not in final_set and len(final_images) < target_count:
                     final_images.append(img_path)
+                    final_set.add(img_path)
             section['images'] = final_images[:target_count]
         else:
             # Non-product sections: merge LLM and algorithmic picks
-            final_images = []
-            for img_path in validated_images:
-                if img_path in [i['path'] for i in scored_images[:target_count * 2]]:
-                    final_images.append(img_path)
+            top_paths = {i.path for i in scored_images[:target_count * 2]}
+            final_images = [img_path for img_path in validated_images if img_path in top_paths]
+            final_set = set(final_images)
 
             for img_path in best_images:
-                if img_path not in final_images and len(final_images) < target_count:
+                if img_path not in final_set and len(final_images) < target_count:
                     final_images.append(img_path)
+                    final_set.add(img_path)
 
             section['images'] = final_images[:target_count]
 
@@ -597,11 +1112,71 @@ Return ONLY valid JSON."""
     # =========================================================================
     # MAIN PROCESS
     # =========================================================================
-    def process(self, analysis_path: str, output_path: str = None) -> Dict:
-        """Main processing method - orchestrates all stages"""
+    def process(self, analysis: Union[str, List[Dict]], output_path: str = None) -> Dict:
+        """Main processing method - orchestrates all stages
 
-        print("Loading analysis...")
-        data = self.load_analysis_json(analysis_path)
+        analysis is the analysis JSON path, or its already-loaded data (so a
+        long-running caller can load it once and reuse it).
+        """
+        return asyncio.run(self.aprocess(analysis, output_path))
+
+    async def aprocess(self, analysis: Union[str, List[Dict]], output_path: str = None) -> Dict:
+        """process() for callers already inside an event loop"""
+        try:
+            return await self._process(analysis, output_path)
+        finally:
+            if self.cache:
+                self.cache.save()
+
+    def _plan_fingerprint(self, analysis_data: List[Dict]) -> str:
+        """Hash of the analysis content the planning stages depend on"""
+        digest = hashlib.blake2b(self.llm_model.encode("utf-8"), digest_size=16)
+        digest.update(orjson.dumps([
+            {'s': page['page_summary'], 'k': page['key_points'][:5], 'i': len(page.get('images', []))}
+            for page in analysis_data
+        ]))
+        return digest.hexdigest()
+
+    def _load_plan(self, fingerprint: str) -> Tuple[Optional[Dict], List[Dict]]:
+        """Cached (themes, sections) for a fingerprint, or (None, [])"""
+        plan_dir = os.path.join(PLAN_CACHE_DIR, fingerprint)
+        try:
+            with open(os.path.join(plan_dir, "themes.json"), "rb") as f:
+                themes = orjson.loads(f.read())
+            with open(os.path.join(plan_dir, "sections.json"), "rb") as f:
+                sections = orjson.loads(f.read())
+        except (OSError, orjson.JSONDecodeError):
+            return None, []
+        return themes, sections
+
+    def _save_plan(self, fingerprint: str, themes: Dict, sections: List[Dict]):
+        """Store (themes, sections) under a fingerprint"""
+        plan_dir = os.path.join(PLAN_CACHE_DIR, fingerprint)
+        os.makedirs(plan_dir, exist_ok=True)
+        for name, value in (("themes.json", themes), ("sections.json", sections)):
+            tmp_path = os.path.join(plan_dir, name + ".tmp")
+            with open(tmp_path, "wb") as f:
+                f.write(orjson.dumps(value))
+            os.replace(tmp_path, os.path.join(plan_dir, name))
+
+    def save_presentation(self, presentation: Dict, output_path: str):
+        """Write the presentation JSON atomically (readers never see a partial file)"""
+        tmp_path = output_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(orjson.dumps(
+                presentation,
+                option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE
+            ))
+        os.replace(tmp_path, output_path)
+
+    async def _process(self, analysis: Union[str, List[Dict]], output_path: str = None) -> Dict:
+        """Run all stages (see process); blocking file I/O and LLM calls run in threads"""
+
+        if isinstance(analysis, str):
+            print("Loading analysis...")
+            data = await asyncio.to_thread(self.load_analysis_json, analysis)
+        else:
+            data = analysis
 
         print("Filtering small images...")
         data = self.filter_small_images(data)
@@ -609,32 +1184,49 @@ Return ONLY valid JSON."""
         # Build image index
         print("Building image index...")
         page_image_index = self.build_page_image_index(data)
+        page_by_num = self.build_page_lookup(data)
+
+        # Stage 1 + 2: Themes and structure in one call (or from an earlier run)
+        print("\n[STAGE 1+2] Analyzing themes and creating presentation structure...")
+        fingerprint = self._plan_fingerprint(data) if self.cache else None
+        themes, sections = self._load_plan(fingerprint) if fingerprint else (None, [])
+        plan_cached = bool(sections)
+        if plan_cached:
+            print("  Reusing themes and structure from an earlier run")
+        else:
+            themes, sections = await asyncio.to_thread(self.analyze_and_structure, data)
 
-        # Stage 1: Analyze themes
-        print("\n[STAGE 1] Analyzing document themes...")
-        themes = self.analyze_document_themes(data)
-        if not themes:
-            return {"error": "Failed to analyze document themes"}
+        if sections:
+            print(f"  Found {len(themes.get('themes', []))} themes")
+        else:
+            print("  Combined call failed, falling back to separate stages")
 
-        print(f"  Found {len(themes.get('themes', []))} themes")
+            # Stage 1: Analyze themes
+            print("\n[STAGE 1] Analyzing document themes...")
+            themes = await asyncio.to_thread(self.analyze_document_themes, data)
+            if not themes:
+                return {"error": "Failed to analyze document themes"}
 
-        # Stage 2: Create structure
-        print("\n[STAGE 2] Creating presentation structure...")
-        sections = self.create_presentation_structure(themes, data)
-        if not sections:
-            return {"error": "Failed to create presentation structure"}
+            print(f"  Found {len(themes.get('themes', []))} themes")
+
+            # Stage 2: Create structure
+            print("\n[STAGE 2] Creating presentation structure...")
+            sections = await asyncio.to_thread(self.create_presentation_structure, themes, data)
+            if not sections:
+                return {"error": "Failed to create presentation structure"}
 
         print(f"  Created {len(sections)} sections")
 
-        # Stage 3 & 4: Generate content for each section
+        if fingerprint and not plan_cached:
+            await asyncio.to_thread(self._save_plan, fingerprint, themes, sections)
+
+        # Stage 3 & 4: Generate content for each section (concurrently)
         print(f"\n[STAGE 3] Generating section content...")
         generated_sections = []
 
-        for i, section in enumerate(sections):
-            print(f"  Section {i+1}/{len(sections)}: {section.get('title', 'Untitled')}")
-
-            content = self.generate_section_content(section, data, page_image_index)
+        contents = await self._generate_all(sections, page_by_num, page_image_index)
 
+        for i, content in enumerate(contents):
             if content:
                 # Stage 5: Validate image bindings
                 content = self.validate_image_bindings(content, page_image_index)
@@ -662,8 +1254,7 @@ Return ONLY valid JSON."""
 
         # Save output
         if output_path:
-            with open(output_path, "w", encoding="utf-8") as f:
-                json.dump(presentation, f, indent=2, ensure_ascii=False)
+            await asyncio.to_thread(self.save_presentation, presentation, output_path)
             print(f"\nSaved to: {output_path}")
 
         return presentation
@@ -0,0 +1,32 @@
+"""
+PDF processing worker
+
+Runs main.run_pipeline inside the server's process pool. Workers are spawned
+fresh and import only this module (and the pipeline), never server.py, so they
+don't inherit its threads and locks or reopen the database.
+"""
+
+import multiprocessing
+
+from main import run_pipeline
+
+_worker_updates = None
+
+
+def init_processing_worker(updates: multiprocessing.Queue):
+    """Pool initializer: keep the queue progress updates are reported on"""
+    global _worker_updates
+    _worker_updates = updates
+
+
+def process_product_job(product_id: int, pdf_path: str, output_dir: str):
+    """Run the PDF pipeline for a product, reporting (product_id, stage, progress, message)"""
+    def report(stage: str, progress: int, message: str):
+        _worker_updates.put((product_id, stage, progress, message))
+
+    run_pipeline(pdf_path, output_dir, progress=report)
+
+
+def process_pdf_job(pdf_path: str, output_dir: str):
+    """Run the PDF pipeline without progress reporting (the legacy single-PDF upload)"""
+    run_pipeline(pdf_path, output_dir)
@@ -10,31 +10,98 @@ Features:
 """
 
 import os
+import sys
 import re
-import json
+import mmap
+import mimetypes
+import queue
+import atexit
 import asyncio
-import base64
-from typing import Dict, List, Optional
+import logging
+import importlib.util
+import multiprocessing
+import secrets
+import shutil
+import subprocess
+import datetime
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager
+from dataclasses import asdict, dataclass
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, List, Optional, Set, Tuple
 from pathlib import Path
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, UploadFile, File
+import numpy as np
+import orjson
+from fastapi import (FastAPI, WebSocket, WebSocketDisconnect, HTTPException, UploadFile, File,
+                     Cookie, Depends, Header, Response)
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from starlette.middleware.gzip import DEFAULT_EXCLUDED_CONTENT_TYPES
 from pydantic import BaseModel
 import uvicorn
 
-from groq import Groq
-from openai import OpenAI
+import httpx
+from groq import AsyncGroq, DefaultAsyncHttpxClient
+from openai import AsyncOpenAI
 from deepgram import DeepgramClient
 from dotenv import load_dotenv
 
+try:
+    from cryptography import x509
+    from cryptography.x509.oid import NameOID
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+except ImportError:  # fall back to the openssl CLI
+    x509 = None
+
 load_dotenv()
 
 # Import database module
 import database as db
-
-app = FastAPI(title="PDF Presentation System")
+from processing_worker import init_processing_worker, process_pdf_job, process_product_job
+
+# Request handlers only enqueue log records; a listener thread writes them to
+# stderr, so an error storm (e.g. an LLM outage) never blocks the event loop
+logger = logging.getLogger("server")
+logger.setLevel(logging.INFO)
+logger.propagate = False
+log_queue = queue.Queue(-1)
+logger.addHandler(QueueHandler(log_queue))
+_log_output = logging.StreamHandler()
+_log_output.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+log_listener = QueueListener(log_queue, _log_output)
+log_listener.start()
+atexit.register(log_listener.stop)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Preload the default presentation once, so sessions and chat start without disk reads;
+    relay PDF processing progress while running; on shutdown finish pending JSON writes
+    and close the shared pools"""
+    await reload_default_state()
+    updates_task = asyncio.create_task(drain_processing_updates())
+    yield
+    await flush_json_writes()
+    processing_updates.put(None)
+    await updates_task
+    processing_pool.shutdown(wait=False, cancel_futures=True)
+    await llm_http_client.aclose()
+    deepgram_http_client.close()
+
+class OrjsonResponse(JSONResponse):
+    """JSON response rendered straight to bytes by orjson instead of stdlib json"""
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+app = FastAPI(title="PDF Presentation System", lifespan=lifespan,
+              default_response_class=OrjsonResponse)
 
 # CORS
 app.add_middleware(
@@ -45,10 +112,27 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize clients
-groq_client = Groq(api_key=os.getenv("GROQ_API_KEY"))
-openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-deepgram_client = DeepgramClient(api_key=os.getenv("DEEPGRAM_API_KEY"))
+# Compress JSON and other text bodies; small responses aren't worth it, and
+# level 5 keeps CPU per response low for most of level 9's size win. PDFs,
+# like images and audio, are already compressed
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5,
+                   exclude_content_types=DEFAULT_EXCLUDED_CONTENT_TYPES + ("application/pdf",))
+
+# Initialize clients (async, so LLM calls don't tie up the event loop or a
+# worker thread). The LLM clients share one pooled keep-alive connection set,
+# multiplexed over HTTP/2 when h2 is installed; closed on shutdown
+HTTP_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=50)
+HTTP2 = importlib.util.find_spec("h2") is not None
+llm_http_client = DefaultAsyncHttpxClient(limits=HTTP_LIMITS, http2=HTTP2)
+groq_client = AsyncGroq(api_key=os.getenv("GROQ_API_KEY"), http_client=llm_http_client)
+openai_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=llm_http_client)
+
+# Deepgram's SDK calls run in worker threads, so it gets a sync pool of its own
+DEEPGRAM_TIMEOUT = 60
+deepgram_http_client = httpx.Client(limits=HTTP_LIMITS, http2=HTTP2,
+                                    timeout=DEEPGRAM_TIMEOUT, follow_redirects=True)
+deepgram_client = DeepgramClient(api_key=os.getenv("DEEPGRAM_API_KEY"),
+                                 httpx_client=deepgram_http_client, timeout=DEEPGRAM_TIMEOUT)
 
 # Deepgram voice models mapping
 DEEPGRAM_VOICES = {
@@ -65,25 +149,99 @@ DEEPGRAM_VOICES = {
     "helios": "aura-helios-en",        # Male, British, refined
     "zeus": "aura-zeus-en",            # Male, American, powerful and commanding
 }
+_VALID_VOICES = frozenset(DEEPGRAM_VOICES)
+
+def configured_voice(settings: Dict[str, str]) -> str:
+    """The stored TTS voice, or asteria if it isn't a Deepgram voice (e.g. an old "alloy" seed)"""
+    voice = settings.get("tts_voice", "asteria")
+    return voice if voice in _VALID_VOICES else "asteria"
 
-# Global state
+# Chat turns sent back to the LLM as context (user and assistant messages)
+CHAT_HISTORY_MESSAGES = 10
+
+# Chat context used while no analysis is loaded
+NO_PDF_CONTEXT = "No PDF data available."
+
+# Per-session state
 class PresentationState:
     def __init__(self):
         self.is_playing = False
-        self.is_paused = False
+        # Exactly one of these is set: the WebSocket loop awaits them instead of polling
+        self.resume_event = asyncio.Event()
+        self.pause_event = asyncio.Event()
+        self.resume_event.set()
         self.current_section = 0
         self.presentation_data = None
         self.analysis_data = None
-        self.chat_history = []
+        self.pdf_context = NO_PDF_CONTEXT  # build_pdf_context(analysis_data), built once per load
+        self.keyword_index = ({}, np.zeros((0, 0), dtype=np.uint8))  # build_keyword_index(analysis_data)
+        self.page_images = []  # build_page_images(analysis_data)
+        self.chat_history = deque(maxlen=CHAT_HISTORY_MESSAGES)
         self.interrupt_flag = False
 
+    def set_analysis(self, analysis_data: Optional[List[Dict]]):
+        """Swap in new analysis data and rebuild what is derived from it"""
+        self.analysis_data = analysis_data
+        self.pdf_context = build_pdf_context(analysis_data)
+        self.keyword_index = build_keyword_index(analysis_data)
+        self.page_images = build_page_images(analysis_data)
+
+    def share_content(self, other: "PresentationState"):
+        """Use another state's loaded presentation and analysis (read-only, so not copied)"""
+        self.presentation_data = other.presentation_data
+        self.analysis_data = other.analysis_data
+        self.pdf_context = other.pdf_context
+        self.keyword_index = other.keyword_index
+        self.page_images = other.page_images
+
+    @property
+    def is_paused(self) -> bool:
+        return self.pause_event.is_set()
+
+    def pause(self):
+        self.resume_event.clear()
+        self.pause_event.set()
+
+    def resume(self):
+        self.pause_event.clear()
+        self.resume_event.set()
+
     def reset(self):
         self.is_playing = False
-        self.is_paused = False
+        self.resume()
         self.current_section = 0
         self.interrupt_flag = False
 
-state = PresentationState()
+# The default presentation (output/), loaded at startup; new sessions start from it
+default_state = PresentationState()
+
+# One PresentationState per browser session (session_id cookie), so concurrent
+# viewers don't share section position, pause flags or chat history.
+# Least recently used sessions are dropped past MAX_SESSIONS.
+SESSION_COOKIE = "session_id"
+MAX_SESSIONS = 256
+sessions: "OrderedDict[str, PresentationState]" = OrderedDict()
+
+def get_session_state(session_id: Optional[str]) -> Tuple[str, PresentationState]:
+    """Look up the state for a session id, starting a new session if it is unknown"""
+    state = sessions.get(session_id) if session_id else None
+    if state is None:
+        session_id = secrets.token_urlsafe(16)
+        state = sessions[session_id] = PresentationState()
+        state.share_content(default_state)
+        if len(sessions) > MAX_SESSIONS:
+            sessions.popitem(last=False)
+    else:
+        sessions.move_to_end(session_id)
+    return session_id, state
+
+def get_state(response: Response,
+              session_id: Optional[str] = Cookie(None, alias=SESSION_COOKIE)) -> PresentationState:
+    """Dependency: the caller's PresentationState (sets the session cookie for new sessions)"""
+    state_id, state = get_session_state(session_id)
+    if state_id != session_id:
+        response.set_cookie(SESSION_COOKIE, state_id, httponly=True, samesite="lax")
+    return state
 
 # ============================================================================
 # Data Models
@@ -99,19 +257,119 @@ class TTSRequest(BaseModel):
 # ============================================================================
 # Load Data
 # ============================================================================
-def load_presentation(path: str = "output/presentation.json") -> Dict:
-    """Load presentation JSON"""
+# JSON files at least this big are parsed from a memory map instead of a full read
+MMAP_JSON_MIN_BYTES = 5 * 1024 * 1024
+
+def read_json(path: str):
+    """Parse a JSON file with orjson (blocking; run it off the event loop)"""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size < MMAP_JSON_MIN_BYTES:
+            return orjson.loads(f.read())
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            with memoryview(mm) as view:
+                return orjson.loads(view)
+
+def write_json(path, data):
+    """Write data as indented JSON with orjson, atomically (blocking; run it off the event loop)"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+    os.replace(tmp_path, path)
+
+# Admin edits to a JSON file are written behind: each PUT replaces the pending
+# content, and it is written once no PUT has arrived for JSON_WRITE_DELAY
+# seconds. Reads of a file with a pending write get the pending content
+JSON_WRITE_DELAY = 0.5
+pending_json_writes: Dict[str, object] = {}
+json_write_due: Dict[str, float] = {}
+json_write_tasks: Dict[str, asyncio.Task] = {}
+
+def schedule_json_write(path, content):
+    """Queue content to be written to path (replacing any pending write of it)"""
+    path = str(path)
+    pending_json_writes[path] = content
+    json_write_due[path] = asyncio.get_running_loop().time() + JSON_WRITE_DELAY
+    if path not in json_write_tasks:
+        json_write_tasks[path] = asyncio.create_task(write_json_behind(path))
+
+async def write_json_behind(path: str):
+    """Write path's pending content once PUTs stop arriving; one task per path, so writes never overlap"""
+    loop = asyncio.get_running_loop()
+    try:
+        while path in pending_json_writes:
+            while (delay := json_write_due[path] - loop.time()) > 0:
+                await asyncio.sleep(delay)
+            content = pending_json_writes.pop(path)
+            await asyncio.to_thread(write_json, path, content)
+            if path in (DEFAULT_PRESENTATION_PATH, DEFAULT_ANALYSIS_PATH):
+                await reload_default_state()
+    except Exception:
+        logger.exception("Writing %s failed", path)
+    finally:
+        del json_write_tasks[path]
+
+async def flush_json_writes():
+    """Wait for every pending JSON write to land (used on shutdown)"""
+    for path in json_write_due:
+        json_write_due[path] = 0
+    await asyncio.gather(*json_write_tasks.values())
+
+async def json_file_response(path, missing_detail: str) -> Response:
+    """Serve a JSON file's bytes as-is (no parse/re-serialize round trip), or its pending write"""
+    if str(path) in pending_json_writes:
+        return Response(content=orjson.dumps(pending_json_writes[str(path)]),
+                        media_type="application/json")
+    try:
+        content = await asyncio.to_thread(Path(path).read_bytes)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=missing_detail)
+    return Response(content=content, media_type="application/json")
+
+async def load_json(path: str):
+    """Load a JSON file (or its pending write), None if it doesn't exist"""
+    if path in pending_json_writes:
+        return pending_json_writes[path]
     if os.path.exists(path):
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
+        return await asyncio.to_thread(read_json, path)
     return None
 
-def load_analysis(path: str = "output/analysis_results.json") -> List[Dict]:
+DEFAULT_OUTPUT_DIR = Path("output")
+DEFAULT_PRESENTATION_PATH = str(DEFAULT_OUTPUT_DIR / "presentation.json")
+DEFAULT_ANALYSIS_PATH = str(DEFAULT_OUTPUT_DIR / "analysis_results.json")
+
+async def load_presentation(path: str = DEFAULT_PRESENTATION_PATH) -> Dict:
+    """Load presentation JSON"""
+    return await load_json(path)
+
+async def load_analysis(path: str = DEFAULT_ANALYSIS_PATH) -> List[Dict]:
     """Load analysis JSON for chat context"""
-    if os.path.exists(path):
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return None
+    return await load_json(path)
+
+async def reload_default_state():
+    """(Re)load the default presentation that new sessions start from; called at startup
+    and whenever its files are rewritten (admin JSON edits, reprocessing product 1)"""
+    default_state.presentation_data = await load_presentation()
+    default_state.set_analysis(await load_analysis())
+
+# ============================================================================
+# Groq Completions
+# ============================================================================
+# Requests identical to one already in flight (same model, messages and
+# sampling settings) wait for that call instead of issuing their own
+inflight_completions: Dict[bytes, asyncio.Future] = {}
+
+async def groq_completion(**params) -> str:
+    """Run a Groq chat completion and return the message content"""
+    key = orjson.dumps(params, option=orjson.OPT_SORT_KEYS)
+    future = inflight_completions.get(key)
+    if future is None:
+        future = asyncio.ensure_future(groq_client.chat.completions.create(**params))
+        inflight_completions[key] = future
+        future.add_done_callback(lambda _: inflight_completions.pop(key, None))
+
+    # Shielded so one caller going away doesn't cancel the call for the others
+    completion = await asyncio.shield(future)
+    return completion.choices[0].message.content
 
 # ============================================================================
 # Chat with PDF Context
@@ -119,7 +377,7 @@ def load_analysis(path: str = "output/analysis_results.json") -> List[Dict]:
 def build_pdf_context(analysis_data: List[Dict]) -> str:
     """Build context string from analysis data"""
     if not analysis_data:
-        return "No PDF data available."
+        return NO_PDF_CONTEXT
 
     context_parts = []
     for page in analysis_data:
@@ -136,85 +394,108 @@ Key Points:
 
     return "\n".join(context_parts)
 
-def find_relevant_pages(question: str, response: str, analysis_data: List[Dict]) -> List[Dict]:
+# Words of 3+ letters (lowercased text) used for chat/page keyword matching
+KEYWORD_RE = re.compile(r'\b[a-z]{3,}\b')
+
+# Common words ignored when matching chat text against pages
+STOP_WORDS = frozenset({
+    'the', 'a', 'an', 'is', 'are', 'was', 'were', 'be', 'been', 'being',
+    'have', 'has', 'had', 'do', 'does', 'did', 'will', 'would', 'could',
+    'should', 'may', 'might', 'must', 'shall', 'can', 'need', 'dare',
+    'ought', 'used', 'to', 'of', 'in', 'for', 'on', 'with', 'at', 'by',
+    'from', 'as', 'into', 'through', 'during', 'before', 'after', 'above',
+    'below', 'between', 'under', 'again', 'further', 'then', 'once', 'here',
+    'there', 'when', 'where', 'why', 'how', 'all', 'each', 'few', 'more',
+    'most', 'other', 'some', 'such', 'no', 'nor', 'not', 'only', 'own',
+    'same', 'so', 'than', 'too', 'very', 'just', 'and', 'but', 'if', 'or',
+    'because', 'until', 'while', 'what', 'which', 'who', 'whom', 'this',
+    'that', 'these', 'those', 'am', 'it', 'its', 'they', 'them', 'their',
+    'i', 'me', 'my', 'we', 'our', 'you', 'your', 'he', 'him', 'his', 'she',
+    'her', 'about', 'also', 'available', 'include', 'including', 'options'
+})
+
+# Keyword -> row id, and one row of page bits per keyword (8 pages per byte)
+KeywordIndex = Tuple[Dict[str, int], np.ndarray]
+
+def build_keyword_index(analysis_data: List[Dict]) -> KeywordIndex:
+    """Number each word of the pages' summaries/key points and mark the pages containing it"""
+    term_ids = {}
+    page_terms = []
+    for page in analysis_data or []:
+        page_text = (page.get('page_summary', '') + ' ' +
+                    ' '.join(page.get('key_points', []))).lower()
+        page_terms.append([term_ids.setdefault(word, len(term_ids))
+                           for word in set(KEYWORD_RE.findall(page_text)) - STOP_WORDS])
+
+    term_pages = np.zeros((len(term_ids), len(page_terms)), dtype=bool)
+    for i, ids in enumerate(page_terms):
+        term_pages[ids, i] = True
+
+    return term_ids, np.packbits(term_pages, axis=1)
+
+def build_page_images(analysis_data: List[Dict]) -> List[Tuple[int, List[str]]]:
+    """(1-based page number, image paths) for each page, in analysis order"""
+    page_images = []
+    if not analysis_data:
+        return page_images
+
+    for i, page in enumerate(analysis_data):
+        image_paths = []
+        for img in page.get('images', []):
+            # Handle both dict format and string format
+            if isinstance(img, dict):
+                # Try saved_path first, then path
+                path = img.get('saved_path', '') or img.get('path', '')
+            elif isinstance(img, str):
+                path = img
+            else:
+                path = ''
+            if path:
+                image_paths.append(path)
+        page_images.append((page.get('page_num', i) + 1, image_paths))
+
+    return page_images
+
+def find_relevant_pages(question: str, response: str, keyword_index: KeywordIndex,
+                        page_images: List[Tuple[int, List[str]]]) -> List[Dict]:
     """Find pages relevant to the question/response by keyword matching"""
     references = []
-    if not analysis_data:
+    if not page_images:
         return references
 
     # Combine question and response for keyword extraction
     combined_text = (question + " " + response).lower()
 
-    # Extract meaningful keywords (remove common words)
-    stop_words = {'the', 'a', 'an', 'is', 'are', 'was', 'were', 'be', 'been', 'being',
-                  'have', 'has', 'had', 'do', 'does', 'did', 'will', 'would', 'could',
-                  'should', 'may', 'might', 'must', 'shall', 'can', 'need', 'dare',
-                  'ought', 'used', 'to', 'of', 'in', 'for', 'on', 'with', 'at', 'by',
-                  'from', 'as', 'into', 'through', 'during', 'before', 'after', 'above',
-                  'below', 'between', 'under', 'again', 'further', 'then', 'once', 'here',
-                  'there', 'when', 'where', 'why', 'how', 'all', 'each', 'few', 'more',
-                  'most', 'other', 'some', 'such', 'no', 'nor', 'not', 'only', 'own',
-                  'same', 'so', 'than', 'too', 'very', 'just', 'and', 'but', 'if', 'or',
-                  'because', 'until', 'while', 'what', 'which', 'who', 'whom', 'this',
-                  'that', 'these', 'those', 'am', 'it', 'its', 'they', 'them', 'their',
-                  'i', 'me', 'my', 'we', 'our', 'you', 'your', 'he', 'him', 'his', 'she',
-                  'her', 'about', 'also', 'available', 'include', 'including', 'options'}
-
-    words = re.findall(r'\b[a-z]{3,}\b', combined_text)
-    keywords = [w for w in words if w not in stop_words]
-
-    # Score each page by keyword matches
-    page_scores = []
-    for page in analysis_data:
-        page_num = page['page_num'] + 1
-        page_text = (page.get('page_summary', '') + ' ' +
-                    ' '.join(page.get('key_points', []))).lower()
+    # Extract meaningful keywords (stop words are never in the index)
+    term_ids, term_pages = keyword_index
+    keyword_ids = [term_ids[w] for w in KEYWORD_RE.findall(combined_text) if w in term_ids]
+    if not keyword_ids:
+        return references
 
-        # Count keyword matches
-        score = sum(1 for kw in keywords if kw in page_text)
-
-        if score > 0:
-            images = page.get('images', [])
-            image_paths = []
-            for img in images:
-                # Handle both dict format and string format
-                if isinstance(img, dict):
-                    # Try saved_path first, then path
-                    path = img.get('saved_path', '') or img.get('path', '')
-                elif isinstance(img, str):
-                    path = img
-                else:
-                    path = ''
-                if path:
-                    image_paths.append(path)
-
-            if image_paths:
-                page_scores.append({
-                    'page': page_num,
-                    'score': score,
-                    'images': image_paths
-                })
-
-    # Sort by score and return top 2 most relevant pages (limit images per page)
-    page_scores.sort(key=lambda x: x['score'], reverse=True)
-    references = []
-    for p in page_scores[:2]:  # Only top 2 pages
-        references.append({
-            'page': p['page'],
-            'images': p['images'][:2]  # Max 2 images per page
-        })
+    # Score each page by keyword matches: one page-bit row per keyword occurrence,
+    # unpacked and summed in a single vectorized pass
+    scores = np.unpackbits(term_pages[keyword_ids], axis=1,
+                           count=len(page_images)).sum(axis=0, dtype=np.int32)
+
+    # Highest score first (ties keep page order); return the top 2 pages with images
+    hits = np.flatnonzero(scores)
+    for i in hits[np.argsort(-scores[hits], kind='stable')]:
+        page_num, image_paths = page_images[i]
+        if image_paths:
+            references.append({
+                'page': page_num,
+                'images': image_paths[:2]  # Max 2 images per page
+            })
+            if len(references) == 2:  # Only top 2 pages
+                break
 
     return references
 
 @app.post("/api/chat")
-async def chat_with_pdf(request: ChatMessage):
+async def chat_with_pdf(request: ChatMessage, state: PresentationState = Depends(get_state)):
     """Chat endpoint - answers questions about the PDF"""
 
-    # Load analysis if not loaded
-    if state.analysis_data is None:
-        state.analysis_data = load_analysis()
-
-    pdf_context = build_pdf_context(state.analysis_data)
+    pdf_context = state.pdf_context
 
     # Build messages with history
     messages = [
@@ -239,25 +520,23 @@ INTERNAL REFERENCE (for your tracking only - DO NOT mention these to user):
         }
     ]
 
-    # Add chat history (last 10 messages)
-    for msg in state.chat_history[-10:]:
-        messages.append(msg)
+    # Add chat history (the deque only keeps the last 10 messages)
+    messages.extend(state.chat_history)
 
     # Add current message
     messages.append({"role": "user", "content": request.message})
 
     try:
-        completion = groq_client.chat.completions.create(
+        response = await groq_completion(
             model="llama-3.3-70b-versatile",
             messages=messages,
             temperature=0.3,
             max_completion_tokens=1024
         )
 
-        response = completion.choices[0].message.content
-
         # Find relevant pages and their images based on question/response content
-        references = find_relevant_pages(request.message, response, state.analysis_data)
+        references = find_relevant_pages(request.message, response, state.keyword_index,
+                                         state.page_images)
 
         # Update history
         state.chat_history.append({"role": "user", "content": request.message})
@@ -276,9 +555,7 @@ INTERNAL REFERENCE (for your tracking only - DO NOT mention these to user):
         }
 
     except Exception as e:
-        import traceback
-        print("CHAT ERROR:")
-        traceback.print_exc()
+        logger.exception("Chat failed")
         raise HTTPException(status_code=500, detail=str(e))
 
 # ============================================================================
@@ -288,6 +565,11 @@ class ExtractInfoRequest(BaseModel):
     message: str
     field: str  # 'name', 'email', or 'phone'
 
+# Valid extractions keyed by (field, normalized message), most recent last;
+# onboarding answers repeat a lot, and a hit skips the LLM round-trip
+EXTRACT_CACHE_SIZE = 512
+extract_cache: "OrderedDict[Tuple[str, str], Dict]" = OrderedDict()
+
 @app.post("/api/extract-info")
 async def extract_user_info(request: ExtractInfoRequest):
     """Use LLM to extract and validate user info from conversational input"""
@@ -348,8 +630,14 @@ If invalid:
     if request.field not in prompts:
         raise HTTPException(status_code=400, detail="Invalid field type")
 
+    cache_key = (request.field, request.message.strip().lower())
+    cached = extract_cache.get(cache_key)
+    if cached is not None:
+        extract_cache.move_to_end(cache_key)
+        return dict(cached)
+
     try:
-        completion = groq_client.chat.completions.create(
+        response_text = await groq_completion(
             model="llama-3.3-70b-versatile",
             messages=[
                 {
@@ -364,8 +652,7 @@ If invalid:
             temperature=0.1,
             max_completion_tokens=150
         )
-
-        response_text = completion.choices[0].message.content.strip()
+        response_text = response_text.strip()
 
         # Parse JSON response
         # Handle potential markdown code blocks
@@ -375,63 +662,133 @@ If invalid:
                 response_text = response_text[4:]
         response_text = response_text.strip()
 
-        result = json.loads(response_text)
+        result = orjson.loads(response_text)
+
+        # Only confirmed extractions are cached, so failures get a fresh try
+        if isinstance(result, dict) and result.get("valid"):
+            extract_cache[cache_key] = dict(result)
+            if len(extract_cache) > EXTRACT_CACHE_SIZE:
+                extract_cache.popitem(last=False)
         return result
 
-    except json.JSONDecodeError:
+    except orjson.JSONDecodeError:
         return {"extracted": "", "valid": False, "error": "I couldn't understand that. Could you please try again?"}
-    except Exception as e:
-        print(f"Extract info error: {e}")
+    except Exception:
+        logger.exception("Extract info failed for field %s", request.field)
         return {"extracted": "", "valid": False, "error": "Something went wrong. Please try again."}
 
 # ============================================================================
 # Text-to-Speech (Deepgram)
 # ============================================================================
+# Synthesized audio for presentation sections, keyed by (voice model, text) and
+# shared by all sessions. Entries are futures, so a request arriving while a
+# section is still being pre-generated waits for it instead of starting again
+TTS_CACHE_SIZE = 128
+TTS_PREWARM_CONCURRENCY = 4  # parallel Deepgram syntheses when pre-generating
+tts_cache: "OrderedDict[Tuple[str, str], asyncio.Future]" = OrderedDict()
+tts_semaphore = asyncio.Semaphore(TTS_PREWARM_CONCURRENCY)
+
+def tts_text(text: str) -> str:
+    """Limit text length for faster response"""
+    if len(text) > 2000:
+        return text[:2000] + "..."
+    return text
+
+async def synthesize_speech(text: str, voice_model: str) -> bytes:
+    """Synthesize the whole MP3 for a text (bounded by tts_semaphore)"""
+    async with tts_semaphore:
+        return await asyncio.to_thread(
+            lambda: b"".join(deepgram_client.speak.v1.audio.generate(text=text, model=voice_model))
+        )
+
+def cached_speech(text: str, voice_model: str) -> asyncio.Future:
+    """Get (or start) the cached synthesis of a text; failures are not kept"""
+    key = (voice_model, text)
+    future = tts_cache.get(key)
+    if future is not None:
+        tts_cache.move_to_end(key)
+        return future
+
+    def forget_failure(f: asyncio.Future):
+        if f.cancelled() or f.exception() is not None:
+            if not f.cancelled():
+                logger.warning("TTS pre-generation failed: %s", f.exception())
+            if tts_cache.get(key) is f:
+                del tts_cache[key]
+
+    future = tts_cache[key] = asyncio.ensure_future(synthesize_speech(text, voice_model))
+    future.add_done_callback(forget_failure)
+    if len(tts_cache) > TTS_CACHE_SIZE:
+        tts_cache.popitem(last=False)
+    return future
+
+def prewarm_tts(texts: List[str], voice_model: str):
+    """Start synthesizing section texts in the background so /api/tts finds them cached"""
+    for text in texts:
+        if text:
+            cached_speech(tts_text(text), voice_model)
+
 @app.post("/api/tts")
 async def text_to_speech(request: TTSRequest):
-    """Convert text to speech using Deepgram TTS"""
-    try:
-        # Limit text length for faster response
-        text = request.text
-        if len(text) > 2000:
-            text = text[:2000] + "..."
+    """Convert text to speech using Deepgram TTS, streamed back as MP3"""
+    # Unknown voices are rejected rather than silently synthesized (and cached) as asteria
+    if request.voice not in _VALID_VOICES:
+        raise HTTPException(status_code=400, detail="Unknown voice")
+    voice_model = f"aura-{request.voice}-en"
 
-        # Get the Deepgram voice model from the voice name
-        voice_model = DEEPGRAM_VOICES.get(request.voice, "aura-asteria-en")
-
-        # Generate speech using Deepgram SDK
-        audio_chunks = []
-        for chunk in deepgram_client.speak.v1.audio.generate(
+    try:
+        text = tts_text(request.text)
+
+        # Pre-generated (or still generating) section audio
+        future = tts_cache.get((voice_model, text))
+        if future is not None:
+            tts_cache.move_to_end((voice_model, text))
+            audio = await asyncio.shield(future)
+            return Response(content=audio, media_type="audio/mpeg")
+
+        # Generate speech using Deepgram SDK. The first chunk is fetched here so a
+        # failed synthesis is still reported as a 500 rather than an empty stream
+        audio_chunks = iter(deepgram_client.speak.v1.audio.generate(
             text=text,
             model=voice_model
-        ):
-            audio_chunks.append(chunk)
-
-        audio_bytes = b''.join(audio_chunks)
-
-        # Return audio as base64
-        audio_base64 = base64.b64encode(audio_bytes).decode('utf-8')
-
-        return {"audio": audio_base64, "format": "mp3"}
+        ))
+        first_chunk = await asyncio.to_thread(next, audio_chunks, b"")
 
     except Exception as e:
-        print(f"TTS Error: {e}")
+        logger.exception("TTS failed")
         raise HTTPException(status_code=500, detail=str(e))
 
+    def stream_audio():
+        yield first_chunk
+        yield from audio_chunks
+
+    # Sync iterators are drained in the threadpool, so the rest of the
+    # synthesis never blocks the event loop
+    return StreamingResponse(stream_audio(), media_type="audio/mpeg")
+
 # ============================================================================
 # Speech-to-Text (Deepgram)
 # ============================================================================
+# Uploads are streamed to Deepgram in blocks of this size (never held in memory whole)
+STT_CHUNK_BYTES = 64 * 1024
+
 @app.post("/api/stt")
 async def speech_to_text(audio: UploadFile = File(...)):
     """Convert speech to text using Deepgram STT"""
     try:
-        # Read audio file
-        audio_bytes = await audio.read()
-
-        # Transcribe using Deepgram SDK
-        response = deepgram_client.listen.rest.v1.transcribe_file(
-            {"buffer": audio_bytes, "mimetype": "audio/webm"},
-            {"model": "nova-2", "smart_format": True, "language": "en", "punctuate": True}
+        # Stream the spooled upload instead of reading it all into memory
+        def read_chunks():
+            while chunk := audio.file.read(STT_CHUNK_BYTES):
+                yield chunk
+
+        # Transcribe using Deepgram SDK (blocking, so off the event loop)
+        response = await asyncio.to_thread(
+            deepgram_client.listen.v1.media.transcribe_file,
+            request=read_chunks(),
+            model="nova-2",
+            smart_format=True,
+            language="en",
+            punctuate=True
         )
 
         # Extract transcript
@@ -440,34 +797,27 @@ async def speech_to_text(audio: UploadFile = File(...)):
         return {"text": transcript, "status": "success"}
 
     except Exception as e:
-        print(f"STT Error: {e}")
+        logger.exception("STT failed")
         raise HTTPException(status_code=500, detail=str(e))
 
 # ============================================================================
 # Presentation Control
 # ============================================================================
 @app.get("/api/presentation/load")
-async def load_presentation_data(product_id: Optional[int] = None):
+async def load_presentation_data(product_id: Optional[int] = None,
+                                 state: PresentationState = Depends(get_state)):
     """Load presentation data - optionally for a specific product"""
     if product_id:
         product_folder = db.get_product_folder(product_id)
         presentation_path = product_folder / "presentation.json"
         analysis_path = product_folder / "analysis_results.json"
 
-        if presentation_path.exists():
-            with open(presentation_path, "r", encoding="utf-8") as f:
-                state.presentation_data = json.load(f)
-        else:
-            state.presentation_data = None
-
-        if analysis_path.exists():
-            with open(analysis_path, "r", encoding="utf-8") as f:
-                state.analysis_data = json.load(f)
-        else:
-            state.analysis_data = None
+        state.presentation_data = await load_presentation(str(presentation_path))
+        state.set_analysis(await load_analysis(str(analysis_path)))
     else:
-        state.presentation_data = load_presentation()
-        state.analysis_data = load_analysis()
+        state.presentation_data = await load_presentation()
+        state.set_analysis(await load_analysis())
+        default_state.share_content(state)
 
     if state.presentation_data:
         # Return full section data for TTS pre-generation
@@ -482,6 +832,13 @@ async def load_presentation_data(product_id: Optional[int] = None):
                 "key_takeaways": section.get("key_takeaways", [])
             })
 
+        # Start synthesizing every section with the configured voice now, so
+        # section audio is ready (or in progress) before the client asks
+        settings = db.get_all_settings()
+        if settings.get("tts_enabled", "true") == "true":
+            voice_model = f"aura-{configured_voice(settings)}-en"
+            prewarm_tts([section["content"] for section in section_data], voice_model)
+
         return {
             "status": "success",
             "title": state.presentation_data.get("title", "Presentation"),
@@ -493,26 +850,26 @@ async def load_presentation_data(product_id: Optional[int] = None):
     return {"status": "error", "message": "No presentation found"}
 
 @app.post("/api/presentation/pause")
-async def pause_presentation():
+async def pause_presentation(state: PresentationState = Depends(get_state)):
     """Pause the presentation"""
-    state.is_paused = True
+    state.pause()
     return {"status": "paused", "current_section": state.current_section}
 
 @app.post("/api/presentation/resume")
-async def resume_presentation():
+async def resume_presentation(state: PresentationState = Depends(get_state)):
     """Resume the presentation"""
-    state.is_paused = False
+    state.resume()
     return {"status": "resumed", "current_section": state.current_section}
 
 @app.post("/api/presentation/interrupt")
-async def interrupt_presentation():
+async def interrupt_presentation(state: PresentationState = Depends(get_state)):
     """Interrupt for user query"""
     state.interrupt_flag = True
-    state.is_paused = True
+    state.pause()
     return {"status": "interrupted"}
 
 @app.post("/api/presentation/next")
-async def next_section():
+async def next_section(state: PresentationState = Depends(get_state)):
     """Skip to next section"""
     if state.presentation_data:
         max_sections = len(state.presentation_data.get("sections", []))
@@ -521,14 +878,14 @@ async def next_section():
     return {"current_section": state.current_section}
 
 @app.post("/api/presentation/previous")
-async def previous_section():
+async def previous_section(state: PresentationState = Depends(get_state)):
     """Go to previous section"""
     if state.current_section > 0:
         state.current_section -= 1
     return {"current_section": state.current_section}
 
 @app.post("/api/presentation/goto/{section_id}")
-async def goto_section(section_id: int):
+async def goto_section(section_id: int, state: PresentationState = Depends(get_state)):
     """Go to specific section"""
     if state.presentation_data:
         max_sections = len(state.presentation_data.get("sections", []))
@@ -539,59 +896,109 @@ async def goto_section(section_id: int):
 # ============================================================================
 # WebSocket for Streaming Presentation
 # ============================================================================
+async def send_message(websocket: WebSocket, payload: Dict):
+    """Send a JSON message (orjson): raw UTF-8 in a binary frame for clients that
+    connected with ?frames=binary, a text frame for older clients"""
+    data = orjson.dumps(payload)
+    if websocket.query_params.get("frames") == "binary":
+        await websocket.send_bytes(data)
+    else:
+        await websocket.send_text(data.decode())
+
+async def receive_message(websocket: WebSocket) -> Dict:
+    """Receive a JSON text frame"""
+    return orjson.loads(await websocket.receive_text())
+
+async def receive_actions(websocket: WebSocket, actions: asyncio.Queue):
+    """Forward client messages to the presentation loop ({"action": "disconnect"} when the socket closes)"""
+    try:
+        while True:
+            try:
+                data = await receive_message(websocket)
+            except (ValueError, KeyError):
+                continue  # not JSON, or a binary frame; ignore
+            if isinstance(data, dict):
+                await actions.put(data)
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        print(f"Presentation socket receive failed: {e}")
+    finally:
+        # However the receiver stops, the presentation loop must not wait forever
+        actions.put_nowait({"action": "disconnect"})
+
+async def next_action(actions: asyncio.Queue, event: asyncio.Event) -> Optional[Dict]:
+    """Wait for the next client message, or return None once event is set"""
+    get = asyncio.ensure_future(actions.get())
+    wait = asyncio.ensure_future(event.wait())
+    done, pending = await asyncio.wait((get, wait), return_when=asyncio.FIRST_COMPLETED)
+    for task in pending:
+        task.cancel()
+    data = get.result() if get in done else None
+    if data and data.get("action") == "disconnect":
+        raise WebSocketDisconnect()
+    return data
+
 @app.websocket("/ws/presentation")
 async def presentation_websocket(websocket: WebSocket):
     """WebSocket endpoint for streaming presentation"""
     await websocket.accept()
 
+    # Same session as the HTTP endpoints, so a presentation loaded (or
+    # interrupted) over HTTP is the one streamed here
+    _, state = get_session_state(websocket.cookies.get(SESSION_COOKIE))
+
+    # Client messages are read by a background task; the loop below only
+    # waits on that queue and the pause/resume events, so it never polls
+    actions = asyncio.Queue()
+    receiver = asyncio.create_task(receive_actions(websocket, actions))
+
     try:
         # Load presentation if not loaded
         if state.presentation_data is None:
-            state.presentation_data = load_presentation()
+            state.presentation_data = await load_presentation()
 
         if not state.presentation_data:
-            await websocket.send_json({"type": "error", "message": "No presentation loaded"})
+            await send_message(websocket, {"type": "error", "message": "No presentation loaded"})
             return
 
         sections = state.presentation_data.get("sections", [])
         state.is_playing = True
-        state.is_paused = False
+        state.resume()
         state.current_section = 0
 
-        await websocket.send_json({
+        await send_message(websocket, {
             "type": "start",
             "title": state.presentation_data.get("title", "Presentation"),
             "total_sections": len(sections)
         })
 
         while state.current_section < len(sections):
-            # Check for pause
+            # Wait out a pause (resumed by the client or /api/presentation/resume)
+            if state.is_paused:
+                await send_message(websocket, {"type": "status", "status": "paused"})
+
             while state.is_paused:
-                await websocket.send_json({"type": "status", "status": "paused"})
-                await asyncio.sleep(0.5)
-
-                # Check for incoming messages
-                try:
-                    data = await asyncio.wait_for(websocket.receive_json(), timeout=0.1)
-                    if data.get("action") == "resume":
-                        state.is_paused = False
-                    elif data.get("action") == "next":
-                        state.is_paused = False
-                        state.current_section += 1
-                        break
-                    elif data.get("action") == "stop":
-                        state.is_playing = False
-                        await websocket.send_json({"type": "stopped"})
-                        return
-                except asyncio.TimeoutError:
-                    pass
+                data = await next_action(actions, state.resume_event)
+                if data is None:
+                    break
+                if data.get("action") == "resume":
+                    state.resume()
+                elif data.get("action") == "next":
+                    state.resume()
+                    state.current_section += 1
+                    break
+                elif data.get("action") == "stop":
+                    state.is_playing = False
+                    await send_message(websocket, {"type": "stopped"})
+                    return
 
             if state.current_section >= len(sections):
                 break
 
             # Check interrupt flag
             if state.interrupt_flag:
-                await websocket.send_json({"type": "interrupted"})
+                await send_message(websocket, {"type": "interrupted"})
                 state.interrupt_flag = False
                 continue
 
@@ -601,7 +1008,7 @@ async def presentation_websocket(websocket: WebSocket):
             images = section.get("images", [])
 
             # Send full section data at once (for sync with TTS)
-            await websocket.send_json({
+            await send_message(websocket, {
                 "type": "section",
                 "section_index": state.current_section,
                 "title": section.get("title", ""),
@@ -611,42 +1018,34 @@ async def presentation_websocket(websocket: WebSocket):
                 "total_sections": len(sections)
             })
 
-            # Wait for client to signal ready for next (after TTS completes)
-            # Or timeout after reasonable time
-            try:
-                while True:
-                    if state.is_paused or state.interrupt_flag:
-                        break
-
-                    try:
-                        data = await asyncio.wait_for(websocket.receive_json(), timeout=0.5)
-                        if data.get("action") == "section_done":
-                            state.current_section += 1
-                            break
-                        elif data.get("action") == "next":
-                            state.current_section += 1
-                            break
-                        elif data.get("action") == "pause":
-                            state.is_paused = True
-                            break
-                        elif data.get("action") == "stop":
-                            state.is_playing = False
-                            await websocket.send_json({"type": "stopped"})
-                            return
-                    except asyncio.TimeoutError:
-                        pass
-            except Exception:
-                break
+            # Wait for client to signal ready for next (after TTS completes),
+            # or for a pause/interrupt from the HTTP endpoints
+            while not state.is_paused:
+                data = await next_action(actions, state.pause_event)
+                if data is None:
+                    break
+                if data.get("action") in ("section_done", "next"):
+                    state.current_section += 1
+                    break
+                elif data.get("action") == "pause":
+                    state.pause()
+                    break
+                elif data.get("action") == "stop":
+                    state.is_playing = False
+                    await send_message(websocket, {"type": "stopped"})
+                    return
 
         # Presentation complete
-        await websocket.send_json({"type": "complete"})
+        await send_message(websocket, {"type": "complete"})
         state.reset()
 
     except WebSocketDisconnect:
         state.reset()
     except Exception as e:
-        await websocket.send_json({"type": "error", "message": str(e)})
+        await send_message(websocket, {"type": "error", "message": str(e)})
         state.reset()
+    finally:
+        receiver.cancel()
 
 # ============================================================================
 # Admin API Routes
@@ -675,12 +1074,33 @@ processing_state = {
     "message": ""
 }
 
-def verify_token(authorization: str = None):
-    """Verify admin token from Authorization header"""
+# Admin ids by bearer token, with the time they were verified; the admin API
+# resolves the token on every call, and a hit skips re-verifying it.
+# Entries expire after ADMIN_TOKEN_TTL seconds and are dropped on logout
+ADMIN_TOKEN_TTL = 300
+ADMIN_TOKEN_CACHE_SIZE = 10_000
+admin_tokens: "OrderedDict[str, Tuple[float, int]]" = OrderedDict()
+
+async def resolve_admin_token(token: str) -> Optional[int]:
+    """Admin id for a token (None if invalid); runs entirely on the event loop, so the cache needs no lock"""
+    now = time.monotonic()
+    entry = admin_tokens.get(token)
+    if entry is not None and now - entry[0] < ADMIN_TOKEN_TTL:
+        return entry[1]
+    admin_id = db.verify_admin_token(token)  # a string parse, no I/O
+    if not admin_id:
+        return None
+    admin_tokens[token] = (now, admin_id)
+    admin_tokens.move_to_end(token)
+    if len(admin_tokens) > ADMIN_TOKEN_CACHE_SIZE:
+        admin_tokens.popitem(last=False)
+    return admin_id
+
+async def require_admin(authorization: Optional[str] = Header(None)) -> int:
+    """Resolve the admin id from the Authorization header, or reject with 401"""
     if not authorization or not authorization.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Not authenticated")
-    token = authorization.replace("Bearer ", "")
-    admin_id = db.verify_admin_token(token)
+    admin_id = await resolve_admin_token(authorization.removeprefix("Bearer "))
     if not admin_id:
         raise HTTPException(status_code=401, detail="Invalid token")
     return admin_id
@@ -693,8 +1113,16 @@ async def admin_login(credentials: AdminLogin):
     if not admin:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     token = db.create_admin_token(admin["id"])
+    admin_tokens[token] = (time.monotonic(), admin["id"])
     return {"token": token, "username": admin["username"]}
 
+@app.post("/admin/api/logout")
+async def admin_logout(authorization: Optional[str] = Header(None)):
+    """Forget a logged-out admin token"""
+    if authorization:
+        admin_tokens.pop(authorization.removeprefix("Bearer "), None)
+    return {"status": "success"}
+
 # Admin Pages
 @app.get("/admin")
 @app.get("/admin/dashboard")
@@ -709,16 +1137,14 @@ async def serve_admin_login():
 
 # Settings API
 @app.get("/admin/api/settings")
-async def get_admin_settings(authorization: str = None):
+async def get_admin_settings(admin_id: int = Depends(require_admin)):
     """Get all settings"""
-    from fastapi import Header
     return db.get_all_settings()
 
 @app.put("/admin/api/settings")
-async def update_admin_settings(settings: SettingsUpdate, authorization: str = None):
+async def update_admin_settings(settings: SettingsUpdate, admin_id: int = Depends(require_admin)):
     """Update settings"""
-    from fastapi import Header
-    settings_dict = {k: v for k, v in settings.dict().items() if v is not None}
+    settings_dict = settings.model_dump(exclude_none=True)
     db.update_settings(settings_dict)
     return {"status": "success"}
 
@@ -728,7 +1154,7 @@ async def get_public_settings():
     """Get settings for frontend"""
     settings = db.get_all_settings()
     return {
-        "ttsVoice": settings.get("tts_voice", "asteria"),
+        "ttsVoice": configured_voice(settings),
         "ttsEnabled": settings.get("tts_enabled", "true") == "true",
         "presentationSpeed": float(settings.get("presentation_speed", "1")),
         "sectionDelay": float(settings.get("section_delay", "0.5"))
@@ -743,12 +1169,12 @@ async def get_public_products():
 
 # Users API
 @app.get("/admin/api/users")
-async def get_all_users(authorization: str = None):
+async def get_all_users(admin_id: int = Depends(require_admin)):
     """Get all registered users"""
     return db.get_all_users()
 
 @app.get("/admin/api/users/{user_id}")
-async def get_user(user_id: int, authorization: str = None):
+async def get_user(user_id: int, admin_id: int = Depends(require_admin)):
     """Get user by ID"""
     user = db.get_user_by_id(user_id)
     if not user:
@@ -756,12 +1182,12 @@ async def get_user(user_id: int, authorization: str = None):
     return user
 
 @app.get("/admin/api/users/{user_id}/chat")
-async def get_user_chat(user_id: int, authorization: str = None):
+async def get_user_chat(user_id: int, admin_id: int = Depends(require_admin)):
     """Get user's chat history"""
     return db.get_user_chat_history(user_id)
 
 @app.delete("/admin/api/users/{user_id}")
-async def delete_user(user_id: int, authorization: str = None):
+async def delete_user(user_id: int, admin_id: int = Depends(require_admin)):
     """Delete a user"""
     if db.delete_user(user_id):
         return {"status": "success"}
@@ -778,80 +1204,104 @@ async def register_user(user: UserRegister):
 
 # Analytics API
 @app.get("/admin/api/analytics/summary")
-async def get_analytics_summary(authorization: str = None):
+async def get_analytics_summary(admin_id: int = Depends(require_admin)):
     """Get analytics summary"""
     return db.get_analytics_summary()
 
 @app.get("/admin/api/analytics/recent")
-async def get_recent_activity(authorization: str = None):
+async def get_recent_activity(admin_id: int = Depends(require_admin)):
     """Get recent activity"""
     return db.get_recent_activity()
 
 # JSON Content API
 @app.get("/admin/api/json/{json_type}")
-async def get_json_content(json_type: str, authorization: str = None):
+async def get_json_content(json_type: str, admin_id: int = Depends(require_admin)):
     """Get JSON file content"""
     if json_type == "presentation":
-        path = "output/presentation.json"
+        path = DEFAULT_PRESENTATION_PATH
     elif json_type == "analysis":
-        path = "output/analysis_results.json"
+        path = DEFAULT_ANALYSIS_PATH
     else:
         raise HTTPException(status_code=400, detail="Invalid JSON type")
 
-    if not os.path.exists(path):
-        raise HTTPException(status_code=404, detail="File not found")
-
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    return await json_file_response(path, "File not found")
 
 @app.put("/admin/api/json/{json_type}")
-async def update_json_content(json_type: str, content: dict, authorization: str = None):
+async def update_json_content(json_type: str, content: dict, admin_id: int = Depends(require_admin)):
     """Update JSON file content"""
     if json_type == "presentation":
-        path = "output/presentation.json"
+        path = DEFAULT_PRESENTATION_PATH
     elif json_type == "analysis":
-        path = "output/analysis_results.json"
+        path = DEFAULT_ANALYSIS_PATH
     else:
         raise HTTPException(status_code=400, detail="Invalid JSON type")
 
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(content, f, indent=2, ensure_ascii=False)
+    schedule_json_write(path, content)
 
     return {"status": "success"}
 
 # Images API
-@app.get("/admin/api/images")
-async def get_all_images(show_deleted: bool = False, authorization: str = None):
-    """Get all images with their status"""
-    images_dir = Path("output/images")
-    if not images_dir.exists():
+# Image files served and listed, by suffix. Registered with mimetypes so served
+# images get the right type whatever the platform's MIME tables say (older
+# Pythons have no .webp entry, and Windows reads them from the registry)
+IMAGE_MEDIA_TYPES = {
+    ".png": "image/png",
+    ".webp": "image/webp",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+}
+for _suffix, _media_type in IMAGE_MEDIA_TYPES.items():
+    mimetypes.add_type(_media_type, _suffix)
+
+# Image file listings per directory, sorted by name, reused while the directory's
+# mtime is unchanged (adding, removing or renaming a file updates it)
+image_listings: Dict[str, Tuple[int, List[str]]] = {}
+
+def list_images(images_dir: Path) -> List[str]:
+    """Sorted image file names in a directory ([] if it doesn't exist), rescanned only when it changes"""
+    try:
+        mtime = images_dir.stat().st_mtime_ns
+    except FileNotFoundError:
         return []
 
+    cached = image_listings.get(str(images_dir))
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    # One directory read; file types come from the entries, without extra stats
+    with os.scandir(images_dir) as entries:
+        names = [entry.name for entry in entries
+                 if os.path.splitext(entry.name)[1].lower() in IMAGE_MEDIA_TYPES and entry.is_file()]
+    names.sort()
+    image_listings[str(images_dir)] = (mtime, names)
+    return names
+
+@app.get("/admin/api/images")
+async def get_all_images(show_deleted: bool = False, admin_id: int = Depends(require_admin)):
+    """Get all images with their status"""
     image_statuses = db.get_all_image_statuses()
     images = []
 
-    # Look for both PNG and WebP images
-    for pattern in ["*.png", "*.webp", "*.jpg", "*.jpeg"]:
-        for img_path in images_dir.glob(pattern):
-            path_str = f"output/images/{img_path.name}"
-            is_deleted = image_statuses.get(path_str, False)
+    for name in list_images(Path("output/images")):
+        path_str = f"output/images/{name}"
+        is_deleted = image_statuses.get(path_str, False)
 
-            if show_deleted or not is_deleted:
-                images.append({
-                    "path": path_str,
-                    "is_deleted": is_deleted
-                })
+        if show_deleted or not is_deleted:
+            images.append({
+                "path": path_str,
+                "is_deleted": is_deleted
+            })
 
-    return sorted(images, key=lambda x: x["path"])
+    return images
 
 @app.delete("/admin/api/images/{path:path}")
-async def delete_image_admin(path: str, authorization: str = None):
+async def delete_image_admin(path: str, admin_id: int = Depends(require_admin)):
     """Soft delete an image"""
     db.delete_image(path)
     return {"status": "success"}
 
 @app.post("/admin/api/images/{path:path}/restore")
-async def restore_image_admin(path: str, authorization: str = None):
+async def restore_image_admin(path: str, admin_id: int = Depends(require_admin)):
     """Restore a soft deleted image"""
     db.restore_image(path)
     return {"status": "success"}
@@ -865,16 +1315,137 @@ class ProductCreate(BaseModel):
     slug: str
     description: Optional[str] = ""
 
-# Product processing state (per product)
-product_processing_states = {}
+@dataclass(slots=True)
+class ProcessingState:
+    """PDF processing progress of one product (serialized as-is by orjson/FastAPI)"""
+    stage: str = "idle"
+    current_page: int = 0
+    total_pages: int = 0
+    progress: int = 0
+    message: str = ""
+
+# Product processing state (per product). Only touched from the event loop
+# (worker updates arrive through drain_processing_updates), so no locking
+product_processing_states: Dict[int, ProcessingState] = {}
+
+# PDF processing runs main.run_pipeline in pooled worker processes (started once
+# and reused) instead of spawning `python main.py` per job. Workers are spawned,
+# not forked: a fork would copy this process's writer/listener threads' locks in
+# whatever state they are in. They import only processing_worker and report
+# (product_id, stage, progress, message) over processing_updates
+PROCESSING_CONTEXT = multiprocessing.get_context("spawn")
+processing_updates = PROCESSING_CONTEXT.Queue()
+processing_jobs: Dict[int, asyncio.Task] = {}
+# At most PROCESSING_CONCURRENCY jobs run at once (each can use a lot of memory);
+# further uploads are accepted and wait their turn in the "queued" stage
+PROCESSING_CONCURRENCY = max(1, (os.cpu_count() or 1) // 2)
+processing_slots = asyncio.Semaphore(PROCESSING_CONCURRENCY)
+processing_running: Set[int] = set()
+# Products whose uploaded PDF is being written to disk (before its job starts)
+processing_uploads: Set[int] = set()
+# Set (and dropped) on every state change of a product, waking its status watchers
+processing_events: Dict[int, asyncio.Event] = {}
+
+def new_processing_pool() -> ProcessPoolExecutor:
+    return ProcessPoolExecutor(max_workers=PROCESSING_CONCURRENCY, mp_context=PROCESSING_CONTEXT,
+                               initializer=init_processing_worker, initargs=(processing_updates,))
+
+processing_pool = new_processing_pool()
+
+def notify_processing(product_id: int):
+    """Wake everything waiting for a change in a product's processing state"""
+    event = processing_events.pop(product_id, None)
+    if event:
+        event.set()
+
+def processing_status(product_id: int) -> ProcessingState:
+    """Current processing state of a product"""
+    return product_processing_states.get(product_id) or ProcessingState()
+
+async def drain_processing_updates():
+    """Apply worker progress updates to product_processing_states until shutdown"""
+    while (update := await asyncio.to_thread(processing_updates.get)) is not None:
+        product_id, stage, progress, message = update
+        state = product_processing_states.get(product_id)
+        # Late updates never overwrite a finished job's result
+        if state and state.stage not in ("complete", "error"):
+            state.stage = stage
+            state.progress = progress
+            state.message = message
+            notify_processing(product_id)
+
+async def run_in_processing_pool(fn, *args):
+    """Run fn(*args) in the worker pool"""
+    global processing_pool
+    pool = processing_pool
+    try:
+        return await asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+    except BrokenProcessPool:
+        # A worker died (e.g. killed for memory); later jobs need a fresh pool. Every job
+        # on the broken pool fails this way, but only the first replaces it
+        if processing_pool is pool:
+            processing_pool = new_processing_pool()
+            pool.shutdown(wait=False, cancel_futures=True)
+        raise
+
+async def run_processing_job(product_id: int, pdf_path: Path, product_folder: Path, message: str):
+    """Process a product's PDF in the worker pool once a slot is free, and record the outcome"""
+    state = product_processing_states[product_id]
+    try:
+        async with processing_slots:
+            processing_running.add(product_id)
+            state.stage = "analyzing"
+            state.message = message
+            notify_processing(product_id)
+            logger.info("Processing PDF for product %s: %s -> %s", product_id, pdf_path, product_folder)
+            await run_in_processing_pool(process_product_job, product_id, str(pdf_path), str(product_folder))
+    except Exception as e:
+        logger.exception("Processing failed for product %s", product_id)
+        state.stage = "error"
+        state.message = str(e)[:500] or "Processing failed"
+    else:
+        logger.info("Processing complete for product %s", product_id)
+        if Path(product_folder) == DEFAULT_OUTPUT_DIR:
+            await reload_default_state()
+        state.stage = "complete"
+        state.progress = 100
+        state.message = "Processing complete!"
+    finally:
+        processing_running.discard(product_id)
+        if processing_jobs.get(product_id) is asyncio.current_task():
+            del processing_jobs[product_id]
+        notify_processing(product_id)
+
+def ensure_not_processing(product_id: int):
+    """Reject (409) starting a job, or replacing its PDF, while the product's last job is queued or
+    running or a new PDF for it is still being saved"""
+    if product_id in processing_jobs or product_id in processing_uploads:
+        raise HTTPException(status_code=409, detail="This product's PDF is already being processed")
+
+def start_processing(product_id: int, pdf_path: Path, product_folder: Path, message: str):
+    """Reset a product's processing state and queue its PDF for background processing"""
+    ensure_not_processing(product_id)
+    product_processing_states[product_id] = ProcessingState(stage="queued", message="Waiting for a free processing slot...")
+    processing_jobs[product_id] = asyncio.create_task(
+        run_processing_job(product_id, pdf_path, product_folder, message))
+    notify_processing(product_id)
+
+# Uploaded PDFs are copied to disk in blocks of this size (never held in memory whole)
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+def save_upload(upload: UploadFile, path: Path):
+    """Copy an upload's spooled file to path, one UPLOAD_CHUNK_BYTES block at a time"""
+    with open(path, "wb") as f:
+        shutil.copyfileobj(upload.file, f, UPLOAD_CHUNK_BYTES)
+    stat_cache.pop(str(path), None)
 
 @app.get("/admin/api/products")
-async def get_all_products(authorization: str = None):
+async def get_all_products(admin_id: int = Depends(require_admin)):
     """Get all products"""
     return db.get_all_products(include_inactive=True)
 
 @app.post("/admin/api/products")
-async def create_product(product: ProductCreate, authorization: str = None):
+async def create_product(product: ProductCreate, admin_id: int = Depends(require_admin)):
     """Create a new product"""
     product_id = db.create_product(product.name, product.slug, product.description)
     if product_id:
@@ -884,7 +1455,7 @@ async def create_product(product: ProductCreate, authorization: str = None):
     raise HTTPException(status_code=400, detail="Failed to create product. Slug may already exist.")
 
 @app.get("/admin/api/products/{product_id}")
-async def get_product(product_id: int, authorization: str = None):
+async def get_product(product_id: int, admin_id: int = Depends(require_admin)):
     """Get a single product"""
     product = db.get_product_by_id(product_id)
     if not product:
@@ -892,17 +1463,15 @@ async def get_product(product_id: int, authorization: str = None):
     return product
 
 @app.delete("/admin/api/products/{product_id}")
-async def delete_product(product_id: int, authorization: str = None):
+async def delete_product(product_id: int, admin_id: int = Depends(require_admin)):
     """Delete a product"""
     if db.delete_product(product_id):
         return {"status": "success"}
     raise HTTPException(status_code=404, detail="Product not found")
 
 @app.post("/admin/api/products/{product_id}/upload")
-async def upload_product_pdf(product_id: int, file: UploadFile = File(...), authorization: str = None):
+async def upload_product_pdf(product_id: int, file: UploadFile = File(...), admin_id: int = Depends(require_admin)):
     """Upload and process a PDF for a specific product"""
-    global product_processing_states
-
     product = db.get_product_by_id(product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
@@ -913,90 +1482,68 @@ async def upload_product_pdf(product_id: int, file: UploadFile = File(...), auth
     # Get product folder
     product_folder = db.ensure_product_folder(product_id)
 
-    # Save uploaded file
+    # Save uploaded file (not over the PDF a running job is reading)
+    ensure_not_processing(product_id)
     pdf_path = product_folder / "input.pdf"
-    with open(pdf_path, "wb") as f:
-        content = await file.read()
-        f.write(content)
+    processing_uploads.add(product_id)
+    try:
+        await asyncio.to_thread(save_upload, file, pdf_path)
+    finally:
+        processing_uploads.discard(product_id)
 
-    # Initialize processing state for this product
-    product_processing_states[product_id] = {
-        "stage": "analyzing",
-        "current_page": 0,
-        "total_pages": 0,
-        "progress": 0,
-        "message": "Starting..."
-    }
+    start_processing(product_id, pdf_path, product_folder, "Starting...")
 
-    # Run processing in background with real-time logging
-    import subprocess
-    import threading
-    import sys
-
-    def process_pdf():
-        try:
-            print(f"\n{'='*60}")
-            print(f"[PROCESSING] Starting PDF processing for product {product_id}")
-            print(f"[PROCESSING] PDF: {pdf_path}")
-            print(f"[PROCESSING] Output: {product_folder}")
-            print(f"{'='*60}\n")
-            sys.stdout.flush()
-
-            # Use Popen to stream output in real-time
-            process = subprocess.Popen(
-                ["python", "-u", "main.py", str(pdf_path), str(product_folder)],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                text=True,
-                bufsize=1
-            )
-
-            # Stream output line by line
-            output_lines = []
-            for line in process.stdout:
-                print(f"[Product {product_id}] {line}", end='')
-                sys.stdout.flush()
-                output_lines.append(line)
-
-            process.wait()
-
-            print(f"\n{'='*60}")
-            print(f"[PROCESSING] Process finished with return code: {process.returncode}")
-            print(f"{'='*60}\n")
-            sys.stdout.flush()
-
-            if process.returncode == 0:
-                product_processing_states[product_id]["stage"] = "complete"
-                product_processing_states[product_id]["progress"] = 100
-                product_processing_states[product_id]["message"] = "Processing complete!"
-            else:
-                product_processing_states[product_id]["stage"] = "error"
-                error_output = ''.join(output_lines[-10:])  # Last 10 lines
-                product_processing_states[product_id]["message"] = error_output[:500] if error_output else "Processing failed"
+    return {"status": "processing started", "product_id": product_id}
 
-        except Exception as e:
-            print(f"[PROCESSING ERROR] {e}")
-            sys.stdout.flush()
-            product_processing_states[product_id]["stage"] = "error"
-            product_processing_states[product_id]["message"] = str(e)
+@app.get("/admin/api/queue")
+async def get_processing_queue(admin_id: int = Depends(require_admin)):
+    """PDF processing load: jobs running, jobs waiting for a slot, and the slot count"""
+    return {
+        "running": len(processing_running),
+        "queued": len(processing_jobs) - len(processing_running),
+        "capacity": PROCESSING_CONCURRENCY,
+    }
 
-    thread = threading.Thread(target=process_pdf)
-    thread.start()
+@app.get("/admin/api/products/{product_id}/status")
+async def get_product_processing_status(product_id: int, admin_id: int = Depends(require_admin)):
+    """Get PDF processing status for a product (single-shot; see the /status/ws push)"""
+    return processing_status(product_id)
 
-    return {"status": "processing started", "product_id": product_id}
+@app.websocket("/admin/api/products/{product_id}/status/ws")
+async def product_processing_status_websocket(websocket: WebSocket, product_id: int,
+                                              token: Optional[str] = None):
+    """Push a product's processing status on connect and on every change, until it completes or fails
 
-@app.get("/admin/api/products/{product_id}/status")
-async def get_product_processing_status(product_id: int, authorization: str = None):
-    """Get PDF processing status for a product"""
-    if product_id in product_processing_states:
-        return product_processing_states[product_id]
-    return {"stage": "idle", "progress": 0, "message": ""}
+    Browsers can't set headers on a WebSocket, so the admin token comes as ?token=
+    """
+    await websocket.accept()
+    if not token or not await resolve_admin_token(token):
+        await websocket.close(code=1008)
+        return
+    # The client never sends, so this only completes when it goes away
+    disconnected = asyncio.ensure_future(websocket.receive())
+    try:
+        while True:
+            changed = processing_events.setdefault(product_id, asyncio.Event())
+            status = processing_status(product_id)
+            await send_message(websocket, asdict(status))
+            if status.stage in ("complete", "error"):
+                await websocket.close()
+                break
+
+            waiter = asyncio.ensure_future(changed.wait())
+            await asyncio.wait((disconnected, waiter), return_when=asyncio.FIRST_COMPLETED)
+            if disconnected.done():
+                waiter.cancel()
+                break
+    except WebSocketDisconnect:
+        pass
+    finally:
+        disconnected.cancel()
 
 @app.post("/admin/api/products/{product_id}/process")
-async def process_product_pdf(product_id: int, authorization: str = None):
+async def process_product_pdf(product_id: int, admin_id: int = Depends(require_admin)):
     """Manually trigger PDF processing for a product that already has a PDF uploaded"""
-    global product_processing_states
-
     product = db.get_product_by_id(product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
@@ -1004,77 +1551,16 @@ async def process_product_pdf(product_id: int, authorization: str = None):
     product_folder = db.get_product_folder(product_id)
     pdf_path = product_folder / "input.pdf"
 
-    if not pdf_path.exists():
+    if cached_stat(pdf_path) is None:
         raise HTTPException(status_code=404, detail="No PDF found for this product. Upload a PDF first.")
 
-    # Initialize processing state
-    product_processing_states[product_id] = {
-        "stage": "analyzing",
-        "current_page": 0,
-        "total_pages": 0,
-        "progress": 0,
-        "message": "Starting processing..."
-    }
-
-    import subprocess
-    import threading
-    import sys
-
-    def process_pdf():
-        try:
-            print(f"\n{'='*60}")
-            print(f"[MANUAL PROCESSING] Starting PDF processing for product {product_id}")
-            print(f"[MANUAL PROCESSING] PDF: {pdf_path}")
-            print(f"[MANUAL PROCESSING] Output: {product_folder}")
-            print(f"{'='*60}\n")
-            sys.stdout.flush()
-
-            # Use Popen to stream output in real-time
-            process = subprocess.Popen(
-                ["python", "-u", "main.py", str(pdf_path), str(product_folder)],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                text=True,
-                bufsize=1
-            )
-
-            # Stream output line by line
-            output_lines = []
-            for line in process.stdout:
-                print(f"[Product {product_id}] {line}", end='')
-                sys.stdout.flush()
-                output_lines.append(line)
-
-            process.wait()
-
-            print(f"\n{'='*60}")
-            print(f"[MANUAL PROCESSING] Process finished with return code: {process.returncode}")
-            print(f"{'='*60}\n")
-            sys.stdout.flush()
-
-            if process.returncode == 0:
-                product_processing_states[product_id]["stage"] = "complete"
-                product_processing_states[product_id]["progress"] = 100
-                product_processing_states[product_id]["message"] = "Processing complete!"
-            else:
-                product_processing_states[product_id]["stage"] = "error"
-                error_output = ''.join(output_lines[-10:])
-                product_processing_states[product_id]["message"] = error_output[:500] if error_output else "Processing failed"
-
-        except Exception as e:
-            print(f"[MANUAL PROCESSING ERROR] {e}")
-            sys.stdout.flush()
-            product_processing_states[product_id]["stage"] = "error"
-            product_processing_states[product_id]["message"] = str(e)
-
-    thread = threading.Thread(target=process_pdf)
-    thread.start()
+    start_processing(product_id, pdf_path, product_folder, "Starting processing...")
 
     return {"status": "processing started", "product_id": product_id}
 
 # Product-specific JSON API
 @app.get("/admin/api/products/{product_id}/json/{json_type}")
-async def get_product_json(product_id: int, json_type: str, authorization: str = None):
+async def get_product_json(product_id: int, json_type: str, admin_id: int = Depends(require_admin)):
     """Get JSON file content for a specific product"""
     product = db.get_product_by_id(product_id)
     if not product:
@@ -1089,14 +1575,10 @@ async def get_product_json(product_id: int, json_type: str, authorization: str =
     else:
         raise HTTPException(status_code=400, detail="Invalid JSON type")
 
-    if not path.exists():
-        raise HTTPException(status_code=404, detail="File not found. Upload and process a PDF first.")
-
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    return await json_file_response(path, "File not found. Upload and process a PDF first.")
 
 @app.put("/admin/api/products/{product_id}/json/{json_type}")
-async def update_product_json(product_id: int, json_type: str, content: dict, authorization: str = None):
+async def update_product_json(product_id: int, json_type: str, content: dict, admin_id: int = Depends(require_admin)):
     """Update JSON file content for a specific product"""
     product = db.get_product_by_id(product_id)
     if not product:
@@ -1111,174 +1593,202 @@ async def update_product_json(product_id: int, json_type: str, content: dict, au
     else:
         raise HTTPException(status_code=400, detail="Invalid JSON type")
 
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(content, f, indent=2, ensure_ascii=False)
+    schedule_json_write(path, content)
 
     return {"status": "success"}
 
 # Product-specific Images API
 @app.get("/admin/api/products/{product_id}/images")
-async def get_product_images(product_id: int, show_deleted: bool = False, authorization: str = None):
+async def get_product_images(product_id: int, show_deleted: bool = False, admin_id: int = Depends(require_admin)):
     """Get all images for a specific product"""
     product = db.get_product_by_id(product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
 
     product_folder = db.get_product_folder(product_id)
-    images_dir = product_folder / "images"
-
-    if not images_dir.exists():
-        return []
-
     image_statuses = db.get_all_image_statuses()
     images = []
 
-    # Look for both PNG and WebP images
-    for pattern in ["*.png", "*.webp", "*.jpg", "*.jpeg"]:
-        for img_path in images_dir.glob(pattern):
-            path_str = str(img_path)
-            is_deleted = image_statuses.get(path_str, False)
+    images_dir = str(product_folder / "images")
+    for name in list_images(product_folder / "images"):
+        path_str = os.path.join(images_dir, name)
+        is_deleted = image_statuses.get(path_str, False)
 
-            if show_deleted or not is_deleted:
-                images.append({
-                    "path": path_str,
-                    "filename": img_path.name,
-                    "is_deleted": is_deleted
-                })
+        if show_deleted or not is_deleted:
+            images.append({
+                "path": path_str,
+                "filename": name,
+                "is_deleted": is_deleted
+            })
 
-    return sorted(images, key=lambda x: x["filename"])
+    return images
 
 # PDF Upload and Processing (Legacy - kept for backward compatibility)
+# The legacy upload's background job (kept referenced while it runs)
+legacy_processing_job: Optional[asyncio.Task] = None
+
+async def run_legacy_processing(pdf_path: Path):
+    """Process the legacy upload into the default output folder in the worker pool"""
+    try:
+        async with processing_slots:
+            processing_state["stage"] = "analyzing"
+            processing_state["message"] = "Starting..."
+            await run_in_processing_pool(process_pdf_job, str(pdf_path), str(DEFAULT_OUTPUT_DIR))
+        await reload_default_state()
+        processing_state["stage"] = "complete"
+        processing_state["message"] = "Processing complete!"
+    except Exception as e:
+        logger.exception("Processing failed for %s", pdf_path)
+        processing_state["stage"] = "error"
+        processing_state["message"] = str(e)[:500] or "Processing failed"
+
 @app.post("/admin/api/upload")
-async def upload_pdf(file: UploadFile = File(...), authorization: str = None):
+async def upload_pdf(file: UploadFile = File(...), admin_id: int = Depends(require_admin)):
     """Upload and process a PDF"""
-    global processing_state
+    global processing_state, legacy_processing_job
 
     if not file.filename.endswith('.pdf'):
         raise HTTPException(status_code=400, detail="File must be a PDF")
+    if processing_state["stage"] in ("uploading", "queued", "analyzing"):
+        raise HTTPException(status_code=409, detail="A PDF is already being processed")
 
-    # Save uploaded file
-    pdf_path = Path("input.pdf")
-    with open(pdf_path, "wb") as f:
-        content = await file.read()
-        f.write(content)
-
-    # Start processing in background
     processing_state = {
-        "stage": "analyzing",
+        "stage": "uploading",
         "current_page": 0,
         "total_pages": 0,
-        "message": "Starting..."
+        "message": "Saving PDF..."
     }
 
-    # Run processing (simplified - in production use background task)
-    import subprocess
+    # Save uploaded file
+    pdf_path = Path("input.pdf")
     try:
-        result = subprocess.run(
-            ["python", "main.py", str(pdf_path)],
-            capture_output=True,
-            text=True,
-            timeout=600  # 10 minute timeout
-        )
-        if result.returncode == 0:
-            processing_state["stage"] = "complete"
-        else:
-            processing_state["stage"] = "error"
-            processing_state["message"] = result.stderr[:500]
-    except Exception as e:
+        await asyncio.to_thread(save_upload, file, pdf_path)
+    except BaseException:
         processing_state["stage"] = "error"
-        processing_state["message"] = str(e)
+        processing_state["message"] = "Upload failed"
+        raise
+
+    # Process in the worker pool; clients follow /admin/api/processing-status
+    processing_state["stage"] = "queued"
+    processing_state["message"] = "Waiting for a free processing slot..."
+    legacy_processing_job = asyncio.create_task(run_legacy_processing(pdf_path))
 
     return {"status": "processing started"}
 
 @app.get("/admin/api/processing-status")
-async def get_processing_status(authorization: str = None):
+async def get_processing_status(admin_id: int = Depends(require_admin)):
     """Get PDF processing status"""
     return processing_state
 
 # ============================================================================
 # Serve Static Files and Images
 # ============================================================================
-@app.get("/images/{path:path}")
-async def serve_image(path: str):
-    """Serve images from output directory, checking deletion status"""
-    full_path = f"output/images/{path}"
-    if db.is_image_deleted(full_path):
-        raise HTTPException(status_code=404, detail="Image not found")
-
-    image_path = Path("output/images") / path
-    if image_path.exists():
-        # Determine media type
-        media_type = "image/webp" if path.endswith(".webp") else "image/png"
-        # Cache images for 1 hour (browser will use cached version)
-        return FileResponse(
-            image_path,
-            media_type=media_type,
-            headers={"Cache-Control": "public, max-age=3600"}
-        )
-    raise HTTPException(status_code=404, detail="Image not found")
-
-@app.get("/products/{product_id}/images/{filename}")
-async def serve_product_image(product_id: int, filename: str):
-    """Serve images for a specific product"""
-    product_folder = db.get_product_folder(product_id)
-    image_path = product_folder / "images" / filename
-
-    # Check deletion status
-    if db.is_image_deleted(str(image_path)):
-        raise HTTPException(status_code=404, detail="Image not found")
-
-    if image_path.exists():
-        # Determine media type
-        media_type = "image/webp" if filename.endswith(".webp") else "image/png"
-        # Cache images for 1 hour (browser will use cached version)
-        return FileResponse(
-            image_path,
-            media_type=media_type,
-            headers={"Cache-Control": "public, max-age=3600"}
-        )
-    raise HTTPException(status_code=404, detail="Image not found")
+class ImageFiles(StaticFiles):
+    """StaticFiles for image folders: hides soft-deleted images and lets browsers cache
+    them for an hour (then revalidate with ETag/Last-Modified for a bodyless 304)"""
+
+    def image_path(self, path: str, scope) -> str:
+        """Path of the requested image relative to the served directory"""
+        return path
+
+    async def get_response(self, path: str, scope) -> Response:
+        if path.startswith("..") or os.path.isabs(path):
+            raise HTTPException(status_code=404, detail="Image not found")
+        path = self.image_path(path, scope)
+        if db.is_image_deleted(f"{self.directory}/{path}"):
+            raise HTTPException(status_code=404, detail="Image not found")
+        return await super().get_response(path, scope)
+
+    def file_response(self, *args, **kwargs) -> Response:
+        response = super().file_response(*args, **kwargs)
+        response.headers["Cache-Control"] = "public, max-age=3600"
+        return response
+
+class ProductImageFiles(ImageFiles):
+    """Product images, each product's images/ folder under output/"""
+
+    def image_path(self, path: str, scope) -> str:
+        images_dir = db.get_product_folder(scope["path_params"]["product_id"]) / "images"
+        return os.path.join(os.path.relpath(images_dir, self.directory), path)
+
+os.makedirs("output/images", exist_ok=True)
+app.mount("/images", ImageFiles(directory="output/images"), name="images")
+app.mount("/products/{product_id:int}/images", ProductImageFiles(directory="output"),
+          name="product_images")
+
+# PDF stats by path, with the time they were taken (None: no such file). A
+# viewer page asks for the PDF's info and then the PDF itself, and the file only
+# changes on upload, which drops its entry; anything else is seen within
+# STAT_CACHE_TTL seconds
+STAT_CACHE_TTL = 2
+stat_cache: Dict[str, Tuple[float, Optional[os.stat_result]]] = {}
+
+def cached_stat(path) -> Optional[os.stat_result]:
+    """os.stat(path), reused for STAT_CACHE_TTL seconds; None if it doesn't exist"""
+    path = str(path)
+    now = time.monotonic()
+    entry = stat_cache.get(path)
+    if entry is not None and now - entry[0] < STAT_CACHE_TTL:
+        return entry[1]
+    try:
+        result = os.stat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        result = None
+    stat_cache[path] = (now, result)
+    return result
+
+# Product 1 (legacy layout) may keep its PDF in the working directory instead;
+# the directory is globbed at most once per STAT_CACHE_TTL rather than on every
+# request, so a PDF added, replaced or removed there is still picked up
+root_pdf_lookup: Tuple[float, Optional[Path]] = (float("-inf"), None)
+
+def find_root_pdf() -> Optional[Path]:
+    """The first PDF in the working directory, if any"""
+    global root_pdf_lookup
+    now = time.monotonic()
+    if now - root_pdf_lookup[0] >= STAT_CACHE_TTL:
+        root_pdf_lookup = (now, next(Path(".").glob("*.pdf"), None))
+    return root_pdf_lookup[1]
+
+def find_product_pdf(product_id: int) -> Tuple[Path, Optional[os.stat_result]]:
+    """A product's PDF path and stat (None if there is no PDF)"""
+    pdf_path = db.get_product_folder(product_id) / "input.pdf"
+    root_pdf = find_root_pdf() if product_id == 1 else None
+    candidates = [pdf_path, root_pdf] if root_pdf else [pdf_path]
+    for candidate in candidates:
+        candidate_stat = cached_stat(candidate)
+        if candidate_stat is not None:
+            return candidate, candidate_stat
+    return pdf_path, None
 
 @app.get("/products/{product_id}/pdf")
 async def serve_product_pdf(product_id: int):
     """Serve PDF for a specific product"""
-    product_folder = db.get_product_folder(product_id)
+    # Check for input.pdf first, then (product 1) a PDF in the root folder
+    pdf_path, pdf_stat = find_product_pdf(product_id)
 
-    # Check for input.pdf first, then any PDF
-    pdf_path = product_folder / "input.pdf"
-    if not pdf_path.exists():
-        # For product 1, check root folder
-        if product_id == 1:
-            root_pdfs = list(Path(".").glob("*.pdf"))
-            if root_pdfs:
-                pdf_path = root_pdfs[0]
-
-    if pdf_path.exists():
-        # Use Content-Disposition: inline to display in browser instead of download
+    if pdf_stat:
+        # Use Content-Disposition: inline to display in browser instead of download.
+        # The stat is reused for Content-Length/ETag instead of being taken again
         return FileResponse(
             pdf_path,
             media_type="application/pdf",
-            headers={"Content-Disposition": "inline"}
+            headers={"Content-Disposition": "inline"},
+            stat_result=pdf_stat
         )
     raise HTTPException(status_code=404, detail="PDF not found")
 
 @app.get("/admin/api/products/{product_id}/pdf-info")
-async def get_product_pdf_info(product_id: int, authorization: str = None):
+async def get_product_pdf_info(product_id: int, admin_id: int = Depends(require_admin)):
     """Get PDF info for a product"""
-    product_folder = db.get_product_folder(product_id)
-    pdf_path = product_folder / "input.pdf"
-
-    # For product 1, check root folder if input.pdf doesn't exist
-    if not pdf_path.exists() and product_id == 1:
-        root_pdfs = list(Path(".").glob("*.pdf"))
-        if root_pdfs:
-            pdf_path = root_pdfs[0]
+    pdf_path, pdf_stat = find_product_pdf(product_id)
 
-    if pdf_path.exists():
+    if pdf_stat:
         return {
             "exists": True,
             "filename": pdf_path.name,
-            "size": pdf_path.stat().st_size,
+            "size": pdf_stat.st_size,
+            "mtime": pdf_stat.st_mtime,
             "url": f"/products/{product_id}/pdf"
         }
     return {"exists": False}
@@ -1309,21 +1819,59 @@ async def serve_admin_js():
 # ============================================================================
 # Main
 # ============================================================================
+# uvloop and httptools ship with uvicorn[standard]; fall back to the pure-Python
+# loop/parser where they are unavailable (e.g. uvloop on Windows).
+# Deliberately one worker: presentation sessions, processing status and the
+# database read caches live in this process. CPU-heavy PDF processing already
+# runs outside the event loop, in processing_pool's PROCESSING_CONCURRENCY
+# worker processes (capped at half the cores to bound memory)
+UVICORN_OPTIONS = {
+    "loop": "uvloop" if importlib.util.find_spec("uvloop") else "asyncio",
+    "http": "httptools" if importlib.util.find_spec("httptools") else "h11",
+}
+
+def write_self_signed_cert(cert_file: str, key_file: str):
+    """Build a localhost certificate in-process with cryptography"""
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now)
+        .not_valid_after(now + datetime.timedelta(days=365))
+        .add_extension(x509.SubjectAlternativeName([x509.DNSName("localhost")]), critical=False)
+        .sign(key, hashes.SHA256())
+    )
+    with open(key_file, "wb") as f:
+        f.write(key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.TraditionalOpenSSL,
+            serialization.NoEncryption(),
+        ))
+    with open(cert_file, "wb") as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+
+
 def generate_self_signed_cert():
     """Generate self-signed certificate for HTTPS (required for microphone access)"""
-    import subprocess
-
     cert_file = "cert.pem"
     key_file = "key.pem"
 
     if not os.path.exists(cert_file) or not os.path.exists(key_file):
         print("Generating self-signed SSL certificate for HTTPS...")
-        subprocess.run([
-            "openssl", "req", "-x509", "-newkey", "rsa:4096",
-            "-keyout", key_file, "-out", cert_file,
-            "-days", "365", "-nodes",
-            "-subj", "/CN=localhost"
-        ], check=True)
+        if x509 is not None:
+            write_self_signed_cert(cert_file, key_file)
+        else:
+            subprocess.run([
+                "openssl", "req", "-x509", "-newkey", "rsa:2048",
+                "-keyout", key_file, "-out", cert_file,
+                "-days", "365", "-nodes",
+                "-subj", "/CN=localhost"
+            ], check=True)
         print("SSL certificate generated.")
 
     return cert_file, key_file
@@ -1335,6 +1883,11 @@ if __name__ == "__main__":
     parser.add_argument("--no-ssl", action="store_true", help="Run without SSL (microphone won't work)")
     args = parser.parse_args()
 
+    # Spawned pool workers re-run the main script before taking jobs, which here
+    # would redo all of this module's setup; they only need processing_worker,
+    # so tell multiprocessing the main module has nothing to re-run
+    sys.modules["__main__"].__spec__ = importlib.util.spec_from_loader("__main__", None)
+
     # Create frontend directory if not exists
     os.makedirs("frontend", exist_ok=True)
 
@@ -1343,12 +1896,13 @@ if __name__ == "__main__":
     if args.no_ssl:
         print("Open http://localhost:8000 in your browser")
         print("WARNING: Microphone access requires HTTPS. Use without --no-ssl for voice features.")
-        uvicorn.run(app, host="0.0.0.0", port=8000)
+        uvicorn.run(app, host="0.0.0.0", port=8000, **UVICORN_OPTIONS)
     else:
         cert_file, key_file = generate_self_signed_cert()
         print("Open http://localhost:8000 in your browser")
         print("NOTE: You'll need to accept the self-signed certificate warning in your browser.")
-        uvicorn.run(app, host="0.0.0.0", port=8000, ssl_certfile=cert_file, ssl_keyfile=key_file)
+        uvicorn.run(app, host="0.0.0.0", port=8000, ssl_certfile=cert_file, ssl_keyfile=key_file,
+                    **UVICORN_OPTIONS)
         # print("Open http://localhost:8000 in your browser")
         # print("WARNING: Microphone access requires HTTPS. Use without --no-ssl for voice features.")
         # uvicorn.run(app, host="0.0.0.0", port=8000)